@@ -1,7 +1,13 @@
 import asyncio
+import copy
 import json
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import AsyncIterator
+from weakref import WeakSet
 
 import aiohttp
+import orjson
 from loguru import logger
 
 from app.common.config import config
@@ -10,9 +16,12 @@ from app.common.exceptions.http_exception_wrapper import http_exception
 
 class AsyncApiHandler:
     """
-    Class for handling async requests to apies
+    Class for handling async requests to apies.
+    Each handler owns one long-lived session with pooled keep-alive connections.
     """
 
+    handlers: list["AsyncApiHandler"] = []
+
     def __init__(
             self,
             base_url: str,
@@ -29,6 +38,172 @@ class AsyncApiHandler:
         """
 
         self.base_url = base_url
+        self.connector_limit = int(config.get("API_CONNECTOR_LIMIT", "100"))
+        self.connector_limit_per_host = int(config.get("API_CONNECTOR_LIMIT_PER_HOST", "30"))
+        self.dns_cache_ttl = int(config.get("API_DNS_CACHE_TTL", "300"))
+        self.keepalive_timeout = float(config.get("API_KEEPALIVE_TIMEOUT", "30"))
+        self._session: aiohttp.ClientSession | None = None
+        self._session_loop: asyncio.AbstractEventLoop | None = None
+        self.sessions_opened = 0
+        self.requests_total = 0
+        self.requests_in_flight = 0
+        self.single_flight_enabled = config.get("API_SINGLE_FLIGHT", "true").lower() == "true"
+        self._get_in_flight: dict[tuple, asyncio.Task] = {}
+        self._get_shared: WeakSet[asyncio.Task] = WeakSet()
+        self.coalesced_total = 0
+        AsyncApiHandler.handlers.append(self)
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        """
+        Function returns shared session, opens new one if there is no session for current event loop
+
+        Returns:
+            aiohttp.ClientSession: Shared session with pooled connector
+        """
+
+        loop = asyncio.get_running_loop()
+        if self._session is not None and not self._session.closed and self._session_loop is not loop:
+            await self.drop_session()
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.connector_limit,
+                limit_per_host=self.connector_limit_per_host,
+                ttl_dns_cache=self.dns_cache_ttl,
+                keepalive_timeout=self.keepalive_timeout,
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+            self._session_loop = loop
+            self.sessions_opened += 1
+        return self._session
+
+    async def drop_session(self) -> None:
+        """
+        Function drops session opened in another event loop. Session can't be awaited from current loop, so it is
+        closed in its own loop if that loop is still running, otherwise it is detached and its connector is closed
+
+        Returns:
+            None
+        """
+
+        session, session_loop = self._session, self._session_loop
+        self._session = None
+        self._session_loop = None
+        if session_loop is not None and session_loop.is_running():
+            asyncio.run_coroutine_threadsafe(session.close(), session_loop)
+            return
+        connector = session.connector
+        session.detach()
+        if connector is not None:
+            # transports of closed loop are only forgotten, so closing doesn't wait for them
+            await connector.close()
+
+    async def start(self) -> None:
+        """
+        Function opens shared session
+        """
+
+        await self.get_session()
+
+    async def close(self) -> None:
+        """
+        Function closes shared session and all pooled connections
+        """
+
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._session_loop = None
+
+    def get_pool_stats(self) -> dict:
+        """
+        Function returns connection pool utilisation metrics. Utilisation is counted by requests in flight
+        against connector limit
+
+        Returns:
+            dict: Pool limits and requests counters
+        """
+
+        return {
+            "base_url": self.base_url,
+            "session_open": self._session is not None and not self._session.closed,
+            "limit": self.connector_limit,
+            "limit_per_host": self.connector_limit_per_host,
+            "utilisation": (
+                round(self.requests_in_flight / self.connector_limit, 3) if self.connector_limit else None
+            ),
+            "requests_in_flight": self.requests_in_flight,
+            "requests_total": self.requests_total,
+            "sessions_opened": self.sessions_opened,
+            "single_flight_enabled": self.single_flight_enabled,
+            "single_flight_in_flight": len(self._get_in_flight),
+            "coalesced_total": self.coalesced_total,
+        }
+
+    @classmethod
+    async def start_all(cls) -> None:
+        """
+        Function opens shared sessions for all handlers
+        """
+
+        await asyncio.gather(*[handler.start() for handler in cls.handlers])
+
+    @classmethod
+    async def close_all(cls) -> None:
+        """
+        Function closes shared sessions for all handlers
+        """
+
+        await asyncio.gather(*[handler.close() for handler in cls.handlers])
+
+    @classmethod
+    def get_pools_stats(cls) -> list[dict]:
+        """
+        Function returns pool utilisation metrics for all handlers
+        """
+
+        return [handler.get_pool_stats() for handler in cls.handlers]
+
+    @asynccontextmanager
+    async def _request(
+            self,
+            method: str,
+            **kwargs,
+    ) -> AsyncIterator[aiohttp.ClientResponse]:
+        """
+        Function extracts request with shared session and counts it in pool metrics
+
+        Args:
+            method (str): HTTP method
+            **kwargs: aiohttp request parameters
+
+        Returns:
+            AsyncIterator[aiohttp.ClientResponse]: Response context
+        """
+
+        session = await self.get_session()
+        self.requests_total += 1
+        self.requests_in_flight += 1
+        try:
+            async with session.request(method, **kwargs) as response:
+                yield response
+        finally:
+            self.requests_in_flight -= 1
+
+    async def _read_json(self, response: aiohttp.ClientResponse) -> dict | list | None:
+        """
+        Function decodes response body with orjson directly from bytes without intermediate str
+
+        Args:
+            response (aiohttp.ClientResponse): Response to decode
+
+        Returns:
+            dict | list | None: Decoded json, None for empty body
+        """
+
+        body = await response.read()
+        if not body.strip():
+            return None
+        return orjson.loads(body)
 
     async def get(
             self,
@@ -37,7 +212,77 @@ class AsyncApiHandler:
             headers: dict = None,
     ) -> dict:
         """
-        Function extracts get query within extra url
+        Function extracts get query within extra url. Concurrent identical queries by url, params and headers
+        share one in flight request, each of them receives its own copy of decoded result
+
+        Args:
+            extra_url (str): Endpoint url
+            params (dict): Query parameters
+            headers (dict): Headers for queries
+
+        Returns:
+            dict: Query result in dict format
+        """
+
+        if not self.single_flight_enabled:
+            return await self._get(extra_url, params, headers)
+        key = (extra_url, self._items_key(params), self._items_key(headers))
+        task = self._get_in_flight.get(key)
+        if task is not None and task.get_loop() is asyncio.get_running_loop():
+            self.coalesced_total += 1
+            self._get_shared.add(task)
+        else:
+            task = asyncio.create_task(self._get(extra_url, params, headers))
+            self._get_in_flight[key] = task
+            task.add_done_callback(partial(self._release_in_flight, key))
+        # shield keeps shared request alive if one of waiting callers is cancelled
+        result = await asyncio.shield(task)
+        if task in self._get_shared:
+            return copy.deepcopy(result)
+        return result
+
+    @staticmethod
+    def _items_key(items: dict | None) -> tuple:
+        """
+        Function builds hashable in flight request key part from query parameters or headers
+
+        Args:
+            items (dict | None): Query parameters or headers, list values are allowed
+
+        Returns:
+            tuple: Sorted items with list values converted to tuples
+        """
+
+        return tuple(
+            sorted((name, tuple(value) if isinstance(value, list) else value) for name, value in (items or {}).items())
+        )
+
+    def _release_in_flight(self, key: tuple, task: asyncio.Task) -> None:
+        """
+        Function forgets finished in flight get request
+
+        Args:
+            key (tuple): In flight request key
+            task (asyncio.Task): Finished request task
+
+        Returns:
+            None
+        """
+
+        if self._get_in_flight.get(key) is task:
+            del self._get_in_flight[key]
+        if not task.cancelled():
+            # exception is retrieved by waiting callers, mark it to avoid warnings when all of them are cancelled
+            task.exception()
+
+    async def _get(
+            self,
+            extra_url: str,
+            params: dict = None,
+            headers: dict = None,
+    ) -> dict:
+        """
+        Function extracts get query within extra url without coalescing
 
         Args:
             extra_url (str): Endpoint url
@@ -49,23 +294,23 @@ class AsyncApiHandler:
         """
 
         endpoint_url = self.base_url + extra_url
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                url=endpoint_url,
-                params=params,
-                headers=headers,
-            ) as response:
-                if response.status == 200:
-                    return await response.json()
-                additional_info = await response.json()
-                e = http_exception(
-                    response.status,
-                    "Error during extracting query",
-                    _input={"url": endpoint_url, "params": params},
-                    _detail=additional_info
-                )
-                logger.exception(e)
-                raise e
+        async with self._request(
+            "GET",
+            url=endpoint_url,
+            params=params,
+            headers=headers,
+        ) as response:
+            if response.status == 200:
+                return await self._read_json(response)
+            additional_info = await response.json()
+            e = http_exception(
+                response.status,
+                "Error during extracting query",
+                _input={"url": endpoint_url, "params": params},
+                _detail=additional_info
+            )
+            logger.exception(e)
+            raise e
 
     async def post(
             self,
@@ -88,51 +333,49 @@ class AsyncApiHandler:
         """
 
         endpoint_url = self.base_url + extra_url
-        async with aiohttp.ClientSession() as session:
-
-            async with session.post(
-                url=endpoint_url,
-                headers=headers,
-                params=params,
-                json=data,
-                timeout=int(config.get("GENERAL_TIMEOUT"))
-            ) as response:
-                if response.status in (200, 201):
-                    # logger.info(
-                    #     f"Posted data with url: {response.url} and status: {response.status}"
-                    # )
-                    await asyncio.sleep(0.1)
-                    return await response.json()
-                logger.warning(
-                    f"""
-                    Couldn't extract post request with url: {endpoint_url}, status code {response.status}
-                    request_params: {params}
-                    data: {data}
-                    """
+        async with self._request(
+            "POST",
+            url=endpoint_url,
+            headers=headers,
+            params=params,
+            json=data,
+            timeout=int(config.get("GENERAL_TIMEOUT"))
+        ) as response:
+            if response.status in (200, 201):
+                # logger.info(
+                #     f"Posted data with url: {response.url} and status: {response.status}"
+                # )
+                await asyncio.sleep(0.1)
+                return await self._read_json(response)
+            logger.warning(
+                f"""
+                Couldn't extract post request with url: {endpoint_url}, status code {response.status}
+                request_params: {params}
+                data: {data}
+                """
+            )
+            additional_info = await response.text()
+            e = http_exception(
+                response.status,
+                "Error during extracting query",
+                _input={"url": endpoint_url, "params": params},
+                _detail=additional_info
+            )
+            with open(f'{"_".join(extra_url.split("/"))}_{response.status}_error', "w", encoding="utf-8") as f:
+                json.dump(
+                    {
+                        "error_info": additional_info,
+                        "body": data,
+                    },
+                    f
                 )
-                additional_info = await response.text()
-                e = http_exception(
-                    response.status,
-                    "Error during extracting query",
-                    _input={"url": endpoint_url, "params": params},
-                    _detail=additional_info
-                )
-                with open(f'{"_".join(extra_url.split("/"))}_{response.status}_error', "w", encoding="utf-8") as f:
-                    json.dump(
-                        {
-                            "error_info": additional_info,
-                            "body": data,
-                        },
-                        f
-                    )
-                logger.exception(e)
-                raise e
+            logger.exception(e)
+            raise e
 
     async def put(
             self,
             extra_url: str,
-            data: dict | list,
-            session: aiohttp.ClientSession = None,
+            data: dict | list | bytes,
             params: dict = None,
             headers: dict = None,
     ) -> dict:
@@ -140,9 +383,8 @@ class AsyncApiHandler:
         Function extracts put query within extra url
 
         Args:
-            session (aiohttp.ClientSession): Session to extract requests
             extra_url (str): Endpoint url
-            data (dict): Data to post | list
+            data (dict): Data to post | list | already serialised json bytes
             params (dict): Query parameters. Default to None
             headers (dict): HTTP headers. Default to None
 
@@ -150,28 +392,32 @@ class AsyncApiHandler:
             dict: Query result in dict format | list
         """
 
-        if not session:
-            session = aiohttp.ClientSession()
         endpoint_url = self.base_url + extra_url
-        async with session as session:
-            async with session.put(
-                url=endpoint_url,
-                headers=headers,
-                params=params,
-                json=data,
-                timeout=int(config.get("GENERAL_TIMEOUT"))
-            ) as response:
-                if response.status in (200, 201):
-                    return await response.json()
-                additional_info = await response.text()
-                e = http_exception(
-                    response.status,
-                    "Error during extracting query",
-                    _input={"url": endpoint_url, "params": params},
-                    _detail=additional_info
-                )
-                logger.exception(e)
-                raise e
+        if isinstance(data, bytes):
+            body = {
+                "data": data,
+                "headers": {**(headers or {}), "Content-Type": "application/json"},
+            }
+        else:
+            body = {"json": data, "headers": headers}
+        async with self._request(
+            "PUT",
+            url=endpoint_url,
+            params=params,
+            timeout=int(config.get("GENERAL_TIMEOUT")),
+            **body,
+        ) as response:
+            if response.status in (200, 201):
+                return await self._read_json(response)
+            additional_info = await response.text()
+            e = http_exception(
+                response.status,
+                "Error during extracting query",
+                _input={"url": endpoint_url, "params": params},
+                _detail=additional_info
+            )
+            logger.exception(e)
+            raise e
 
     async def delete(
             self,
@@ -192,26 +438,26 @@ class AsyncApiHandler:
         """
 
         endpoint_url = self.base_url + extra_url
-        async with aiohttp.ClientSession() as session:
-            async with session.delete(
-                url=endpoint_url,
-                params=params,
-                headers=headers,
-            ) as response:
-                if response.status in (200, 201):
-                    logger.info(
-                        f"Delete data with url: {response.url} and status: {response.status}")
-                    return await response.json()
-
-                additional_info = await response.text()
-                e = http_exception(
-                    response.status,
-                    "Error during extracting query",
-                    _input={"url": endpoint_url, "params": params},
-                    _detail=additional_info
-                )
-                logger.exception(e)
-                raise e
+        async with self._request(
+            "DELETE",
+            url=endpoint_url,
+            params=params,
+            headers=headers,
+        ) as response:
+            if response.status in (200, 201, 204):
+                logger.info(
+                    f"Delete data with url: {response.url} and status: {response.status}")
+                return await self._read_json(response)
+
+            additional_info = await response.text()
+            e = http_exception(
+                response.status,
+                "Error during extracting query",
+                _input={"url": endpoint_url, "params": params},
+                _detail=additional_info
+            )
+            logger.exception(e)
+            raise e
 
     # async def townsnet_post(
     #         self,
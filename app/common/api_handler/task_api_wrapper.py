@@ -1,7 +1,5 @@
 import asyncio
 
-import aiohttp
-
 from tqdm.asyncio import tqdm_asyncio
 
 
@@ -56,8 +54,7 @@ class TasksApiHandler:
 
         async def bound_func(data_obj):
             async with semaphore:
-                async with aiohttp.ClientSession() as session:
-                    return await func(session=session, headers=headers, **data_obj)
+                return await func(headers=headers, **data_obj)
 
         tasks_list = [bound_func(data_obj) for data_obj in data]
         result = await tqdm_asyncio.gather(*tasks_list)
@@ -5,9 +5,11 @@ from otteroad.consumer import BaseMessageHandler
 from otteroad.models import RegionalScenarioIndicatorsUpdated
 
 from app.common.broker.events_groups import ScenarioIndicatorsEvent
+from app.grid_generator.services.grid_generator_service import grid_generator_service
 from app.indicators_savior.indicators_savior_constroller import (
     save_regional_scenario_to_db,
 )
+from app.prioc.services.hex_api_getter import hex_api_getter
 
 
 class RegionalScenarioHandler(BaseMessageHandler[RegionalScenarioIndicatorsUpdated]):
@@ -34,40 +36,46 @@ class RegionalScenarioHandler(BaseMessageHandler[RegionalScenarioIndicatorsUpdat
         """
 
         logger.info("Started processing event {}", repr(event))
-        if event.scenario_id not in self.scenarios_events:
-            self.scenarios_events[event.scenario_id] = ScenarioIndicatorsEvent(
-                scenario_id=event.scenario_id
-            )
-        if event.indicator_id in self.indicators_processable_list:
-            print(repr(event))
-            if self.scenarios_events[event.scenario_id].add_indicator(
-                event.indicator_id
-            ):
-                print(repr(self.scenarios_events[event.scenario_id]))
-                try:
-                    await save_regional_scenario_to_db(
-                        regional_scenario_id=event.scenario_id,
-                        territory_id=event.territory_id,
-                    )
-                    logger.info(
-                        f"Saved all indicators for scenario {event.scenario_id} from broker message"
-                    )
-                except HTTPException as http_e:
-                    if http_e.status_code == 404:
+        try:
+            if event.scenario_id not in self.scenarios_events:
+                self.scenarios_events[event.scenario_id] = ScenarioIndicatorsEvent(
+                    scenario_id=event.scenario_id
+                )
+            if event.indicator_id in self.indicators_processable_list:
+                print(repr(event))
+                if self.scenarios_events[event.scenario_id].add_indicator(
+                    event.indicator_id
+                ):
+                    print(repr(self.scenarios_events[event.scenario_id]))
+                    try:
+                        await save_regional_scenario_to_db(
+                            regional_scenario_id=event.scenario_id,
+                            territory_id=event.territory_id,
+                        )
                         logger.info(
-                            "Scenario with id {} is already deleted or never existed. It won't be processed".format(
+                            f"Saved all indicators for scenario {event.scenario_id} from broker message"
+                        )
+                    except HTTPException as http_e:
+                        if http_e.status_code == 404:
+                            logger.info(
+                                "Scenario with id {} is already deleted or never existed. It won't be processed".format(
+                                    event.scenario_id
+                                )
+                            )
+                        else:
+                            raise http_e
+                    except Exception as e:
+                        logger.exception(e)
+                        logger.error(
+                            "Error during scenario handling. Scenario id {}".format(
                                 event.scenario_id
                             )
                         )
-                    else:
-                        raise http_e
-                except Exception as e:
-                    logger.exception(e)
-                    logger.error(
-                        "Error during scenario handling. Scenario id {}".format(
-                            event.scenario_id
-                        )
-                    )
+        finally:
+            # cached hexes are dropped only after indicators are written, otherwise request between event and
+            # write could cache outdated values again
+            hex_api_getter.invalidate_scenario(event.scenario_id)
+            grid_generator_service.invalidate_indicators(event.territory_id)
 
     async def on_startup(self):
         pass
@@ -0,0 +1 @@
+from .ttl_lru_cache import TTLLRUCache
@@ -0,0 +1,164 @@
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+
+class TTLLRUCache:
+    """
+    Class for in-process caching with time to live and least recently used eviction by entries number and memory
+    """
+
+    caches: list["TTLLRUCache"] = []
+
+    def __init__(
+            self,
+            name: str,
+            ttl: float,
+            max_size: int,
+            max_memory: int | None = None,
+            sizeof: Callable[[Any], int] | None = None,
+    ) -> None:
+        """
+        Initialisation function
+
+        Args:
+            name (str): Cache name for metrics
+            ttl (float): Entry time to live in seconds
+            max_size (int): Max entries number
+            max_memory (int): Max memory in bytes of all entries. Default to None (not limited)
+            sizeof (Callable): Function to estimate entry memory in bytes. Default to None
+
+        Returns:
+            None
+        """
+
+        self.name = name
+        self.ttl = ttl
+        self.max_size = max_size
+        self.max_memory = max_memory
+        self.sizeof = sizeof
+        self._data: OrderedDict[Hashable, tuple[float, int, Any]] = OrderedDict()
+        self.memory = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        TTLLRUCache.caches.append(self)
+
+    def __len__(self) -> int:
+
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Function returns cached value if it is not expired
+
+        Args:
+            key (Hashable): Cache key
+            default (Any): Value to return if key is not cached. Default to None
+
+        Returns:
+            Any: Cached value or default
+        """
+
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return default
+        expires_at, _, value = item
+        if expires_at < time.monotonic():
+            self.pop(key)
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """
+        Function caches value and evicts least recently used entries over limits
+
+        Args:
+            key (Hashable): Cache key
+            value (Any): Value to cache
+
+        Returns:
+            None
+        """
+
+        self.pop(key)
+        size = self.sizeof(value) if self.sizeof else 0
+        if self.max_memory is not None and size > self.max_memory:
+            return
+        self._data[key] = (time.monotonic() + self.ttl, size, value)
+        self.memory += size
+        while len(self._data) > self.max_size or (
+            self.max_memory is not None and self.memory > self.max_memory
+        ):
+            _, (_, evicted_size, _) = self._data.popitem(last=False)
+            self.memory -= evicted_size
+            self.evictions += 1
+
+    def pop(self, key: Hashable) -> Any:
+        """
+        Function removes key from cache
+
+        Args:
+            key (Hashable): Cache key
+
+        Returns:
+            Any: Removed value or None
+        """
+
+        item = self._data.pop(key, None)
+        if item is None:
+            return None
+        self.memory -= item[1]
+        return item[2]
+
+    def invalidate(self, predicate: Callable[[Hashable], bool]) -> int:
+        """
+        Function removes all keys matching predicate
+
+        Args:
+            predicate (Callable): Function returning True for keys to remove
+
+        Returns:
+            int: Number of removed keys
+        """
+
+        keys = [key for key in self._data if predicate(key)]
+        for key in keys:
+            self.pop(key)
+        return len(keys)
+
+    def clear(self) -> None:
+
+        self._data.clear()
+        self.memory = 0
+
+    def get_stats(self) -> dict:
+        """
+        Function returns cache metrics
+
+        Returns:
+            dict: Entries, memory, hits, misses and evictions counters
+        """
+
+        return {
+            "name": self.name,
+            "entries": len(self._data),
+            "max_size": self.max_size,
+            "memory": self.memory,
+            "max_memory": self.max_memory,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    @classmethod
+    def get_caches_stats(cls) -> list[dict]:
+        """
+        Function returns metrics for all caches
+        """
+
+        return [cache.get_stats() for cache in cls.caches]
@@ -0,0 +1,2 @@
+from .compute_executor import ComputeExecutor, compute_executor
+from .process_functions import count_passed_thresholds, fit_predict_clusters
@@ -0,0 +1,142 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable
+
+from loguru import logger
+
+from app.common.config import config
+
+
+class ComputeExecutor:
+    """
+    Class for running CPU bound stages outside event loop. Picklable functions with light payloads (arrays, WKB)
+    are sent to shared process pool, stages working with shared objects or GIL releasing GEOS calls run in threads
+    """
+
+    def __init__(self) -> None:
+        """
+        Initialisation function. Process pool is created on first dispatched task
+
+        Returns:
+            None
+        """
+
+        self.processes = int(config.get("COMPUTE_PROCESSES", str(min(4, os.cpu_count() or 1))))
+        self.min_process_size = int(config.get("COMPUTE_MIN_PROCESS_SIZE", "50000"))
+        self.executor: ProcessPoolExecutor | None = None
+        self.processes_in_flight = 0
+        self.threads_in_flight = 0
+        self.tasks_total = 0
+        self.thread_fallbacks = 0
+        self.failed_total = 0
+
+    def get_executor(self) -> ProcessPoolExecutor:
+        """
+        Function returns process pool creating it on first call
+
+        Returns:
+            ProcessPoolExecutor: Process pool
+        """
+
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.processes, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self.executor
+
+    async def run(self, func: Callable, *args, size: int | None = None) -> Any:
+        """
+        Function runs function in process pool. Function and arguments should be picklable module level objects.
+        Tasks smaller than COMPUTE_MIN_PROCESS_SIZE and all tasks without process pool (COMPUTE_PROCESSES < 2)
+        run in thread. Tasks are rerun in thread if pool processes died
+
+        Args:
+            func (Callable): Function to run
+            *args: Function arguments
+            size (int): Task size (e.g. rows number) to compare with COMPUTE_MIN_PROCESS_SIZE.
+            Default to None (always run in process pool)
+
+        Returns:
+            Any: Function result
+        """
+
+        if self.processes < 2 or (size is not None and size < self.min_process_size):
+            return await self.run_in_thread(func, *args)
+        self.tasks_total += 1
+        self.processes_in_flight += 1
+        executor = self.get_executor()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+        except BrokenProcessPool:
+            logger.exception(f"Compute process pool is broken, running {func.__name__} in thread")
+            executor.shutdown(wait=False, cancel_futures=True)
+            if self.executor is executor:
+                self.executor = None
+            self.thread_fallbacks += 1
+            return await asyncio.to_thread(func, *args)
+        except Exception:
+            self.failed_total += 1
+            raise
+        finally:
+            self.processes_in_flight -= 1
+
+    async def run_in_thread(self, func: Callable, *args, **kwargs) -> Any:
+        """
+        Function runs function in default threads pool
+
+        Args:
+            func (Callable): Function to run
+            *args: Function arguments
+            **kwargs: Function keyword arguments
+
+        Returns:
+            Any: Function result
+        """
+
+        self.tasks_total += 1
+        self.threads_in_flight += 1
+        try:
+            return await asyncio.to_thread(func, *args, **kwargs)
+        except Exception:
+            self.failed_total += 1
+            raise
+        finally:
+            self.threads_in_flight -= 1
+
+    def get_stats(self) -> dict:
+        """
+        Function returns executor utilisation metrics
+
+        Returns:
+            dict: Processes number, busy processes, queue depth, threads tasks and counters
+        """
+
+        busy = min(self.processes_in_flight, self.processes)
+        return {
+            "processes": self.processes,
+            "pool_started": self.executor is not None,
+            "busy_processes": busy,
+            "queue_depth": self.processes_in_flight - busy,
+            "threads_in_flight": self.threads_in_flight,
+            "tasks_total": self.tasks_total,
+            "thread_fallbacks": self.thread_fallbacks,
+            "failed_total": self.failed_total,
+        }
+
+    def close(self) -> None:
+        """
+        Function shuts process pool down if it was created
+
+        Returns:
+            None
+        """
+
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+
+
+compute_executor = ComputeExecutor()
@@ -0,0 +1,36 @@
+import hdbscan
+import numpy as np
+
+
+def count_passed_thresholds(values: np.ndarray, thresholds: np.ndarray) -> np.ndarray:
+    """
+    Function counts criteria values passing profiles thresholds for each hex
+
+    Args:
+        values (np.ndarray): Criteria values with row per hex
+        thresholds (np.ndarray): Criteria thresholds with row per profile
+
+    Returns:
+        np.ndarray: Passed criteria number with row per hex and column per profile
+    """
+
+    return (values[:, np.newaxis, :] >= thresholds[np.newaxis, :, :]).sum(axis=2)
+
+
+def fit_predict_clusters(X: np.ndarray) -> np.ndarray:
+    """
+    Function clusters hexagons by centroids coordinates and weighted estimation with HDBSCAN
+
+    Args:
+        X (np.ndarray): Hexagons features with row per hex
+
+    Returns:
+        np.ndarray: Cluster label for each hex, -1 for noise
+    """
+
+    clusterer = hdbscan.HDBSCAN(
+        min_cluster_size=3,
+        min_samples=3,
+        max_cluster_size=15
+    )
+    return clusterer.fit_predict(X)
@@ -10,8 +10,8 @@ class ApplicationConfig:
         logger.info("Env variables loaded")
 
     @staticmethod
-    def get(key: str) -> str | None:
-        return os.getenv(key)
+    def get(key: str, default: str | None = None) -> str | None:
+        return os.getenv(key, default)
 
 
 config = ApplicationConfig()
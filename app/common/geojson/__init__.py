@@ -0,0 +1,6 @@
+from .geojson_response import (
+    GeoJSONResponse,
+    GeoJSONStreamingResponse,
+    gdf_to_geojson_bytes,
+    iter_geojson_chunks,
+)
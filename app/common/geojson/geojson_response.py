@@ -0,0 +1,276 @@
+import gzip
+from typing import Iterator
+
+import geopandas as gpd
+import numpy as np
+import orjson
+import pandas as pd
+import shapely
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+
+from app.common.config import config
+
+
+def _default(value):
+    """
+    Function converts values unsupported by orjson to json compatible ones
+
+    Args:
+        value (Any): Value to convert
+
+    Returns:
+        Any: Json compatible value
+    """
+
+    if value is pd.NA or value is pd.NaT:
+        return None
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    if isinstance(value, shapely.Geometry):
+        return orjson.loads(shapely.to_geojson(value))
+    raise TypeError(f"Type {type(value).__name__} is not json serializable")
+
+
+def _prepare_gdf(gdf: gpd.GeoDataFrame, to_wgs84: bool) -> gpd.GeoDataFrame:
+    """
+    Function reprojects layer to 4326 crs if it is required
+
+    Args:
+        gdf (gpd.GeoDataFrame): Layer to serialise
+        to_wgs84 (bool): Whether to reproject layer to 4326 crs
+
+    Returns:
+        gpd.GeoDataFrame: Layer to serialise
+    """
+
+    if to_wgs84 and gdf.crs is not None and gdf.crs != 4326:
+        return gdf.to_crs(4326)
+    return gdf
+
+
+def _precision_from_config(precision: int | None) -> int | None:
+    """
+    Function returns coordinates precision falling back to GEOJSON_PRECISION setting
+
+    Args:
+        precision (int): Requested number of coordinates decimals
+
+    Returns:
+        int | None: Number of coordinates decimals or None if coordinates shouldn't be rounded
+    """
+
+    if precision is None and config.get("GEOJSON_PRECISION"):
+        return int(config.get("GEOJSON_PRECISION"))
+    return precision
+
+
+def _features_bytes(gdf: gpd.GeoDataFrame, precision: int | None = None) -> list[bytes]:
+    """
+    Function serialises layer rows to GeoJSON features. Geometries are written by GEOS and properties by orjson
+
+    Args:
+        gdf (gpd.GeoDataFrame): Layer to serialise
+        precision (int): Number of coordinates decimals to keep. Default to None (not rounded)
+
+    Returns:
+        list[bytes]: Serialised features in layer order
+    """
+
+    geometries = gdf.geometry.values.to_numpy()
+    if precision is not None:
+        geometries = shapely.transform(geometries, lambda coords: np.round(coords, precision))
+    geometries_json = shapely.to_geojson(geometries)
+    records = pd.DataFrame(gdf.drop(columns=gdf.geometry.name)).to_dict("records")
+    dumps_option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+    return [
+        b'{"id":' + orjson.dumps(str(feature_id))
+        + b',"type":"Feature","properties":' + orjson.dumps(properties, default=_default, option=dumps_option)
+        + b',"geometry":' + (geometry.encode() if geometry is not None else b"null") + b"}"
+        for feature_id, properties, geometry in zip(gdf.index, records, geometries_json)
+    ]
+
+
+def _crs_member(gdf: gpd.GeoDataFrame, to_wgs84: bool) -> bytes:
+    """
+    Function serialises FeatureCollection crs member for layers not in 4326 crs as GeoDataFrame.to_json does
+
+    Args:
+        gdf (gpd.GeoDataFrame): Layer to serialise
+        to_wgs84 (bool): Whether layer is reprojected to 4326 crs
+
+    Returns:
+        bytes: Serialised crs member with leading comma or empty bytes
+    """
+
+    if to_wgs84 or gdf.crs is None or gdf.crs == 4326:
+        return b""
+    return b',"crs":' + orjson.dumps(
+        {"type": "name", "properties": {"name": f"urn:ogc:def:crs:EPSG::{gdf.crs.to_epsg()}"}}
+    )
+
+
+def gdf_to_geojson_bytes(
+        gdf: gpd.GeoDataFrame,
+        to_wgs84: bool = False,
+        precision: int | None = None,
+) -> bytes:
+    """
+    Function serialises layer to GeoJSON FeatureCollection bytes in one pass. Features layout matches
+    GeoDataFrame.to_json
+
+    Args:
+        gdf (gpd.GeoDataFrame): Layer to serialise
+        to_wgs84 (bool): Whether to reproject layer to 4326 crs. Default to False
+        precision (int): Number of coordinates decimals to keep. Default to None (not rounded)
+
+    Returns:
+        bytes: GeoJSON FeatureCollection
+    """
+
+    gdf = _prepare_gdf(gdf, to_wgs84)
+    return (
+        b'{"type":"FeatureCollection","features":['
+        + b",".join(_features_bytes(gdf, precision))
+        + b"]" + _crs_member(gdf, to_wgs84) + b"}"
+    )
+
+
+def iter_geojson_chunks(
+        gdf: gpd.GeoDataFrame,
+        to_wgs84: bool = False,
+        precision: int | None = None,
+        chunk_size: int = 10000,
+        ndjson: bool = False,
+) -> Iterator[bytes]:
+    """
+    Function serialises layer by chunks of features, so only one chunk is kept serialised at a time.
+    Concatenated chunks form GeoJSON FeatureCollection or newline delimited features
+
+    Args:
+        gdf (gpd.GeoDataFrame): Layer to serialise
+        to_wgs84 (bool): Whether to reproject layer to 4326 crs. Default to False
+        precision (int): Number of coordinates decimals to keep. Default to None (not rounded)
+        chunk_size (int): Number of features in one chunk. Default to 10000
+        ndjson (bool): Whether to write one feature per line instead of FeatureCollection. Default to False
+
+    Yields:
+        bytes: Serialised chunk
+    """
+
+    gdf = _prepare_gdf(gdf, to_wgs84)
+    if not ndjson:
+        yield b'{"type":"FeatureCollection","features":['
+    for start in range(0, len(gdf), chunk_size):
+        features = _features_bytes(gdf.iloc[start:start + chunk_size], precision)
+        if ndjson:
+            yield b"\n".join(features) + b"\n"
+        else:
+            yield (b"," if start else b"") + b",".join(features)
+    if not ndjson:
+        yield b"]" + _crs_member(gdf, to_wgs84) + b"}"
+
+
+class GeoJSONResponse(Response):
+    """
+    Class for responses with layers serialised once straight to GeoJSON bytes. Large bodies are compressed with
+    gzip if client accepts it
+    """
+
+    media_type = "application/geo+json"
+
+    def __init__(
+            self,
+            gdf: gpd.GeoDataFrame,
+            request: Request | None = None,
+            to_wgs84: bool = False,
+            precision: int | None = None,
+            status_code: int = 200,
+    ) -> None:
+        """
+        Initialisation function
+
+        Args:
+            gdf (gpd.GeoDataFrame): Layer to return
+            request (Request): Request to negotiate compression with. Default to None (not compressed)
+            to_wgs84 (bool): Whether to reproject layer to 4326 crs. Default to False
+            precision (int): Number of coordinates decimals to keep. Default to None (GEOJSON_PRECISION setting)
+            status_code (int): Response status code. Default to 200
+
+        Returns:
+            None
+        """
+
+        body = gdf_to_geojson_bytes(gdf, to_wgs84=to_wgs84, precision=_precision_from_config(precision))
+        headers = {"Vary": "Accept-Encoding"}
+        encoding = self.negotiate_encoding(request, len(body))
+        if encoding == "gzip":
+            body = gzip.compress(body, compresslevel=int(config.get("GEOJSON_GZIP_LEVEL", "5")))
+            headers["Content-Encoding"] = "gzip"
+        super().__init__(content=body, status_code=status_code, headers=headers)
+
+    @staticmethod
+    def negotiate_encoding(request: Request | None, body_size: int) -> str | None:
+        """
+        Function selects response compression. Bodies smaller than GEOJSON_COMPRESS_MIN_BYTES are not compressed
+
+        Args:
+            request (Request): Request with Accept-Encoding header
+            body_size (int): Response body size in bytes
+
+        Returns:
+            str | None: "gzip" or None if body shouldn't be compressed
+        """
+
+        if request is None or body_size < int(config.get("GEOJSON_COMPRESS_MIN_BYTES", "65536")):
+            return None
+        accepted = {
+            encoding.split(";")[0].strip().lower()
+            for encoding in request.headers.get("accept-encoding", "").split(",")
+        }
+        if "gzip" in accepted:
+            return "gzip"
+        return None
+
+
+class GeoJSONStreamingResponse(StreamingResponse):
+    """
+    Class for responses with already built layers streamed by chunks of features as GeoJSON FeatureCollection or
+    newline delimited GeoJSON features, so whole serialized body is never kept in memory
+    """
+
+    def __init__(
+            self,
+            gdf: gpd.GeoDataFrame,
+            to_wgs84: bool = False,
+            precision: int | None = None,
+            ndjson: bool = False,
+            status_code: int = 200,
+    ) -> None:
+        """
+        Initialisation function
+
+        Args:
+            gdf (gpd.GeoDataFrame): Layer to return
+            to_wgs84 (bool): Whether to reproject layer to 4326 crs. Default to False
+            precision (int): Number of coordinates decimals to keep. Default to None (GEOJSON_PRECISION setting)
+            ndjson (bool): Whether to stream one feature per line instead of FeatureCollection. Default to False
+            status_code (int): Response status code. Default to 200
+
+        Returns:
+            None
+        """
+
+        super().__init__(
+            iter_geojson_chunks(
+                gdf,
+                to_wgs84=to_wgs84,
+                precision=_precision_from_config(precision),
+                chunk_size=int(config.get("GEOJSON_STREAM_CHUNK_SIZE", "10000")),
+                ndjson=ndjson,
+            ),
+            status_code=status_code,
+            media_type="application/x-ndjson" if ndjson else "application/geo+json",
+        )
@@ -0,0 +1,14 @@
+from .h3_geometry import (
+    boundaries_to_polygons,
+    cells_neighbour_pairs,
+    cells_to_boundaries,
+    cells_to_parents,
+    cells_to_polygons,
+    cells_within,
+    exteriors_to_cells,
+    features_to_cells,
+    infer_resolution,
+    polygons_to_cells,
+)
+from .hex_outline import HexOutline
+from .hex_store import HexStore
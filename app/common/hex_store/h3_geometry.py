@@ -0,0 +1,247 @@
+from itertools import chain
+
+import geopandas as gpd
+import numpy as np
+import shapely
+from h3.api import basic_int as h3_int
+from shapely.geometry import shape
+
+
+def cells_to_boundaries(cells: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Function collects H3 cells boundaries vertices in one coordinates array
+
+    Args:
+        cells (np.ndarray): H3 cells ids as uint64
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: (lng, lat) vertices coordinates in cells order and vertices number of each cell
+    """
+
+    boundaries = [h3_int.cell_to_boundary(int(cell)) for cell in cells]
+    vertices_num = np.fromiter(
+        (len(boundary) for boundary in boundaries), dtype=np.int64, count=len(boundaries)
+    )
+    coordinates = np.fromiter(
+        chain.from_iterable(chain.from_iterable(boundaries)), dtype="float64", count=2 * int(vertices_num.sum())
+    ).reshape(-1, 2)
+    # h3 returns (lat, lng) vertices
+    return np.ascontiguousarray(coordinates[:, ::-1]), vertices_num
+
+
+def boundaries_to_polygons(coordinates: np.ndarray, vertices_num: np.ndarray) -> np.ndarray:
+    """
+    Function builds polygons from cells boundaries vertices in bulk
+
+    Args:
+        coordinates (np.ndarray): (lng, lat) vertices coordinates
+        vertices_num (np.ndarray): Vertices number of each polygon
+
+    Returns:
+        np.ndarray: Shapely polygons
+    """
+
+    if len(vertices_num) == 0:
+        return np.array([], dtype=object)
+    if (vertices_num == vertices_num[0]).all():
+        # all hexagons without pentagons and distorted cells are built from one 3d array
+        rings = shapely.linearrings(coordinates.reshape(len(vertices_num), int(vertices_num[0]), 2))
+    else:
+        rings = shapely.linearrings(
+            coordinates, indices=np.repeat(np.arange(len(vertices_num)), vertices_num)
+        )
+    return shapely.polygons(rings)
+
+
+def cells_to_polygons(cells: np.ndarray) -> np.ndarray:
+    """
+    Function builds H3 cells polygons in bulk from one coordinates array
+
+    Args:
+        cells (np.ndarray): H3 cells ids as uint64
+
+    Returns:
+        np.ndarray: Shapely polygons in 4326 crs
+    """
+
+    if len(cells) == 0:
+        return np.array([], dtype=object)
+    return boundaries_to_polygons(*cells_to_boundaries(cells))
+
+
+def infer_resolution(geometries: gpd.GeoSeries) -> int:
+    """
+    Function detects H3 resolution of hexagons polygons by the first polygon area
+
+    Args:
+        geometries (gpd.GeoSeries): H3 hexagons polygons in 4326 crs
+
+    Returns:
+        int: H3 resolution
+    """
+
+    sample = geometries[~geometries.is_empty].iloc[0]
+    center = shapely.centroid(sample)
+
+    def area_error(resolution: int) -> float:
+        cell = h3_int.latlng_to_cell(center.y, center.x, resolution)
+        polygon = cells_to_polygons(np.array([cell], dtype=np.uint64))[0]
+        return abs(np.log(polygon.area / sample.area))
+
+    return min(range(16), key=area_error)
+
+
+def polygons_to_cells(
+        geometries: gpd.GeoSeries,
+        resolution: int | None = None,
+) -> tuple[np.ndarray, int]:
+    """
+    Function maps H3 hexagons polygons to H3 cells ids by their centroids
+
+    Args:
+        geometries (gpd.GeoSeries): H3 hexagons polygons
+        resolution (int): H3 resolution. Default to None (detected by polygons area)
+
+    Returns:
+        tuple[np.ndarray, int]: H3 cells ids as uint64 and resolution
+    """
+
+    if geometries.crs is not None and geometries.crs != 4326:
+        geometries = geometries.to_crs(4326)
+    if resolution is None:
+        resolution = infer_resolution(geometries)
+    centroids = shapely.centroid(geometries.values)
+    cells = np.fromiter(
+        (
+            h3_int.latlng_to_cell(lat, lng, resolution)
+            for lng, lat in zip(shapely.get_x(centroids), shapely.get_y(centroids))
+        ),
+        dtype=np.uint64,
+        count=len(centroids),
+    )
+    return cells, resolution
+
+
+def cells_neighbour_pairs(cells: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Function finds adjacent cells pairs within provided cells set
+
+    Args:
+        cells (np.ndarray): H3 cells ids as uint64
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: Positions of left and right cells for each adjacent pair in both directions
+    """
+
+    order = np.argsort(cells, kind="stable")
+    sorted_cells = cells[order]
+    rings = [h3_int.grid_ring(int(cell), 1) for cell in cells]
+    left = np.repeat(np.arange(len(cells)), [len(ring) for ring in rings])
+    neighbours = np.fromiter(
+        (neighbour for ring in rings for neighbour in ring), dtype=np.uint64, count=left.size
+    )
+    found = np.searchsorted(sorted_cells, neighbours).clip(max=max(len(cells) - 1, 0))
+    is_found = sorted_cells[found] == neighbours
+    return left[is_found], order[found[is_found]]
+
+
+def exteriors_to_cells(exteriors: list[list], resolution: int) -> np.ndarray:
+    """
+    Function maps H3 hexagons GeoJSON exterior rings to H3 cells ids by rings vertices centers
+    without shapely geometries
+
+    Args:
+        exteriors (list[list]): Exterior rings coordinates as [lng, lat] lists closed by the first vertex
+        resolution (int): H3 resolution
+
+    Returns:
+        np.ndarray: H3 cells ids as uint64
+    """
+
+    if not exteriors:
+        return np.array([], dtype=np.uint64)
+    vertices_num = np.fromiter((len(ring) - 1 for ring in exteriors), dtype=np.int64, count=len(exteriors))
+    coordinates = np.array([vertex[:2] for ring in exteriors for vertex in ring[:-1]], dtype="float64")
+    starts = np.concatenate([[0], np.cumsum(vertices_num)[:-1]])
+    ring_positions = np.repeat(np.arange(len(exteriors)), vertices_num)
+    # rings crossing antimeridian are averaged in 0..360 longitudes
+    crossing = (
+        np.maximum.reduceat(coordinates[:, 0], starts) - np.minimum.reduceat(coordinates[:, 0], starts)
+    ) > 180
+    shift = crossing[ring_positions] & (coordinates[:, 0] < 0)
+    coordinates[shift, 0] += 360
+    centers = np.add.reduceat(coordinates, starts, axis=0) / vertices_num[:, None]
+    centers[:, 0] = (centers[:, 0] + 180) % 360 - 180
+    return np.fromiter(
+        (h3_int.latlng_to_cell(lat, lng, resolution) for lng, lat in centers),
+        dtype=np.uint64,
+        count=len(centers),
+    )
+
+
+def cells_to_parents(cells: np.ndarray, resolution: int) -> np.ndarray:
+    """
+    Function finds H3 cells parents at coarser resolution with bit operations on cells ids.
+    Parent id is child id with replaced resolution bits and unused digits after parent resolution
+
+    Args:
+        cells (np.ndarray): H3 cells ids as uint64 with resolution not coarser than provided one
+        resolution (int): Parents H3 resolution
+
+    Returns:
+        np.ndarray: Parents H3 cells ids as uint64 in cells order
+    """
+
+    cells = np.asarray(cells, dtype=np.uint64)
+    resolution_bits = np.uint64(0xF << 52)
+    unused_digits = np.uint64((1 << (3 * (15 - resolution))) - 1)
+    return (cells & ~resolution_bits) | np.uint64(resolution << 52) | unused_digits
+
+
+def features_to_cells(features: list[dict]) -> tuple[np.ndarray, int]:
+    """
+    Function maps H3 hexagons GeoJSON features to H3 cells ids. Cells are taken from "h3_index" properties
+    if all features have them, otherwise from polygons exteriors
+
+    Args:
+        features (list[dict]): H3 hexagons GeoJSON features with geometries
+
+    Returns:
+        tuple[np.ndarray, int]: H3 cells ids as uint64 in features order and resolution
+    """
+
+    h3_indexes = [(feature.get("properties") or {}).get("h3_index") for feature in features]
+    if not features:
+        return np.array([], dtype=np.uint64), 0
+    if all(h3_indexes):
+        cells = np.fromiter(
+            (h3_int.str_to_int(index) for index in h3_indexes), dtype=np.uint64, count=len(h3_indexes)
+        )
+        return cells, h3_int.get_resolution(int(cells[0]))
+    if all(feature["geometry"]["type"] == "Polygon" for feature in features):
+        resolution = infer_resolution(gpd.GeoSeries([shape(features[0]["geometry"])], crs=4326))
+        cells = exteriors_to_cells([feature["geometry"]["coordinates"][0] for feature in features], resolution)
+        return cells, resolution
+    return polygons_to_cells(gpd.GeoSeries([shape(feature["geometry"]) for feature in features], crs=4326))
+
+
+def cells_within(geometries: np.ndarray, resolution: int) -> np.ndarray:
+    """
+    Function finds H3 cells which polygons are fully within union of provided polygonal geometries.
+    Candidates are cells with centers within union, only their polygons are checked
+
+    Args:
+        geometries (np.ndarray): Polygons and multipolygons in 4326 crs
+        resolution (int): H3 resolution
+
+    Returns:
+        np.ndarray: Sorted H3 cells ids as uint64
+    """
+
+    union = shapely.union_all(geometries)
+    if union.is_empty:
+        return np.array([], dtype=np.uint64)
+    candidates = h3_int.geo_to_cells(union, resolution)
+    cells = np.sort(np.fromiter(candidates, dtype=np.uint64, count=len(candidates)))
+    shapely.prepare(union)
+    return cells[shapely.contains(union, cells_to_polygons(cells))]
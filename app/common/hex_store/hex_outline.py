@@ -0,0 +1,52 @@
+from dataclasses import dataclass
+
+import geopandas as gpd
+import shapely
+from shapely.geometry import mapping
+
+from .hex_store import HexStore
+
+
+@dataclass(frozen=True)
+class HexOutline:
+    """
+    Derived geometries of hexagons store: dissolved outline and its GeoJSON geometry dict
+    """
+
+    geometry: shapely.Geometry
+    geojson: dict
+
+    @classmethod
+    def from_store(
+            cls,
+            store: HexStore,
+            simplify_tolerance: float = 0,
+    ) -> "HexOutline":
+        """
+        Function dissolves store hexagons and derives outline artefacts
+
+        Args:
+            store (HexStore): Hexagons store
+            simplify_tolerance (float): Outline simplification tolerance in meters. Default to 0 (not simplified)
+
+        Returns:
+            HexOutline: Outline in 4326 crs with its GeoJSON
+        """
+
+        outline = gpd.GeoSeries([store.outline()], crs=4326)
+        if simplify_tolerance > 0:
+            outline = outline.to_crs(outline.estimate_utm_crs()).simplify(simplify_tolerance).to_crs(4326)
+        geometry = outline.iloc[0]
+        return cls(geometry=geometry, geojson=mapping(geometry))
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Function estimates outline memory in bytes
+
+        Returns:
+            int: Approximate memory in bytes
+        """
+
+        # GEOS coordinates and GeoJSON tuples of python floats
+        return int(shapely.get_num_coordinates(self.geometry)) * 120
@@ -0,0 +1,310 @@
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+from h3.api import basic_int as h3_int
+
+from .h3_geometry import (
+    cells_neighbour_pairs,
+    cells_to_parents,
+    cells_to_polygons,
+    polygons_to_cells,
+)
+
+
+class HexStore:
+    """
+    Class for compact hexagons layer storage as H3 cells ids with indicators columns.
+    Polygons are built only on serialisation, store is read only and shared between requests
+    """
+
+    def __init__(
+            self,
+            cells: np.ndarray,
+            resolution: int,
+            indicators: pd.DataFrame,
+            hexagon_ids: np.ndarray,
+    ) -> None:
+        """
+        Initialisation function
+
+        Args:
+            cells (np.ndarray): H3 cells ids
+            resolution (int): H3 resolution of cells
+            indicators (pd.DataFrame): Indicators values in cells order
+            hexagon_ids (np.ndarray): Hexagons ids from db in cells order
+
+        Returns:
+            None
+        """
+
+        self.cells = np.asarray(cells, dtype=np.uint64)
+        self.resolution = resolution
+        self.indicators = indicators.astype("float64").reset_index(drop=True)
+        self.hexagon_ids = np.asarray(hexagon_ids, dtype=np.int64)
+        self._order = np.argsort(self.cells, kind="stable")
+        self._sorted_cells = self.cells[self._order]
+        self._centers = None
+
+    @classmethod
+    def from_gdf(
+            cls,
+            gdf: gpd.GeoDataFrame,
+            indicators_names: list[str],
+            resolution: int | None = None,
+    ) -> "HexStore":
+        """
+        Function creates store from hexagons layer. Cells are taken from "h3_index" column if it exists,
+        otherwise from hexagons centroids
+
+        Args:
+            gdf (gpd.GeoDataFrame): H3 hexagons layer with "hexagon_id" and indicators columns
+            indicators_names (list[str]): Indicators columns to keep. Missing columns are skipped
+            resolution (int): H3 resolution. Default to None (detected by hexagons area)
+
+        Returns:
+            HexStore: Hexagons store
+        """
+
+        if "h3_index" in gdf.columns and not gdf["h3_index"].isna().any():
+            cells = np.fromiter(
+                (h3_int.str_to_int(cell) for cell in gdf["h3_index"]), dtype=np.uint64, count=len(gdf)
+            )
+            if resolution is None:
+                resolution = h3_int.get_resolution(int(cells[0])) if len(cells) else 0
+        else:
+            cells, resolution = polygons_to_cells(gdf.geometry, resolution)
+        indicators = gdf[[name for name in indicators_names if name in gdf.columns]]
+        if "hexagon_id" in gdf.columns:
+            hexagon_ids = gdf["hexagon_id"].to_numpy()
+        else:
+            hexagon_ids = np.arange(len(gdf))
+        return cls(cells, resolution, indicators, hexagon_ids)
+
+    def __len__(self) -> int:
+        return len(self.cells)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Function estimates store memory in bytes
+
+        Returns:
+            int: Memory in bytes
+        """
+
+        arrays_memory = sum(
+            array.nbytes for array in (self.cells, self.hexagon_ids, self._order, self._sorted_cells)
+        )
+        if self._centers is not None:
+            arrays_memory += self._centers.nbytes
+        return int(arrays_memory + self.indicators.memory_usage(deep=True).sum())
+
+    def take(self, positions: np.ndarray) -> "HexStore":
+        """
+        Function selects store rows by positions
+
+        Args:
+            positions (np.ndarray): Rows positions
+
+        Returns:
+            HexStore: New store with selected rows
+        """
+
+        return HexStore(
+            self.cells[positions],
+            self.resolution,
+            self.indicators.iloc[positions],
+            self.hexagon_ids[positions],
+        )
+
+    def to_parents(self, resolution: int, parents: np.ndarray | None = None) -> "HexStore":
+        """
+        Function aggregates store to coarser H3 resolution. Indicators of parent cell are means of its children
+        present in store. Without provided parents cells result covers store cells but not exactly territory
+        filled at parents resolution
+
+        Args:
+            resolution (int): Parents H3 resolution, not finer than store resolution
+            parents (np.ndarray): H3 cells ids to aggregate children into. Children of other cells are skipped,
+            cells without children get NaN indicators. Default to None (parents of all store cells)
+
+        Returns:
+            HexStore: Store of parents cells, sorted by ids if parents are not provided, with hexagons ids set
+            to -1 (not from db)
+        """
+
+        if resolution > self.resolution:
+            raise ValueError(f"Resolution {resolution} is finer than store resolution {self.resolution}")
+        if resolution == self.resolution and parents is None:
+            return self
+        unique_parents, inverse = np.unique(cells_to_parents(self.cells, resolution), return_inverse=True)
+        aggregated = HexStore(
+            unique_parents,
+            resolution,
+            self.indicators.groupby(inverse).mean(),
+            np.full(len(unique_parents), -1),
+        )
+        if parents is None:
+            return aggregated
+        indicators = aggregated.indicators.reindex(aggregated.lookup(parents)).reset_index(drop=True)
+        return HexStore(parents, resolution, indicators, np.full(len(indicators), -1))
+
+    def lookup(self, cells: np.ndarray) -> np.ndarray:
+        """
+        Function finds rows positions of provided cells
+
+        Args:
+            cells (np.ndarray): H3 cells ids
+
+        Returns:
+            np.ndarray: Rows positions, -1 for cells missing in store
+        """
+
+        cells = np.asarray(cells, dtype=np.uint64)
+        if len(self) == 0:
+            return np.full(cells.size, -1, dtype=np.int64)
+        found = np.searchsorted(self._sorted_cells, cells).clip(max=len(self) - 1)
+        return np.where(self._sorted_cells[found] == cells, self._order[found], -1)
+
+    def points_to_positions(self, geometries: gpd.GeoSeries) -> np.ndarray:
+        """
+        Function finds rows positions of hexagons containing provided geometries representative points
+
+        Args:
+            geometries (gpd.GeoSeries): Geometries to locate
+
+        Returns:
+            np.ndarray: Unique rows positions of hexagons containing geometries
+        """
+
+        if geometries.crs is not None and geometries.crs != 4326:
+            geometries = geometries.to_crs(4326)
+        points = shapely.point_on_surface(geometries.values[~geometries.is_empty])
+        cells = np.fromiter(
+            (
+                h3_int.latlng_to_cell(lat, lng, self.resolution)
+                for lng, lat in zip(shapely.get_x(points), shapely.get_y(points))
+            ),
+            dtype=np.uint64,
+            count=len(points),
+        )
+        positions = self.lookup(cells)
+        return np.unique(positions[positions >= 0])
+
+    def ring_mask(self, positions: np.ndarray, ring_size: int) -> np.ndarray:
+        """
+        Function marks hexagons within ring size from provided hexagons
+
+        Args:
+            positions (np.ndarray): Rows positions of central hexagons
+            ring_size (int): Number of neighbour rings to mark
+
+        Returns:
+            np.ndarray: Boolean mask of store rows
+        """
+
+        mask = np.zeros(len(self), dtype=bool)
+        disks = [h3_int.grid_disk(int(cell), ring_size) for cell in self.cells[positions]]
+        cells = np.fromiter(
+            (cell for disk in disks for cell in disk), dtype=np.uint64, count=sum(map(len, disks))
+        )
+        disk_positions = self.lookup(cells)
+        mask[disk_positions[disk_positions >= 0]] = True
+        return mask
+
+    def neighbour_pairs(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Function finds adjacent hexagons pairs in store
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: Rows positions of left and right hexagons for each pair in both directions
+        """
+
+        return cells_neighbour_pairs(self.cells)
+
+    @property
+    def centers(self) -> np.ndarray:
+        """
+        Function returns hexagons centers as (lng, lat) array built on first access
+
+        Returns:
+            np.ndarray: Hexagons centers coordinates in 4326 crs
+        """
+
+        if self._centers is None:
+            centers = np.array(
+                [h3_int.cell_to_latlng(int(cell)) for cell in self.cells], dtype="float64"
+            ).reshape(-1, 2)
+            self._centers = np.ascontiguousarray(centers[:, ::-1])
+        return self._centers
+
+    def positions_intersecting(self, geometry: shapely.Geometry) -> np.ndarray:
+        """
+        Function finds hexagons intersecting provided geometry. Candidates are selected by hexagons centers
+        within geometry bounds buffered with hexagon edge and only candidates polygons are built to check
+
+        Args:
+            geometry (shapely.Geometry): Geometry in 4326 crs
+
+        Returns:
+            np.ndarray: Rows positions of intersecting hexagons
+        """
+
+        if len(self) == 0 or geometry.is_empty:
+            return np.array([], dtype=np.int64)
+        min_x, min_y, max_x, max_y = geometry.bounds
+        lat_margin = h3_int.average_hexagon_edge_length(self.resolution, unit="km") * 1.5 / 111
+        lng_margin = lat_margin / max(np.cos(np.radians(max(abs(min_y), abs(max_y)) + lat_margin)), 1e-6)
+        lng, lat = self.centers[:, 0], self.centers[:, 1]
+        candidates = np.flatnonzero(
+            (lng >= min_x - lng_margin) & (lng <= max_x + lng_margin)
+            & (lat >= min_y - lat_margin) & (lat <= max_y + lat_margin)
+        )
+        polygons = cells_to_polygons(self.cells[candidates])
+        shapely.prepare(geometry)
+        return candidates[shapely.intersects(geometry, polygons)]
+
+    def outline(self) -> shapely.Geometry:
+        """
+        Function unites all hexagons in one geometry
+
+        Returns:
+            shapely.Geometry: Store coverage in 4326 crs
+        """
+
+        return shapely.coverage_union_all(cells_to_polygons(self.cells))
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        Function converts store to attributes table without geometries
+
+        Returns:
+            pd.DataFrame: Table with "hexagon_id", "h3_index" and indicators columns
+        """
+
+        frame = pd.DataFrame(
+            {
+                "hexagon_id": self.hexagon_ids,
+                "h3_index": [h3_int.int_to_str(int(cell)) for cell in self.cells],
+            }
+        )
+        return pd.concat([frame, self.indicators], axis=1)
+
+    def to_gdf(self, crs: int | str | None = None) -> gpd.GeoDataFrame:
+        """
+        Function materialises hexagons polygons and converts store to layer
+
+        Args:
+            crs (int | str): Crs to reproject layer to. Default to None (4326)
+
+        Returns:
+            gpd.GeoDataFrame: Hexagons layer with store attributes
+        """
+
+        gdf = gpd.GeoDataFrame(
+            self.to_frame(), geometry=cells_to_polygons(self.cells), crs=4326
+        )
+        if crs is not None:
+            gdf.to_crs(crs, inplace=True)
+        return gdf
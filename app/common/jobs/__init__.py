@@ -0,0 +1 @@
+from .job_runner import JobRunner, job_runner
@@ -0,0 +1,299 @@
+import asyncio
+import fcntl
+import time
+from functools import partial
+from typing import Awaitable, Callable, TextIO
+
+from loguru import logger
+
+from app.common.storage import LocalStorage, local_storage
+
+
+class JobRunner:
+    """
+    Class for long background jobs with progress checkpoints in local storage. Job state is saved after each
+    processed chunk, so jobs interrupted by errors, crashes or restarts continue from the last checkpoint.
+    Running job holds lock file, so one job runs only in one of workers sharing storage
+    """
+
+    def __init__(self, storage: LocalStorage) -> None:
+        """
+        Initialisation function
+
+        Args:
+            storage (LocalStorage): Storage for jobs states and payloads
+
+        Returns:
+            None
+        """
+
+        self.storage = storage
+        self.handlers: dict[str, Callable[[dict], Awaitable[None]]] = {}
+        self.tasks: dict[str, asyncio.Task] = {}
+        self.locks: dict[str, TextIO] = {}
+
+    def register(self, kind: str, handler: Callable[[dict], Awaitable[None]]) -> None:
+        """
+        Function registers job handler. Handler receives job state, processes work after state["done"] position
+        and calls checkpoint after each chunk
+
+        Args:
+            kind (str): Job kind
+            handler (Callable): Async job handler
+
+        Returns:
+            None
+        """
+
+        self.handlers[kind] = handler
+
+    @staticmethod
+    def state_key(job_id: str) -> str:
+        return f"jobs/{job_id}/state"
+
+    def acquire(self, job_id: str) -> bool:
+        """
+        Function takes job lock file. Lock is released by operating system if worker process dies
+
+        Args:
+            job_id (str): Job id
+
+        Returns:
+            bool: Whether lock is held by current process
+        """
+
+        if job_id in self.locks:
+            return True
+        path = self.storage.path(f"jobs/{job_id}/job", ".lock")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        lock_file = path.open("a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        self.locks[job_id] = lock_file
+        return True
+
+    def release(self, job_id: str) -> None:
+        """
+        Function releases job lock file if it is held by current process
+
+        Args:
+            job_id (str): Job id
+
+        Returns:
+            None
+        """
+
+        lock_file = self.locks.pop(job_id, None)
+        if lock_file is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+
+    def is_locked_elsewhere(self, job_id: str) -> bool:
+        """
+        Function checks whether job is run by other worker
+
+        Args:
+            job_id (str): Job id
+
+        Returns:
+            bool: Whether job lock is held by other process
+        """
+
+        if job_id in self.locks:
+            return False
+        if self.acquire(job_id):
+            self.release(job_id)
+            return False
+        return True
+
+    def delete_payload(self, job_id: str) -> None:
+        """
+        Function deletes job payload arrays keeping job state
+
+        Args:
+            job_id (str): Job id
+
+        Returns:
+            None
+        """
+
+        for path in self.storage.path(f"jobs/{job_id}/", "").glob("*.npy"):
+            self.storage.delete(f"jobs/{job_id}/{path.stem}")
+
+    def get_status(self, job_id: str) -> dict | None:
+        """
+        Function returns job state with progress. Running job is reported as interrupted if neither current
+        nor other worker runs it
+
+        Args:
+            job_id (str): Job id
+
+        Returns:
+            dict | None: Job state or None if job doesn't exist
+        """
+
+        state = self.storage.load_json(self.state_key(job_id))
+        if state is None:
+            return None
+        if state["status"] == "running" and job_id not in self.tasks and not self.is_locked_elsewhere(job_id):
+            state["status"] = "interrupted"
+        state["progress"] = round(state["done"] / state["total"], 4) if state["total"] else 1.0
+        return state
+
+    def is_running(self, job_id: str) -> bool:
+        return job_id in self.tasks
+
+    def checkpoint(self, state: dict, done: int, **extra) -> None:
+        """
+        Function saves job progress
+
+        Args:
+            state (dict): Job state
+            done (int): Number of processed work items
+            **extra: Additional state values to save
+
+        Returns:
+            None
+        """
+
+        state.update(extra, done=done, updated_at=time.time())
+        self.storage.save_json(self.state_key(state["job_id"]), state)
+
+    def start(self, kind: str, job_id: str, total: int, params: dict) -> asyncio.Task:
+        """
+        Function creates new job state and runs its handler in background. Existing finished or interrupted job
+        with the same id is replaced, job running in other worker can't be started
+
+        Args:
+            kind (str): Registered job kind
+            job_id (str): Job id
+            total (int): Number of work items
+            params (dict): Json serialisable handler parameters
+
+        Returns:
+            asyncio.Task: Job task
+        """
+
+        if job_id in self.tasks:
+            raise RuntimeError(f"Job {job_id} is already running")
+        if not self.acquire(job_id):
+            raise RuntimeError(f"Job {job_id} is running in other worker")
+        now = time.time()
+        state = {
+            "job_id": job_id,
+            "kind": kind,
+            "status": "running",
+            "params": params,
+            "total": total,
+            "done": 0,
+            "error": None,
+            "created_at": now,
+            "updated_at": now,
+        }
+        self.storage.save_json(self.state_key(job_id), state)
+        return self._run(state)
+
+    def resume(self, job_id: str) -> asyncio.Task:
+        """
+        Function continues not finished job from its last checkpoint, job running in other worker can't be resumed
+
+        Args:
+            job_id (str): Job id
+
+        Returns:
+            asyncio.Task: Job task
+        """
+
+        if job_id in self.tasks:
+            return self.tasks[job_id]
+        if not self.acquire(job_id):
+            raise RuntimeError(f"Job {job_id} is running in other worker")
+        state = self.storage.load_json(self.state_key(job_id))
+        logger.info(f"Resuming job {job_id} from {state['done']}/{state['total']}")
+        self.checkpoint(state, state["done"], status="running", error=None)
+        return self._run(state)
+
+    def _run(self, state: dict) -> asyncio.Task:
+        """
+        Function schedules job handler and tracks its result in job state
+
+        Args:
+            state (dict): Job state
+
+        Returns:
+            asyncio.Task: Job task
+        """
+
+        job_id = state["job_id"]
+
+        async def run_job() -> None:
+            try:
+                await self.handlers[state["kind"]](state)
+                self.checkpoint(state, state["total"], status="finished")
+                self.delete_payload(job_id)
+                logger.info(f"Finished job {job_id}")
+            except asyncio.CancelledError:
+                logger.warning(f"Job {job_id} was interrupted at {state['done']}/{state['total']}")
+                raise
+            except Exception as e:
+                logger.exception(f"Job {job_id} failed at {state['done']}/{state['total']}")
+                self.checkpoint(state, state["done"], status="failed", error=str(e))
+                raise
+
+        task = asyncio.create_task(run_job())
+        # callback also runs for tasks cancelled before start, when job coroutine has no chance to clean up
+        task.add_done_callback(partial(self._finish, job_id))
+        self.tasks[job_id] = task
+        return task
+
+    def _finish(self, job_id: str, task: asyncio.Task) -> None:
+        """
+        Function forgets finished job task and releases its lock
+
+        Args:
+            job_id (str): Job id
+            task (asyncio.Task): Finished job task
+
+        Returns:
+            None
+        """
+
+        if self.tasks.get(job_id) is task:
+            del self.tasks[job_id]
+            self.release(job_id)
+        if not task.cancelled():
+            # errors are saved to job state, background jobs results are not awaited
+            task.exception()
+
+    async def resume_all(self) -> None:
+        """
+        Function resumes all jobs interrupted by restart, which are not already taken by other worker
+
+        Returns:
+            None
+        """
+
+        for state_path in sorted(self.storage.root.glob("jobs/*/state.json")):
+            job_id = state_path.parent.name
+            state = self.storage.load_json(self.state_key(job_id))
+            if state and state["status"] == "running" and state["kind"] in self.handlers and self.acquire(job_id):
+                self.resume(job_id)
+
+    async def stop(self) -> None:
+        """
+        Function cancels running jobs keeping their checkpoints to resume them on next start
+
+        Returns:
+            None
+        """
+
+        tasks = list(self.tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+job_runner = JobRunner(local_storage)
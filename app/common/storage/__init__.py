@@ -0,0 +1 @@
+from .local_storage import LocalStorage, local_storage
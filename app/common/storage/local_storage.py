@@ -0,0 +1,152 @@
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+from app.common.config import config
+
+
+class LocalStorage:
+    """
+    Class for persistent service data storage in local directory. Files are written to temporary file first
+    and replace old ones atomically, so readers never see partially written data
+    """
+
+    def __init__(self, root: str | Path) -> None:
+        """
+        Initialisation function
+
+        Args:
+            root (str | Path): Storage directory. Created on first write
+
+        Returns:
+            None
+        """
+
+        self.root = Path(root)
+
+    def path(self, key: str, suffix: str) -> Path:
+        """
+        Function returns file path for key
+
+        Args:
+            key (str): Storage key, "/" separates subdirectories
+            suffix (str): File suffix
+
+        Returns:
+            Path: File path
+        """
+
+        return self.root / f"{key}{suffix}"
+
+    def _write_atomic(self, path: Path, write) -> None:
+        """
+        Function writes file through temporary file in the same directory and replaces target file with it
+
+        Args:
+            path (Path): Target file path
+            write (Callable): Function writing data to opened binary file
+
+        Returns:
+            None
+        """
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+        try:
+            with os.fdopen(file_descriptor, "wb") as file:
+                write(file)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temporary_path, path)
+        except BaseException:
+            Path(temporary_path).unlink(missing_ok=True)
+            raise
+
+    def save_json(self, key: str, data: Any) -> None:
+        """
+        Function saves json serialisable data
+
+        Args:
+            key (str): Storage key
+            data (Any): Data to save
+
+        Returns:
+            None
+        """
+
+        self._write_atomic(
+            self.path(key, ".json"), lambda file: file.write(json.dumps(data, ensure_ascii=False).encode())
+        )
+
+    def load_json(self, key: str, default: Any = None) -> Any:
+        """
+        Function loads json data
+
+        Args:
+            key (str): Storage key
+            default (Any): Value to return if key is not stored. Default to None
+
+        Returns:
+            Any: Stored data or default
+        """
+
+        path = self.path(key, ".json")
+        if not path.exists():
+            return default
+        with path.open("rb") as file:
+            return json.loads(file.read())
+
+    def save_array(self, key: str, array: np.ndarray) -> None:
+        """
+        Function saves numpy array in npy format
+
+        Args:
+            key (str): Storage key
+            array (np.ndarray): Array to save
+
+        Returns:
+            None
+        """
+
+        self._write_atomic(self.path(key, ".npy"), lambda file: np.save(file, array, allow_pickle=False))
+
+    def load_array(self, key: str, max_age: float | None = None) -> np.ndarray | None:
+        """
+        Function loads numpy array
+
+        Args:
+            key (str): Storage key
+            max_age (float): Maximum file age in seconds. Default to None (any age)
+
+        Returns:
+            np.ndarray | None: Stored array or None if key is not stored or stored array is older than max_age
+        """
+
+        path = self.path(key, ".npy")
+        if not path.exists():
+            return None
+        if max_age is not None and time.time() - path.stat().st_mtime > max_age:
+            return None
+        return np.load(path, allow_pickle=False)
+
+    def delete(self, key: str) -> None:
+        """
+        Function deletes all files stored with key
+
+        Args:
+            key (str): Storage key
+
+        Returns:
+            None
+        """
+
+        for suffix in (".json", ".npy"):
+            self.path(key, suffix).unlink(missing_ok=True)
+
+
+local_storage = LocalStorage(config.get("STORAGE_PATH", ".storage"))
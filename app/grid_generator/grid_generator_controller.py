@@ -1,22 +1,70 @@
-import json
+from typing import Literal
 
-from fastapi import APIRouter
+import geopandas as gpd
+import orjson
+from fastapi import APIRouter, Query, Request, Response
 from loguru import logger
 
+from app.common import http_exception
+from app.common.compute import compute_executor
+from app.common.geojson import GeoJSONResponse, GeoJSONStreamingResponse, gdf_to_geojson_bytes
+from app.common.jobs import job_runner
 from .services import grid_generator_service
 
 
 grid_generator_router = APIRouter(prefix="/hex_generator", tags=["Grid Generation"])
 
+StreamFormat = Literal["geojson", "ndjson"] | None
+resolution_query = Query(
+    None,
+    ge=0,
+    le=10,
+    description="H3 resolution of grid. Default to 6, or 8 for special territories",
+)
+stream_query = Query(
+    None,
+    description="Stream grid by chunks as FeatureCollection (geojson) or one feature per line (ndjson)",
+)
+
+
+async def grid_response(
+        grid: gpd.GeoDataFrame,
+        request: Request,
+        stream: StreamFormat,
+) -> Response:
+    """
+    Function selects grid response type by requested stream format. Grid is built in full before response starts,
+    streaming only avoids building the whole serialized body in memory
+
+    Args:
+        grid (gpd.GeoDataFrame): Hexagonal grid
+        request (Request): Request to negotiate compression with
+        stream (StreamFormat): Stream format. None to return whole FeatureCollection at once
+
+    Returns:
+        Response: GeoJSON response
+    """
+
+    if stream is None:
+        return await compute_executor.run_in_thread(GeoJSONResponse, grid, request)
+    return GeoJSONStreamingResponse(grid, ndjson=stream == "ndjson")
+
 
 @grid_generator_router.get("/generate_full/{territory_id}")
-async def generate_grid_with_indicators_and_potentials(territory_id: int) -> dict:
+async def generate_grid_with_indicators_and_potentials(
+        territory_id: int,
+        request: Request,
+        resolution: int | None = resolution_query,
+        stream: StreamFormat = stream_query,
+) -> Response:
     """
     Generate grid with provided territory with indicators
 
     Parameters:
 
         - territory_id (int): Territory ID
+        - resolution (int): H3 resolution. Default to None (6, or 8 for special territories)
+        - stream (str): Stream format, geojson or ndjson. Default to None (whole FeatureCollection)
 
     Returns:
 
@@ -25,32 +73,59 @@ async def generate_grid_with_indicators_and_potentials(territory_id: int) -> dic
     logger.info(f"Started /hex_generator/generate_full/{territory_id}")
     result = await grid_generator_service.generate_grid_with_indicators(
         territory_id,
+        resolution=resolution,
     )
-    result = json.loads(result.to_json())
     logger.info(f"Finished /hex_generator/generate_full/{territory_id}")
-    return result
+    return await grid_response(result, request, stream)
 
 @grid_generator_router.put("/bound_indicators_to_hexes/{territory_id}")
-async def bound_indicators_to_hexes(territory_id: int) -> dict:
+async def bound_indicators_to_hexes(
+        territory_id: int,
+        background: bool = Query(False, description="Return upload job status without waiting for upload"),
+        restart: bool = Query(False, description="Recalculate indicators instead of continuing not finished upload"),
+) -> dict:
     """
-    Calculate and bound indicators to hexes in db
+    Calculate and bound indicators to hexes in db. Upload runs as resumable job, its progress is available
+    with /hex_generator/jobs/{job_id}
     """
 
     logger.info(f"Started /hex_generator/bound_indicators_to_hexes/{territory_id}")
     result = await grid_generator_service.bound_hexagons_indicators(
         territory_id,
+        background=background,
+        restart=restart,
     )
     logger.info(f"Finished /hex_generator/bound_indicators_to_hexes/{territory_id}")
     return result
 
+@grid_generator_router.get("/jobs/{job_id}")
+async def get_job_status(job_id: str) -> dict:
+    """
+    Get background job status and progress
+    """
+
+    status = job_runner.get_status(job_id)
+    if status is None:
+        raise http_exception(404, msg="Job not found", _input=job_id, _detail=None)
+    return status
+
 @grid_generator_router.post("/generate_to_db/{territory_id}")
-async def generate_grid_to_db(territory_id: int) -> dict:
+async def generate_grid_to_db(
+        territory_id: int,
+        resolution: int | None = resolution_query,
+        incremental: bool = Query(
+            False,
+            description="Delete only removed cells and post only new ones keeping unchanged hexes ids",
+        ),
+) -> dict:
     """
     Generate grid with provided territory id and save it to db
 
     Parameters:
 
         - territory_id (int): Territory ID
+        - resolution (int): H3 resolution. Default to None (6, or 8 for special territories)
+        - incremental (bool): Whether to update only changed cells. Default to False
 
     Returns:
 
@@ -58,26 +133,33 @@ async def generate_grid_to_db(territory_id: int) -> dict:
     """
 
     logger.info(f"Started /hex_generator/generate_to_db/{territory_id}")
-    grid = await grid_generator_service.generate_grid(territory_id)
+    grid = await grid_generator_service.generate_grid(territory_id, resolution=resolution)
     result = await grid_generator_service.save_new_hexagons(
         territory_id,
-        json.loads(grid.to_json())
+        orjson.loads(await compute_executor.run_in_thread(gdf_to_geojson_bytes, grid)),
+        incremental=incremental,
     )
     logger.info("Finished /hex_generator/generate_to_db/{territory_id}")
     return result
 
 @grid_generator_router.get("/generate/{territory_id}")
-async def generate_grid(territory_id: int) -> dict:
+async def generate_grid(
+        territory_id: int,
+        request: Request,
+        resolution: int | None = resolution_query,
+        stream: StreamFormat = stream_query,
+) -> Response:
     """
     Generate grid with provided territory id, calculate all indicators and profiles potentials and save it to db
 
     Parameters:
 
         - territory_id (int): Territory ID
+        - resolution (int): H3 resolution. Default to None (6, or 8 for special territories)
+        - stream (str): Stream format, geojson or ndjson. Default to None (whole FeatureCollection)
     """
 
     logger.info(f"Started /hex_generator/generate/{territory_id}")
-    result = await grid_generator_service.generate_grid(territory_id)
-    result = json.loads(result.to_json())
+    result = await grid_generator_service.generate_grid(territory_id, resolution=resolution)
     logger.info(f"Finished /hex_generator/generate/{territory_id}")
-    return result
+    return await grid_response(result, request, stream)
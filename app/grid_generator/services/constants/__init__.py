@@ -1 +1,8 @@
-from .constants import profiles
+from .constants import (
+    prioc_objects_indicators_names,
+    prioc_objects_types,
+    profiles,
+    profiles_criteria,
+    profiles_names,
+    profiles_thresholds,
+)
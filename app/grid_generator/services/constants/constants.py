@@ -1,11 +1,28 @@
 import json
 
+import numpy as np
+
 with open(
     "app/grid_generator/services/constants/profiles.json",
     encoding="utf-8",
 ) as profiles_file:
     profiles = json.load(profiles_file)
 
+# profiles criteria compiled to matrix with shape (profiles, criteria)
+profiles_names = list(profiles.keys())
+profiles_criteria = list(
+    dict.fromkeys(
+        criterion for profile in profiles.values() for criterion in profile["Критерии"]
+    )
+)
+profiles_thresholds = np.array(
+    [
+        [profiles[name]["Критерии"].get(criterion, np.nan) for criterion in profiles_criteria]
+        for name in profiles_names
+    ],
+    dtype="float64",
+)
+
 
 prioc_objects_types = [
     "Медицинский комплекс",
@@ -15,3 +32,13 @@ prioc_objects_types = [
     "Кампус университетский",
     "Тур база",
 ]
+
+# indicators names of prioc objects estimations in db
+prioc_objects_indicators_names = {
+    "Медицинский комплекс": "Медицинский комплекс",
+    "Бизнес-кластер": "Бизнес-кластер",
+    "Пром объект": "Промышленная зона",
+    "Логистическо-складской комплекс": "Логистический, складской комплекс",
+    "Кампус университетский": "Университетский кампус",
+    "Тур база": "Туристическая база",
+}
@@ -1,3 +1,8 @@
+import json
+import time
+
+import numpy as np
+from fastapi import HTTPException
 from loguru import logger
 
 from app.common import config, http_exception, tasks_api_handler, urban_api_handler
@@ -7,6 +12,23 @@ from app.common.api_handler.api_handler import (
     townsnet_api_handler,
     transport_frame_api_handler,
 )
+from app.prioc.services.hex_api_getter import hex_api_getter
+
+
+def json_default(value):
+    """
+    Function converts numpy scalars for json serialisation
+
+    Args:
+        value: Value not serialisable by json
+
+    Returns:
+        Python scalar of numpy value
+    """
+
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
 
 
 class GeneratorApiService:
@@ -28,6 +50,23 @@ class GeneratorApiService:
         self.pop_frame_extractor = pop_frame_api_handler
         self.eco_frame_extractor = eco_frame_api_handler
         self.max_async_extractions = int(config.get("MAX_API_ASYNC_EXTRACTIONS"))
+        self.bulk_upload_enabled = (
+            config.get("INDICATORS_BULK_UPLOAD", "false").lower() == "true"
+        )
+        self.bulk_batch_size = int(config.get("INDICATORS_BULK_BATCH_SIZE", "5000"))
+        self.bulk_url = config.get(
+            "INDICATORS_BULK_URL",
+            "/api/v1/scenarios/{scenario_id}/indicators_values/bulk",
+        )
+        self.hexagon_url = config.get("HEXAGON_URL", "/api/v1/hexagons/{hexagon_id}")
+        self.upload_stats = {
+            "batches": 0,
+            "bulk_items": 0,
+            "fallback_items": 0,
+            "bytes": 0,
+            "seconds": 0.0,
+            "max_batch_seconds": 0.0,
+        }
 
     async def get_territory_data(self, territory_id: int) -> dict | list:
         """
@@ -96,6 +135,27 @@ class GeneratorApiService:
             extra_url=f"{self.territory}/{territory_id}/hexagons"
         )
 
+    async def delete_hexes_by_ids(self, hexagons_ids: list[int]) -> None:
+        """
+        Function deletes hexes from db by their ids with MAX_API_ASYNC_EXTRACTIONS concurrent requests
+
+        Args:
+            hexagons_ids (list[int]): Hexagons ids to delete
+
+        Returns:
+            None
+        """
+
+        await tasks_api_handler.extract_requests_to_one_url(
+            func=self.urban_extractor.delete,
+            headers=self.headers,
+            data=[
+                {"extra_url": self.hexagon_url.format(hexagon_id=hexagon_id)}
+                for hexagon_id in hexagons_ids
+            ],
+            max_concurrent_requests=self.max_async_extractions,
+        )
+
     async def extract_all_indicators(self) -> dict | list:
 
         result = await self.urban_extractor.get(
@@ -103,7 +163,19 @@ class GeneratorApiService:
         )
         return result
 
-    async def put_hexagon_data(self, data_list: list[dict], scenario_id: int) -> None:
+    async def put_hexagon_data_by_item(
+        self, data_list: list[dict], scenario_id: int
+    ) -> None:
+        """
+        Function puts hexagons indicators values one by one
+
+        Args:
+            data_list (list[dict]): Indicators values to put
+            scenario_id (int): Scenario ID
+
+        Returns:
+            None
+        """
 
         extra_url = f"{self.scenarios}/{scenario_id}/indicators_values"
         list_to_extract = [
@@ -117,6 +189,101 @@ class GeneratorApiService:
                 data=chunk,
                 max_concurrent_requests=self.max_async_extractions,
             )
+        self.upload_stats["fallback_items"] += len(data_list)
+
+    async def put_hexagon_data(self, data_list: list[dict], scenario_id: int) -> dict:
+        """
+        Function puts hexagons indicators values in batches and drops cached scenario hexagons after writing.
+        Batch size is halved when upstream rejects payload size, and batches are put one by one when upstream
+        rejects bulk format.
+
+        Args:
+            data_list (list[dict]): Indicators values to put
+            scenario_id (int): Scenario ID
+
+        Returns:
+            dict: Upload summary with batches number, bytes and latency
+        """
+
+        try:
+            return await self.put_hexagon_data_by_batches(data_list, scenario_id)
+        finally:
+            hex_api_getter.invalidate_scenario(scenario_id)
+
+    async def put_hexagon_data_by_batches(self, data_list: list[dict], scenario_id: int) -> dict:
+        """
+        Function puts hexagons indicators values in batches with fallbacks described in put_hexagon_data
+
+        Args:
+            data_list (list[dict]): Indicators values to put
+            scenario_id (int): Scenario ID
+
+        Returns:
+            dict: Upload summary with batches number, bytes and latency
+        """
+
+        summary = {"items": len(data_list), "batches": 0, "bytes": 0, "seconds": 0.0}
+        if not self.bulk_upload_enabled:
+            await self.put_hexagon_data_by_item(data_list, scenario_id)
+            return summary
+
+        bulk_url = self.bulk_url.format(scenario_id=scenario_id)
+        batch_size = self.bulk_batch_size
+        position = 0
+        while position < len(data_list):
+            batch = data_list[position : position + batch_size]
+            body = json.dumps(batch, default=json_default).encode()
+            start = time.perf_counter()
+            try:
+                await self.urban_extractor.put(
+                    extra_url=bulk_url, data=body, headers=self.headers
+                )
+            except HTTPException as e:
+                if e.status_code == 413 and batch_size > 1:
+                    batch_size = max(1, batch_size // 2)
+                    logger.warning(
+                        f"Bulk batch is too large, retrying with batch size {batch_size}"
+                    )
+                    continue
+                if e.status_code in (404, 405, 501):
+                    self.bulk_upload_enabled = False
+                    logger.warning(
+                        f"Bulk indicators upload is not supported by {bulk_url}, switching to per item upload"
+                    )
+                    await self.put_hexagon_data_by_item(data_list[position:], scenario_id)
+                    break
+                if e.status_code not in (400, 415, 422):
+                    raise e
+                logger.warning(
+                    f"Bulk batch with {len(batch)} values was rejected with status {e.status_code}, "
+                    f"putting it per item"
+                )
+                await self.put_hexagon_data_by_item(batch, scenario_id)
+                position += len(batch)
+                continue
+
+            latency = time.perf_counter() - start
+            summary["batches"] += 1
+            summary["bytes"] += len(body)
+            summary["seconds"] += latency
+            self.upload_stats["batches"] += 1
+            self.upload_stats["bulk_items"] += len(batch)
+            self.upload_stats["bytes"] += len(body)
+            self.upload_stats["seconds"] += latency
+            self.upload_stats["max_batch_seconds"] = max(
+                self.upload_stats["max_batch_seconds"], latency
+            )
+            logger.info(
+                f"Uploaded batch {summary['batches']} for scenario {scenario_id}: "
+                f"{len(batch)} values, {len(body)} bytes in {latency:.2f}s"
+            )
+            position += len(batch)
+
+        logger.info(
+            f"Finished indicators upload for scenario {scenario_id}: {summary['batches']} batches, "
+            f"{summary['bytes']} bytes in {summary['seconds']:.2f}s"
+        )
+        return summary
 
     async def get_regional_base_scenario(self, territory_id: int) -> dict | list:
 
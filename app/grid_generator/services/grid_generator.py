@@ -1,12 +1,44 @@
+import asyncio
+
 import geopandas as gpd
-import h3
-from shapely.geometry import shape
+import numpy as np
+from h3.api import basic_int as h3_int
+
+from app.common.compute import compute_executor
+from app.common.hex_store import boundaries_to_polygons, cells_to_boundaries
 
 
 class GridGenerator:
+    """
+    Class for H3 hexagonal grids generation. Cells boundaries of large grids are collected in compute processes,
+    polygons are built in bulk outside event loop
+    """
 
     @staticmethod
+    async def cells_to_polygons(cells: np.ndarray) -> np.ndarray:
+        """
+        Function builds cells polygons without blocking event loop. Large cells sets are split between
+        compute processes
+
+        Args:
+            cells (np.ndarray): H3 cells ids as uint64
+
+        Returns:
+            np.ndarray: Shapely polygons in 4326 crs
+        """
+
+        chunks = await asyncio.gather(
+            *[
+                compute_executor.run(cells_to_boundaries, chunk, size=len(cells))
+                for chunk in np.array_split(cells, max(compute_executor.processes, 1))
+            ]
+        )
+        coordinates = np.concatenate([chunk[0] for chunk in chunks])
+        vertices_num = np.concatenate([chunk[1] for chunk in chunks])
+        return await compute_executor.run_in_thread(boundaries_to_polygons, coordinates, vertices_num)
+
     async def generate_hexagonal_grid(
+            self,
             territory: gpd.GeoDataFrame,
             size: int = 6,
     ) -> gpd.GeoDataFrame:
@@ -18,14 +50,19 @@ class GridGenerator:
             size (int, optional): Size of hexagonal grid. Defaults to 6.
 
         Returns:
-            gpd.GeoDataFrame: The generated hexagonal grid.
+            gpd.GeoDataFrame: The generated hexagonal grid with "h3_index" column, sorted by cells ids.
         """
 
         if territory.crs != 4326:
             territory.to_crs(4326, inplace=True)
-        cells = h3.geo_to_cells(territory.union_all(), res=size)
-        geometries = [shape(h3.cells_to_geo([cell])) for cell in cells]
-        result = gpd.GeoDataFrame(geometry=geometries, crs=territory.crs)
+        cells = await compute_executor.run_in_thread(h3_int.geo_to_cells, territory.union_all(), res=size)
+        cells = np.sort(np.fromiter(cells, dtype=np.uint64, count=len(cells)))
+        geometries = await self.cells_to_polygons(cells)
+        result = gpd.GeoDataFrame(
+            {"h3_index": [h3_int.int_to_str(int(cell)) for cell in cells]},
+            geometry=geometries,
+            crs=territory.crs,
+        )
         return result
 
 grid_generator = GridGenerator()
@@ -1,24 +1,166 @@
-import json
 import asyncio
+from itertools import islice
+from typing import Iterator
 
 import geopandas as gpd
+import numpy as np
+import orjson
 import pandas as pd
+from fastapi import HTTPException
+from h3.api import basic_int as h3_int
 from shapely.geometry import shape
 from loguru import logger
 
 from .generator_api_service import generator_api_service
 from .grid_generator import grid_generator
 from .potential_estimator import potential_estimator
-from .constants.constants import prioc_objects_types
+from .constants import profiles_names
+from .constants.constants import prioc_objects_indicators_names, prioc_objects_types
 from app.common import http_exception, params_validator, tasks_api_handler
+from app.common.cache import TTLLRUCache
+from app.common.compute import compute_executor
+from app.common.config import config
+from app.common.geojson import gdf_to_geojson_bytes
+from app.common.hex_store import HexStore, cells_within, features_to_cells
+from app.common.jobs import job_runner
+from app.common.storage import local_storage
+from app.prioc.services.hex_api_getter import hex_api_getter
 from app.prioc.services.prioc_service import prioc_service
 
 
+def iter_indicators_records(
+        hexagon_ids: np.ndarray,
+        indicators_ids: np.ndarray,
+        values: np.ndarray,
+        scenario_id: int,
+        start: int = 0,
+) -> Iterator[dict]:
+    """
+    Function yields hexagons indicators values records for not missing values in hexagons then indicators order
+
+    Args:
+        hexagon_ids (np.ndarray): Hexagons ids in values rows order
+        indicators_ids (np.ndarray): Indicators ids in values columns order
+        values (np.ndarray): Indicators values with row per hexagon and column per indicator
+        scenario_id (int): Scenario ID
+        start (int): Number of records to skip. Default to 0
+
+    Yields:
+        dict: Indicator value record
+    """
+
+    rows, columns = np.nonzero(~np.isnan(values))
+    for row, column in zip(rows[start:], columns[start:]):
+        yield {
+            "indicator_id": int(indicators_ids[column]),
+            "scenario_id": scenario_id,
+            "territory_id": None,
+            "hexagon_id": int(hexagon_ids[row]),
+            "value": float(values[row, column]),
+            "comment": "--",
+            "information_source": "hextech/grid_generator",
+            "properties": {}
+        }
+
+
 class GridGeneratorService:
     """
     Class for grid generation service logic
     """
 
+    def __init__(self):
+        """
+        Initialisation function for GridGeneratorService. Creates cache of grids indicators stores to aggregate
+        them to coarser resolutions without upstream evaluations
+        """
+
+        self.indicators_cache = TTLLRUCache(
+            name="grids_indicators",
+            ttl=int(config.get("GRID_INDICATORS_CACHE_TTL", "3600")),
+            max_size=int(config.get("GRID_INDICATORS_CACHE_MAX_SIZE", "16")),
+            max_memory=int(config.get("GRID_INDICATORS_CACHE_MAX_MEMORY_MB", "512")) * 1024 ** 2,
+            sizeof=lambda store: store.nbytes,
+        )
+        self.water_objects_ids = [45, 55]
+        self.upload_chunk_size = int(config.get("INDICATORS_UPLOAD_CHUNK_SIZE", "20000"))
+        self.water_mask_version = config.get("WATER_MASK_VERSION", "1")
+        self.water_mask_ttl = int(config.get("WATER_MASK_TTL", str(7 * 24 * 3600)))
+
+        job_runner.register("hexagons_indicators", self.upload_indicators_job)
+
+    @staticmethod
+    def get_default_resolution(territory_id: int) -> int:
+        """
+        Function returns default grid H3 resolution for territory
+
+        Args:
+            territory_id (int): Territory ID
+
+        Returns:
+            int: H3 resolution
+        """
+
+        if territory_id in [3268, 3138, 16141]:
+            return 8
+        return 6
+
+    async def get_water_cells(self, territory_id: int, resolution: int) -> np.ndarray:
+        """
+        Function returns H3 cells fully covered with water objects in territory. Cells are calculated from
+        dissolved water polygons and stored in local storage with water objects types ids and WATER_MASK_VERSION
+        in key. Stored masks are recalculated after WATER_MASK_TTL seconds or when version is increased
+
+        Args:
+            territory_id (int): Territory ID
+            resolution (int): H3 resolution
+
+        Returns:
+            np.ndarray: Sorted H3 cells ids as uint64
+        """
+
+        objects_key = "_".join(map(str, self.water_objects_ids))
+        key = f"water_cells/{territory_id}/{resolution}_{objects_key}_v{self.water_mask_version}"
+        water_cells = await compute_executor.run_in_thread(local_storage.load_array, key, self.water_mask_ttl)
+        if water_cells is not None:
+            return water_cells
+        logger.info(f"Calculating water cells for territory {territory_id} with resolution {resolution}")
+        water = await self.get_cleaning_gdf(territory_id, self.water_objects_ids)
+        polygons = water.geometry.values[water.geom_type.isin(["Polygon", "MultiPolygon"]).to_numpy()]
+        water_cells = await compute_executor.run(cells_within, np.asarray(polygons), resolution)
+        await compute_executor.run_in_thread(local_storage.save_array, key, water_cells)
+        return water_cells
+
+    def invalidate_indicators(self, territory_id: int) -> None:
+        """
+        Function drops cached grids indicators stores of territory
+
+        Args:
+            territory_id (int): Territory ID
+
+        Returns:
+            None
+        """
+
+        self.indicators_cache.invalidate(lambda key: key[0] == territory_id)
+
+    def get_finer_indicators_store(self, territory_id: int, resolution: int) -> HexStore | None:
+        """
+        Function finds cached grid indicators store with the nearest finer resolution
+
+        Args:
+            territory_id (int): Territory ID
+            resolution (int): Requested H3 resolution
+
+        Returns:
+            HexStore | None: Cached store or None if territory has no cached finer grids
+        """
+
+        for finer_resolution in range(resolution + 1, 16):
+            store = self.indicators_cache.get((territory_id, finer_resolution))
+            if store is not None:
+                return store
+        return None
+
     @staticmethod
     async def get_cleaning_gdf(
             territory_id: int,
@@ -50,21 +192,104 @@ class GridGeneratorService:
         return result
 
     @staticmethod
+    def diff_hexagons(
+            existing_features: list[dict],
+            new_features: list[dict],
+    ) -> tuple[list[int], list[dict], int] | None:
+        """
+        Function compares existing and new hexes by H3 cells. Existing hexes duplicating the same cell are
+        considered as removed
+
+        Args:
+            existing_features (list[dict]): Hexes features from db with "hexagon_id" properties
+            new_features (list[dict]): New grid features
+
+        Returns:
+            tuple[list[int], list[dict], int] | None: Ids of hexes to delete, features to post and number of
+            kept hexes or None if grids resolutions differ
+        """
+
+        existing_features = [
+            feature for feature in existing_features
+            if feature.get("geometry") is not None
+        ]
+        existing_cells, existing_resolution = features_to_cells(existing_features)
+        new_cells, new_resolution = features_to_cells(new_features)
+        if existing_features and new_features and existing_resolution != new_resolution:
+            return None
+        existing_ids = np.array(
+            [feature["properties"]["hexagon_id"] for feature in existing_features], dtype=np.int64
+        )
+        _, first_positions = np.unique(existing_cells, return_index=True)
+        is_first = np.zeros(len(existing_cells), dtype=bool)
+        is_first[first_positions] = True
+        kept = is_first & np.isin(existing_cells, new_cells)
+        is_new = ~np.isin(new_cells, existing_cells)
+        return (
+            existing_ids[~kept].tolist(),
+            [feature for feature, new in zip(new_features, is_new) if new],
+            int(kept.sum()),
+        )
+
     async def save_new_hexagons(
+            self,
             territory_id: int,
-            feature_collection_hexes: dict
-    ) -> dict[str, str]:
+            feature_collection_hexes: dict,
+            incremental: bool = False,
+    ) -> dict[str, str | int]:
         """
-        Function deletes old hexes from db in exists
+        Function deletes old hexes from db in exists. In incremental mode only hexes of new cells are posted
+        and then only hexes of removed cells are deleted, so ids and indicators of unchanged hexes stay stable.
+        Whole grid is rewritten if existing grid has other resolution or removed hexes can't be deleted
 
         Args:
             territory_id (int): Territory ID
             feature_collection_hexes (dict): Hexes to post
+            incremental (bool): Whether to update only changed cells. Default to False
 
         Returns:
             dict: with save info
         """
         existing_hexes = await generator_api_service.get_hexes_from_db(territory_id)
+        msg = """Successfully generated hexagonal grid and saved to db.
+            Check result with get method in urban_api (territory/{territory_id}/hexagons)"""
+        if incremental and existing_hexes["features"]:
+            diff = await compute_executor.run_in_thread(
+                self.diff_hexagons, existing_hexes["features"], feature_collection_hexes["features"]
+            )
+            if diff is not None:
+                ids_to_delete, hexes_to_write, kept = diff
+                logger.info(
+                    f"Updating grid for territory {territory_id}: {kept} hexes kept, "
+                    f"{len(ids_to_delete)} deleted, {len(hexes_to_write)} added"
+                )
+                # new hexes are posted first, so failed deletion never leaves territory with gaps
+                if hexes_to_write:
+                    await generator_api_service.post_hexes_to_db(
+                        territory_id=territory_id,
+                        json_data=hexes_to_write
+                    )
+                try:
+                    if ids_to_delete:
+                        await generator_api_service.delete_hexes_by_ids(ids_to_delete)
+                except HTTPException as e:
+                    logger.warning(
+                        f"Failed to delete removed hexes for territory {territory_id}: {e.detail}, "
+                        f"rewriting whole grid"
+                    )
+                else:
+                    await hex_api_getter.invalidate_territory(territory_id)
+                    self.invalidate_indicators(territory_id)
+                    return {
+                        "msg": msg,
+                        "kept": kept,
+                        "deleted": len(ids_to_delete),
+                        "added": len(hexes_to_write),
+                    }
+            else:
+                logger.info(
+                    f"Existing grid for territory {territory_id} has other resolution, rewriting whole grid"
+                )
         if existing_hexes["features"]:
             await generator_api_service.delete_old_hexes_from_db(territory_id)
         hexes_to_write = [hexagon for hexagon in feature_collection_hexes["features"]]
@@ -72,8 +297,8 @@ class GridGeneratorService:
             territory_id=territory_id,
             json_data=hexes_to_write
         )
-        msg = """Successfully generated hexagonal grid and saved to db.
-            Check result with get method in urban_api (territory/{territory_id}/hexagons)"""
+        await hex_api_getter.invalidate_territory(territory_id)
+        self.invalidate_indicators(territory_id)
         return {
             "msg": msg,
         }
@@ -81,14 +306,17 @@ class GridGeneratorService:
     async def generate_grid(
             self,
             territory_id,
-            pure: bool = False
+            pure: bool = False,
+            resolution: int | None = None,
     ) -> gpd.GeoDataFrame:
         """
-        Function generates hexagonal grid for provided territory.
+        Function generates hexagonal grid for provided territory. Pure grid is cleaned from hexes fully
+        within water objects by stored water cells mask.
 
         Args:
             territory_id (int): The territory to be generated on.
             pure (bool, optional): If True, grid will be cleaned from objects. Defaults to True.
+            resolution (int, optional): H3 resolution. Defaults to None (6, or 8 for special territories).
 
         Returns:
             dict: The generated hexagonal grid.
@@ -107,15 +335,16 @@ class GridGeneratorService:
         territory_data = await generator_api_service.get_territory_data(territory_id)
         territory = gpd.GeoDataFrame(geometry=[shape(territory_data["geometry"])], crs=4326)
         logger.info(f"Got geometry for territory with id {territory_id}, starting grid generation")
-        if territory_id in [3268, 3138, 16141]:
-            grid = await grid_generator.generate_hexagonal_grid(territory, size=8)
-        else:
-            grid = await grid_generator.generate_hexagonal_grid(territory)
+        if resolution is None:
+            resolution = self.get_default_resolution(territory_id)
+        grid = await grid_generator.generate_hexagonal_grid(territory, size=resolution)
         logger.info(f"Finished grid generation{territory_id}, starting grid clarification")
         if pure:
-            water = await self.get_cleaning_gdf(territory_id, [45, 55])
-            drop_index = grid.sjoin(water, predicate='within').index.to_list()
-            grid.drop(drop_index, inplace=True)
+            water_cells = await self.get_water_cells(territory_id, resolution)
+            cells = np.fromiter(
+                (h3_int.str_to_int(cell) for cell in grid["h3_index"]), dtype=np.uint64, count=len(grid)
+            )
+            grid = grid[~np.isin(cells, water_cells)]
         return grid
 
     @staticmethod
@@ -136,7 +365,7 @@ class GridGeneratorService:
 
         if grid.crs  != 4326:
             grid.to_crs(4326, inplace=True)
-        feature_collection_grid = json.loads(grid.to_json())
+        feature_collection_grid = orjson.loads(await compute_executor.run_in_thread(gdf_to_geojson_bytes, grid))
 
         available_regions = await params_validator.extract_current_regions()
         if territory_id not in available_regions:
@@ -180,12 +409,16 @@ class GridGeneratorService:
     async def generate_grid_with_indicators(
             self,
             territory_id: int,
+            resolution: int | None = None,
     ) -> gpd.GeoDataFrame | dict:
         """
-        Function generates hexagonal grid for provided territory and saves it to db.
+        Function generates hexagonal grid for provided territory and saves it to db. If grid with indicators
+        was generated for territory at finer resolution, its indicators are aggregated to cells of grid at
+        requested resolution instead of upstream evaluations, so grid cells don't depend on cache
 
         Args:
             territory_id (int): The territory to be generated on.
+            resolution (int, optional): H3 resolution. Defaults to None (6, or 8 for special territories).
 
         Returns:
             dict: The generated hexagonal grid in geojson format or dict with additional information.
@@ -200,17 +433,119 @@ class GridGeneratorService:
                 _detail={"available_territories": available_regions}
             )
 
-        grid = await self.generate_grid(territory_id)
-        grid_with_indicators = await self.calculate_grid_indicators(grid, territory_id)
+        if resolution is None:
+            resolution = self.get_default_resolution(territory_id)
+        finer_store = self.get_finer_indicators_store(territory_id, resolution)
+        if finer_store is not None:
+            logger.info(
+                f"Aggregating grid indicators for territory {territory_id} "
+                f"from resolution {finer_store.resolution} to {resolution}"
+            )
+            grid_with_indicators = await self.generate_grid(territory_id, resolution=resolution)
+            cells = np.fromiter(
+                (h3_int.str_to_int(cell) for cell in grid_with_indicators["h3_index"]),
+                dtype=np.uint64,
+                count=len(grid_with_indicators),
+            )
+            parents_store = await compute_executor.run_in_thread(finer_store.to_parents, resolution, cells)
+            grid_with_indicators[parents_store.indicators.columns] = parents_store.indicators.to_numpy()
+        else:
+            grid = await self.generate_grid(territory_id, resolution=resolution)
+            grid_with_indicators = await self.calculate_grid_indicators(grid, territory_id)
+            indicators_columns = [
+                column for column in grid_with_indicators.select_dtypes("number").columns
+                if column not in profiles_names
+            ]
+            self.indicators_cache.set(
+                (territory_id, resolution),
+                HexStore.from_gdf(grid_with_indicators, indicators_columns, resolution),
+            )
         grid_with_profiles = await potential_estimator.estimate_potentials(grid_with_indicators)
         return grid_with_profiles
 
+    async def upload_indicators_job(self, state: dict) -> None:
+        """
+        Function uploads hexagons indicators records stored for job by chunks from job checkpoint
+
+        Args:
+            state (dict): Job state with "scenario_id" in params
+
+        Returns:
+            None
+        """
+
+        job_id = state["job_id"]
+        hexagon_ids, indicators_ids, values = [
+            local_storage.load_array(f"jobs/{job_id}/{name}") for name in ("hexagon_ids", "indicators_ids", "values")
+        ]
+        records = iter_indicators_records(
+            hexagon_ids, indicators_ids, values, state["params"]["scenario_id"], start=state["done"]
+        )
+        done = state["done"]
+        try:
+            while chunk := list(islice(records, self.upload_chunk_size)):
+                await generator_api_service.put_hexagon_data(chunk, state["params"]["scenario_id"])
+                done += len(chunk)
+                await compute_executor.run_in_thread(job_runner.checkpoint, state, done)
+                logger.info(f"Job {job_id} uploaded {done}/{state['total']} indicators values")
+        finally:
+            self.invalidate_indicators(state["params"]["territory_id"])
+
     async def bound_hexagons_indicators(
             self,
-            territory_id: int
+            territory_id: int,
+            background: bool = False,
+            restart: bool = False,
     ) -> dict:
         """
-        Function wrights hexagons indicators to db
+        Function wrights hexagons indicators to db with resumable upload job. Not finished job for territory is
+        continued from its last checkpoint without indicators recalculation unless restart is requested
+
+        Args:
+            territory_id (int): Territory ID
+            background (bool): Whether to return job status without waiting for upload. Default to False
+            restart (bool): Whether to recalculate indicators instead of continuing not finished job.
+            Default to False
+
+        Returns:
+            dict: Upload message with job status or job status in background mode
+        """
+
+        job_id = f"hexagons_indicators_{territory_id}"
+        status = job_runner.get_status(job_id)
+        if job_runner.is_running(job_id):
+            task = job_runner.tasks[job_id]
+        elif status is not None and status["status"] == "running":
+            if background:
+                return status
+            raise http_exception(
+                409,
+                msg=f"Hexagons indicators upload for territory {territory_id} is running in other worker",
+                _input=territory_id,
+                _detail=status,
+            )
+        elif status is not None and status["status"] in ("failed", "interrupted") and not restart:
+            task = job_runner.resume(job_id)
+        else:
+            task = await self.start_indicators_upload_job(job_id, territory_id)
+        if background:
+            return job_runner.get_status(job_id)
+        await asyncio.shield(task)
+        return {
+            "msg": f"Successfully uploaded hexagons data for {territory_id}",
+            "job": job_runner.get_status(job_id),
+        }
+
+    async def start_indicators_upload_job(self, job_id: str, territory_id: int) -> asyncio.Task:
+        """
+        Function calculates hexagons indicators, stores them as arrays for upload job and starts it
+
+        Args:
+            job_id (str): Job id
+            territory_id (int): Territory ID
+
+        Returns:
+            asyncio.Task: Upload job task
         """
 
         regional_scenario = await generator_api_service.get_regional_base_scenario(territory_id)
@@ -218,27 +553,13 @@ class GridGeneratorService:
         grid = gpd.GeoDataFrame.from_features(hexagons_geojson, crs=4326)
         grid_with_indicators = await self.calculate_grid_indicators(grid, territory_id)
         bounded_hexagons = await potential_estimator.estimate_potentials(grid_with_indicators)
-        for i in prioc_objects_types:
-            current_object_hexes = await prioc_service.get_hexes_for_object_from_gdf(
-                hexes=bounded_hexagons,
-                territory_id=territory_id,
-                object_type=i
-            )
-            bounded_hexagons = pd.merge(
-                bounded_hexagons,
-                current_object_hexes[["hexagon_id", "weighted_sum"]],
-                on="hexagon_id", how="outer"
-            )
-            if i == "Пром объект":
-                bounded_hexagons.rename(columns={"weighted_sum": "Промышленная зона"}, inplace=True)
-            elif i == "Логистическо-складской комплекс":
-                bounded_hexagons.rename(columns={"weighted_sum": "Логистический, складской комплекс"}, inplace=True)
-            elif i == "Кампус университетский":
-                bounded_hexagons.rename(columns={"weighted_sum": "Университетский кампус"}, inplace=True)
-            elif i == "Тур база":
-                bounded_hexagons.rename(columns={"weighted_sum": "Туристическая база"}, inplace=True)
-            else:
-                bounded_hexagons.rename(columns={"weighted_sum": i}, inplace=True)
+        objects_hexes = await prioc_service.get_hexes_for_objects_from_gdf(
+            hexes=bounded_hexagons,
+            territory_id=territory_id,
+            object_types=prioc_objects_types,
+            columns_names=prioc_objects_indicators_names,
+        )
+        bounded_hexagons = bounded_hexagons.join(objects_hexes.drop(columns="hexagon_id"))
         full_map = await generator_api_service.extract_all_indicators()
         mapped_name_id = {}
         for item in full_map:
@@ -247,31 +568,21 @@ class GridGeneratorService:
             elif item["name_short"] in bounded_hexagons.columns:
                 mapped_name_id[item["name_short"]] = item["indicator_id"]
         bounded_hexagons.drop_duplicates("geometry", inplace=True)
-        df_to_put = bounded_hexagons.drop(columns=["geometry", "properties"])
-        columns_to_iter = list(df_to_put.drop(columns="hexagon_id").columns)
-        extract_list = []
-        failed_list = []
-        for index, row in df_to_put.iterrows():
-            for column in columns_to_iter:
-                if not pd.isna(row[column]):
-                    extract_list.append(
-                        {
-                        "indicator_id": int(mapped_name_id[column]),
-                        "scenario_id": regional_scenario,
-                        "territory_id": None,
-                        "hexagon_id": int(row["hexagon_id"]),
-                        "value": row[column],
-                        "comment": "--",
-                        "information_source": "hextech/grid_generator",
-                        "properties": {}
-                        }
-                    )
-
-        with open(f"failed_grid_indicators_list.json", "w") as f:
-            json.dump(failed_list, f)
-        await generator_api_service.put_hexagon_data(extract_list, regional_scenario)
-
-        return {"msg": f"Successfully uploaded hexagons data for {territory_id}"}
+        columns_to_put = [column for column in bounded_hexagons.columns if column in mapped_name_id]
+        values = bounded_hexagons[columns_to_put].to_numpy(dtype="float64", na_value=np.nan)
+        arrays = {
+            "hexagon_ids": bounded_hexagons["hexagon_id"].to_numpy(dtype=np.int64),
+            "indicators_ids": np.array([mapped_name_id[column] for column in columns_to_put], dtype=np.int64),
+            "values": values,
+        }
+        for name, array in arrays.items():
+            await compute_executor.run_in_thread(local_storage.save_array, f"jobs/{job_id}/{name}", array)
+        return job_runner.start(
+            kind="hexagons_indicators",
+            job_id=job_id,
+            total=int(np.count_nonzero(~np.isnan(values))),
+            params={"territory_id": territory_id, "scenario_id": regional_scenario},
+        )
 
 
 grid_generator_service = GridGeneratorService()
@@ -1,10 +1,18 @@
 from collections import ChainMap
 
 import geopandas as gpd
+import numpy as np
 import pandas as pd
 from loguru import logger
 
-from .constants import profiles
+from app.common.compute import compute_executor, count_passed_thresholds
+
+from .constants import (
+    profiles,
+    profiles_criteria,
+    profiles_names,
+    profiles_thresholds,
+)
 
 
 class PotentialEstimator:
@@ -88,21 +96,28 @@ class PotentialEstimator:
 
         return weights
 
-    async def estimate_potentials(self, hexes: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
-        logger.info(f"Started potential estimation with {len(hexes)} hexes")
-        result_list = []
-        drop_list = [
-            column
-            for column in ["geometry", "hexagon_id", "properties"]
-            if column in list(hexes.columns)
-        ]
-        hexes_df = hexes.drop(columns=drop_list)
-        for index, row in hexes_df.iterrows():
-            cur_potential = await self.estimate_potentials_as_dict(row.to_dict())
-            result_list.append(cur_potential)
+    @staticmethod
+    async def estimate_potentials(hexes: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
+        """
+        Function estimates profiles potentials for all hexes with one broadcast comparison
+        against profiles thresholds matrix
 
-        columns = list(profiles.keys())
-        hexes[columns] = pd.DataFrame.from_records(result_list)
+        Args:
+            hexes (gpd.GeoDataFrame): hexes with indicators values
+
+        Returns:
+            gpd.GeoDataFrame: hexes with potential value for each profile
+        """
+
+        logger.info(f"Started potential estimation with {len(hexes)} hexes")
+        present = np.array([criterion in hexes.columns for criterion in profiles_criteria])
+        criteria = [criterion for criterion in profiles_criteria if criterion in hexes.columns]
+        values = hexes[criteria].to_numpy(dtype="float64", na_value=np.nan)
+        thresholds = profiles_thresholds[:, present]
+        potentials = await compute_executor.run(count_passed_thresholds, values, thresholds, size=len(values))
+        hexes[profiles_names] = pd.DataFrame(
+            potentials, index=hexes.index, columns=profiles_names
+        )
         logger.info(f"Finished potential estimation with {len(hexes)} hexes")
 
         return hexes
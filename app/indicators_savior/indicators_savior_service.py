@@ -9,7 +9,10 @@ from app.indicators_savior.indicators_savior_services.indicators_savior_api_serv
 )
 from app.prioc.services import prioc_service
 
-from ..grid_generator.services.constants.constants import prioc_objects_types
+from ..grid_generator.services.constants.constants import (
+    prioc_objects_indicators_names,
+    prioc_objects_types,
+)
 from ..grid_generator.services.generator_api_service import generator_api_service
 from .indicators_savior_services.indicators_constants import objects_name_id_map
 
@@ -222,35 +225,13 @@ class IndicatorsSaviorService:
         bounded_hexagons = await potential_estimator.estimate_potentials(
             grid_with_indicators
         )
-        for i in prioc_objects_types:
-            current_object_hexes = await prioc_service.get_hexes_for_object_from_gdf(
-                hexes=bounded_hexagons, territory_id=territory_id, object_type=i
-            )
-            bounded_hexagons = pd.merge(
-                bounded_hexagons,
-                current_object_hexes[["hexagon_id", "weighted_sum"]],
-                on="hexagon_id",
-                how="outer",
-            )
-            if i == "Пром объект":
-                bounded_hexagons.rename(
-                    columns={"weighted_sum": "Промышленная зона"}, inplace=True
-                )
-            elif i == "Логистическо-складской комплекс":
-                bounded_hexagons.rename(
-                    columns={"weighted_sum": "Логистический, складской комплекс"},
-                    inplace=True,
-                )
-            elif i == "Кампус университетский":
-                bounded_hexagons.rename(
-                    columns={"weighted_sum": "Университетский кампус"}, inplace=True
-                )
-            elif i == "Тур база":
-                bounded_hexagons.rename(
-                    columns={"weighted_sum": "Туристическая база"}, inplace=True
-                )
-            else:
-                bounded_hexagons.rename(columns={"weighted_sum": i}, inplace=True)
+        objects_hexes = await prioc_service.get_hexes_for_objects_from_gdf(
+            hexes=bounded_hexagons,
+            territory_id=territory_id,
+            object_types=prioc_objects_types,
+            columns_names=prioc_objects_indicators_names,
+        )
+        bounded_hexagons = bounded_hexagons.join(objects_hexes.drop(columns="hexagon_id"))
         full_map = await generator_api_service.extract_all_indicators()
         mapped_name_id = {}
         for item in full_map:
@@ -1,6 +1,5 @@
 import asyncio
 
-import aiohttp
 import geopandas as gpd
 import pandas as pd
 from fastapi.exceptions import HTTPException
@@ -57,13 +56,11 @@ class IndicatorsSaviorApiService:
             None
         """
 
-        async with aiohttp.ClientSession() as session:
-            await urban_api_handler.put(
-                session=session,
-                extra_url=f"/api/v1/scenarios/{scenario_id}/indicators_values",
-                headers=self.headers,
-                data=json_data,
-            )
+        await urban_api_handler.put(
+            extra_url=f"/api/v1/scenarios/{scenario_id}/indicators_values",
+            headers=self.headers,
+            data=json_data,
+        )
 
     async def get_project_data(self, project_id: int) -> list | dict | None:
         """
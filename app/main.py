@@ -8,8 +8,13 @@ from iduconfig import Config
 from loguru import logger
 from otteroad import KafkaConsumerService, KafkaConsumerSettings
 
+from app.common.api_handler.api_handler import AsyncApiHandler
 from app.common.broker.broker_service import BrokerService
+from app.common.cache import TTLLRUCache
+from app.common.compute import compute_executor
 from app.common.exceptions.exception_handler import ExceptionHandlerMiddleware
+from app.common.jobs import job_runner
+from app.grid_generator.services.generator_api_service import generator_api_service
 
 from .grid_generator import grid_generator_router
 from .indicators_savior import indicators_savior_router
@@ -35,9 +40,14 @@ broker_service = BrokerService(config, broker_client)
 @asynccontextmanager
 async def lifespan(app: FastAPI):
 
+    await AsyncApiHandler.start_all()
     await broker_service.register_and_start()
+    await job_runner.resume_all()
     yield
+    await job_runner.stop()
     await broker_service.stop()
+    await AsyncApiHandler.close_all()
+    compute_executor.close()
 
 
 app = FastAPI(
@@ -69,6 +79,20 @@ async def get_logs():
     )
 
 
+@app.get("/metrics")
+async def get_metrics():
+    """
+    Get app runtime metrics
+    """
+
+    return {
+        "api_handlers": AsyncApiHandler.get_pools_stats(),
+        "indicators_upload": generator_api_service.upload_stats,
+        "caches": TTLLRUCache.get_caches_stats(),
+        "compute": compute_executor.get_stats(),
+    }
+
+
 app.include_router(prioc_router, prefix=config.get("FASTAPI_PREFIX"))
 app.include_router(grid_generator_router, prefix=config.get("FASTAPI_PREFIX"))
 app.include_router(limitations_router, prefix=config.get("FASTAPI_PREFIX"))
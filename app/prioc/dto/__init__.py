@@ -1,4 +1,5 @@
 from .hexes_dto import HexesDTO
+from .territories_dto import TerritoriesDTO
 from .territory_dto import TerritoryDTO
 
 prioc_objects_types = [
@@ -0,0 +1,37 @@
+import json
+from typing import Any, Literal
+
+from pydantic import BaseModel, Field
+
+from app.common.geometries import Geometry
+
+with open("app/prioc/dto/example_territory.json", "r") as et:
+    example_territory = json.load(et)
+
+example_territories = {
+    "type": "FeatureCollection",
+    "features": [
+        {"type": "Feature", "geometry": example_territory, "properties": {"project_id": 1}}
+    ],
+}
+
+
+class TerritoryFeature(BaseModel):
+
+    type: Literal["Feature"] = Field(..., description="GeoJSON feature type")
+    geometry: Geometry = Field(..., description="The territory polygon")
+    properties: dict[str, Any] = Field(default_factory=dict, description="Territory properties returned with result")
+
+
+class TerritoriesFeatureCollection(BaseModel):
+
+    type: Literal["FeatureCollection"] = Field(..., description="GeoJSON feature collection type")
+    features: list[TerritoryFeature] = Field(..., min_length=1, description="Territories to estimate")
+
+
+class TerritoriesDTO(BaseModel):
+
+    territory_id: int = Field(..., examples=[1], description="The id of the region territory")
+    territories: TerritoriesFeatureCollection = Field(
+        ..., examples=[example_territories], description="The territories polygons of one region"
+    )
@@ -1,10 +1,13 @@
-import json
 from typing import Annotated
 
+import geopandas as gpd
 from loguru import logger
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Request
 
-from .dto import HexesDTO, TerritoryDTO, prioc_objects_types
+from app.common.compute import compute_executor
+from app.common.geojson import GeoJSONResponse
+
+from .dto import HexesDTO, TerritoryDTO, TerritoriesDTO, prioc_objects_types
 from .services import prioc_service
 
 
@@ -18,8 +21,9 @@ async def get_prioc_objects_list():
 @prioc_router.get("/object")
 # @decorators.gdf_to_geojson
 async def get_object_hexes(
+        request: Request,
         hex_params: Annotated[HexesDTO, Depends(HexesDTO)]
-) -> dict:
+) -> GeoJSONResponse:
     """
     Calculate hexes to place priority objects with estimation value
     """
@@ -27,12 +31,13 @@ async def get_object_hexes(
     logger.info(f"Starting /prioc/object with prams {hex_params.__dict__}")
     result = await prioc_service.get_hexes_for_object(hex_params)
     logger.info(f"Finished /prioc/object with prams {hex_params.__dict__}")
-    return json.loads(result.to_json(to_wgs84=True))
+    return await compute_executor.run_in_thread(GeoJSONResponse, result, request, to_wgs84=True)
 
 @prioc_router.get("/cluster")
 async def get_hexes_clusters(
+        request: Request,
         hex_params: Annotated[HexesDTO, Depends(HexesDTO)]
-) -> dict:
+) -> GeoJSONResponse:
     """
     Calculate hexes clusters to place priority objects with estimation value
     """
@@ -40,7 +45,7 @@ async def get_hexes_clusters(
     logger.info(f"Starting /prioc/cluster with prams {hex_params.__dict__}")
     result = await prioc_service.get_hex_clusters_for_object(hex_params)
     logger.info(f"Finished /prioc/cluster with prams {hex_params.__dict__}")
-    return json.loads(result.to_json(to_wgs84=True))
+    return await compute_executor.run_in_thread(GeoJSONResponse, result, request, to_wgs84=True)
 
 @prioc_router.post("/territory")
 async def get_territory_value(
@@ -57,3 +62,30 @@ async def get_territory_value(
     )
     logger.info(f"Finished /prioc/territory with prams {territory_params.__dict__}")
     return result
+
+@prioc_router.post("/territories")
+async def get_territories_value(
+        territories_params: Annotated[TerritoriesDTO, Depends(TerritoriesDTO)],
+) -> list[dict]:
+    """
+    Calculate possible priority objects allocation for many territories of one region
+    """
+
+    features = territories_params.territories.features
+    logger.info(
+        f"Starting /prioc/territories with {len(features)} territories in region {territories_params.territory_id}"
+    )
+    territories = gpd.GeoDataFrame(
+        geometry=[feature.geometry.as_shapely_geometry() for feature in features], crs=4326
+    )
+    result = await prioc_service.get_territories_estimation(
+        territories=territories,
+        territory_id=territories_params.territory_id,
+    )
+    logger.info(
+        f"Finished /prioc/territories with {len(features)} territories in region {territories_params.territory_id}"
+    )
+    return [
+        {"properties": feature.properties, "estimation": estimation}
+        for feature, estimation in zip(features, result)
+    ]
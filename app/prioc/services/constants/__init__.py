@@ -1,6 +1,10 @@
 from .constants import (
     INDICATORS_WEIGHTS,
+    INDICATORS_WEIGHTS_VECTORS,
+    INDICATORS_WEIGHTS_MATRIX,
     OBJECT_INDICATORS_MIN_VAL,
+    OBJECT_INDICATORS_MIN_VAL_VECTORS,
+    OBJECT_INDICATORS_MIN_VAL_MATRIX,
     POSITIVE_SERVICE_CLEANING,
     NEGATIVE_SERVICE_CLEANING
 )
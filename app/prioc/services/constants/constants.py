@@ -1,5 +1,7 @@
 import json
 
+import pandas as pd
+
 
 with open(
         "app/prioc/services/constants/indicators_weights.json",
@@ -8,6 +10,25 @@ with open(
 ) as indicators_weights_file:
     INDICATORS_WEIGHTS = json.load(indicators_weights_file)
 
+
+def _ranks_to_weights(ranks: dict[str, int]) -> pd.Series:
+    """
+    Function converts indicators ranks to normalised weights, the first rank gets the biggest weight
+    """
+
+    n = len(ranks)
+    denominator = sum(n - rank + 1 for rank in ranks.values())
+    return pd.Series(
+        {indicator: (n - rank + 1) / denominator for indicator, rank in ranks.items()},
+        dtype="float64",
+    )
+
+
+INDICATORS_WEIGHTS_VECTORS = {
+    object_name: _ranks_to_weights(ranks)
+    for object_name, ranks in INDICATORS_WEIGHTS.items()
+}
+
 with open(
         "app/prioc/services/constants/object_indicators_min_val.json",
         "r",
@@ -15,6 +36,19 @@ with open(
 ) as object_indicators_min_val_file:
     OBJECT_INDICATORS_MIN_VAL = json.load(object_indicators_min_val_file)
 
+OBJECT_INDICATORS_MIN_VAL_VECTORS = {
+    object_name: pd.Series(min_values, dtype="float64")
+    for object_name, min_values in OBJECT_INDICATORS_MIN_VAL.items()
+}
+
+# objects x indicators matrices aligned by indicators, not ranked indicators get zero weight
+INDICATORS_WEIGHTS_MATRIX = pd.DataFrame(INDICATORS_WEIGHTS_VECTORS).T.fillna(0.0)
+OBJECT_INDICATORS_MIN_VAL_MATRIX = (
+    pd.DataFrame({object_name: OBJECT_INDICATORS_MIN_VAL_VECTORS[object_name] for object_name in INDICATORS_WEIGHTS})
+    .T.reindex(columns=INDICATORS_WEIGHTS_MATRIX.columns)
+    .fillna(0.0)
+)
+
 with open(
         "app/prioc/services/constants/positive_service_cleaning.json",
         "r",
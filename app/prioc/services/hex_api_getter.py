@@ -1,10 +1,18 @@
 import asyncio
+import hashlib
+import json
+from functools import partial
+from typing import Awaitable, Callable
 
 import geopandas as gpd
+import numpy as np
 import pandas as pd
+from loguru import logger
 from shapely.geometry import shape
 
 from app.common import config, urban_api_handler
+from app.common.cache import TTLLRUCache
+from app.common.hex_store import HexOutline, HexStore, features_to_cells
 
 bucket_name = config.get("FILESERVER_BUCKET_NAME")
 lo_hexes_filename= config.get("FILESERVER_LO_NAME")
@@ -17,6 +25,47 @@ indicators_names = ['Население',
 hexes_attributes_list = indicators_names + ["geometry"]
 
 
+def hexes_features_to_store(
+        features: list[dict],
+        indicators_names_list: list[str],
+) -> HexStore:
+    """
+    Function builds hexagons store directly from hexagons with indicators GeoJSON features without
+    intermediate GeoDataFrame. Features without geometry, id or any of indicators values are skipped
+
+    Args:
+        features (list[dict]): Hexagons GeoJSON features with "hexagon_id" and "indicators" properties
+        indicators_names_list (list[str]): Indicators names to keep
+
+    Returns:
+        HexStore: Hexagons store
+    """
+
+    indicators_positions = {name: position for position, name in enumerate(indicators_names_list)}
+    hexagon_ids = np.zeros(len(features), dtype=np.int64)
+    values = np.full((len(features), len(indicators_names_list)), np.nan, dtype="float64")
+    valid = np.ones(len(features), dtype=bool)
+    for row, feature in enumerate(features):
+        properties = feature.get("properties") or {}
+        if feature.get("geometry") is None or properties.get("hexagon_id") is None:
+            valid[row] = False
+            continue
+        hexagon_ids[row] = properties["hexagon_id"]
+        for indicator in properties.get("indicators") or []:
+            if not indicator:
+                continue
+            position = indicators_positions.get(indicator["name_full"])
+            if position is not None and indicator["value"] is not None:
+                values[row, position] = indicator["value"]
+    valid &= ~np.isnan(values).any(axis=1)
+    positions = np.flatnonzero(valid)
+    valid_features = [features[position] for position in positions]
+
+    cells, resolution = features_to_cells(valid_features)
+    indicators = pd.DataFrame(values[positions], columns=indicators_names_list)
+    return HexStore(cells, resolution, indicators, hexagon_ids[positions])
+
+
 class HexApiService:
     """Class for retrieving hexagons necessary data for priority objects calculations"""
 
@@ -40,35 +89,55 @@ class HexApiService:
         self.extractor = urban_api_handler
         self.scenarios_url = scenarios_url
         self.physical = physical
+        self.hexes_cache = TTLLRUCache(
+            name="regional_hexes",
+            ttl=int(config.get("HEXES_CACHE_TTL", "3600")),
+            max_size=int(config.get("HEXES_CACHE_MAX_SIZE", "16")),
+            max_memory=int(config.get("HEXES_CACHE_MAX_MEMORY_MB", "1024")) * 1024 ** 2,
+            sizeof=lambda store: store.nbytes,
+        )
+        self.outlines_cache = TTLLRUCache(
+            name="regional_outlines",
+            ttl=int(config.get("HEXES_CACHE_TTL", "3600")),
+            max_size=int(config.get("HEXES_CACHE_MAX_SIZE", "16")),
+            sizeof=lambda outline: outline.nbytes,
+        )
+        self.scenarios_versions: dict[int, int] = {}
+        self.outline_simplify_tolerance = float(config.get("HEXES_OUTLINE_SIMPLIFY_TOLERANCE", "0"))
+        self.services_cache = TTLLRUCache(
+            name="territory_services",
+            ttl=int(config.get("SERVICES_CACHE_TTL", "600")),
+            max_size=int(config.get("SERVICES_CACHE_MAX_SIZE", "512")),
+        )
+        self.services_semaphore = asyncio.Semaphore(int(config.get("SERVICES_FETCH_CONCURRENCY", "8")))
+        self.base_scenarios_cache = TTLLRUCache(
+            name="regional_base_scenarios",
+            ttl=int(config.get("HEXES_CACHE_TTL", "3600")),
+            max_size=1024,
+        )
 
-    # ToDo make more flexible
-    async  def get_hexes_with_indicators_by_territory(
+    async def fetch_cached_layer(
             self,
-            regional_scenario_id: int
+            cache_key: tuple,
+            fetch: Callable[[], Awaitable[gpd.GeoDataFrame]],
     ) -> gpd.GeoDataFrame:
         """
-        Function retrieves hexagons layer with indicators
+        Function retrieves objects layer from cache or with fetch function limited by fetch semaphore
+
         Args:
-            regional_scenario_id (int): Regional scenario ID
+            cache_key (tuple): Cache key of layer
+            fetch (Callable[[], Awaitable[gpd.GeoDataFrame]]): Function to retrieve layer from api
+
         Returns:
-            gpd.GeoDataFrame: Hexagons with indicators values as layers attributes in 4326 crs
+            gpd.GeoDataFrame: Objects layer. Shared cached object, should be copied before modification
         """
 
-        url = f"{self.scenarios_url}/{regional_scenario_id}/indicators_values/hexagons"
-        response = await self.extractor.get(
-            extra_url=url,
-        )
-        gdf = gpd.GeoDataFrame.from_features(response, crs=4326)
-        df_records = await asyncio.to_thread(
-            gdf["indicators"].apply,
-            func=lambda x: {i["name_full"] : i["value"] if i else None for i in x},
-        )
-        indicators_df = pd.DataFrame.from_records(df_records)
-        keep_columns = ["geometry", "hexagon_id"] + indicators_names
-        result = pd.concat([gdf, indicators_df], axis=1)
-        result = result[keep_columns]
-        result.dropna(inplace=True)
-        return result
+        layer = self.services_cache.get(cache_key)
+        if layer is None:
+            async with self.services_semaphore:
+                layer = await fetch()
+            self.services_cache.set(cache_key, layer)
+        return layer
 
     async def get_positive_service_by_territory_id(
             self,
@@ -76,7 +145,8 @@ class HexApiService:
             physical_object_ids=None
     ) -> gpd.GeoDataFrame | pd.DataFrame:
         """
-        Function retrieves intersecting physical objects geometries with provided territory geometry
+        Function retrieves intersecting physical objects geometries with provided territory geometry.
+        Object types are requested concurrently and cached by territory geometry and type id
 
         Args:
             territory_geometry (dict): Territory geometry
@@ -88,16 +158,29 @@ class HexApiService:
 
         if physical_object_ids is None:
             physical_object_ids = [45, 55]
-        physical_obj = []
-        for phys_id in physical_object_ids:
+
+        async def fetch_physical_objects(phys_id: int) -> gpd.GeoDataFrame:
             url = f"{self.physical}?physical_object_type_id={phys_id}"
             response = await self.extractor.post(
                 extra_url=url,
                 data=territory_geometry
             )
-            tmp_gdf = gpd.GeoDataFrame(geometry=[shape(i["geometry"]) for i in response], crs=4326)
-            physical_obj.append(tmp_gdf)
+            return gpd.GeoDataFrame(geometry=[shape(i["geometry"]) for i in response], crs=4326)
 
+        geometry_hash = hashlib.sha1(
+            json.dumps(territory_geometry, sort_keys=True, default=str).encode()
+        ).hexdigest()
+        physical_obj = await asyncio.gather(
+            *[
+                self.fetch_cached_layer(
+                    ("physical_objects", geometry_hash, phys_id),
+                    partial(fetch_physical_objects, phys_id),
+                )
+                for phys_id in physical_object_ids
+            ]
+        )
+        if not physical_obj:
+            return gpd.GeoDataFrame()
         result_gdf = pd.concat(physical_obj)
 
         if isinstance(result_gdf, gpd.GeoDataFrame):
@@ -113,7 +196,8 @@ class HexApiService:
             service_type_ids: list[int],
     ) -> gpd.GeoDataFrame | pd.DataFrame:
         """
-        Function retrieves negative services layer
+        Function retrieves negative services layer. Service types are requested concurrently and cached by
+        territory id and service type id
         Args:
             territory_id (integer): Territory ID
             service_type_ids (list[int]): Service type ids for retrieving
@@ -122,20 +206,28 @@ class HexApiService:
         """
 
         url = f"{self.territory_url}/{territory_id}/services_geojson"
-        result_gdf = gpd.GeoDataFrame()
-        for service_type_id in service_type_ids:
-            current_url = url
+
+        async def fetch_services(service_type_id: int) -> gpd.GeoDataFrame:
             response = await self.extractor.get(
-                extra_url=current_url,
+                extra_url=url,
                 params={
                     "service_type_id": service_type_id,
                     "cities_only": "false",
                     "centers_only": "true"
                 },
             )
+            return gpd.GeoDataFrame.from_features(response)
 
-            current_gdf = gpd.GeoDataFrame.from_features(response)
-            result_gdf = pd.concat([result_gdf, current_gdf])
+        services = await asyncio.gather(
+            *[
+                self.fetch_cached_layer(
+                    ("services", territory_id, service_type_id),
+                    partial(fetch_services, service_type_id),
+                )
+                for service_type_id in service_type_ids
+            ]
+        )
+        result_gdf = pd.concat([gpd.GeoDataFrame(), *services])
 
         if isinstance(result_gdf, gpd.GeoDataFrame):
             if not result_gdf.empty:
@@ -144,8 +236,79 @@ class HexApiService:
         result_gdf = gpd.GeoDataFrame()
         return result_gdf
 
-    @staticmethod
-    async def get_regional_base_scenario(territory_id: int) -> int:
+    async def get_hex_store_by_scenario(
+            self,
+            regional_scenario_id: int
+    ) -> HexStore:
+        """
+        Function retrieves hexagons with indicators as compact H3 cells store from cache or from api
+        Args:
+            regional_scenario_id (int): Regional scenario ID
+        Returns:
+            HexStore: Shared read only hexagons store
+        """
+
+        store = self.hexes_cache.get(regional_scenario_id)
+        if store is None:
+            version = self.scenarios_versions.get(regional_scenario_id, 0)
+            response = await self.extractor.get(
+                extra_url=f"{self.scenarios_url}/{regional_scenario_id}/indicators_values/hexagons",
+            )
+            store = await asyncio.to_thread(hexes_features_to_store, response["features"], indicators_names)
+            # store requested before scenario invalidation could contain outdated values and isn't cached
+            if self.scenarios_versions.get(regional_scenario_id, 0) == version:
+                self.hexes_cache.set(regional_scenario_id, store)
+        return store
+
+    async def get_hex_outline_by_scenario(
+            self,
+            regional_scenario_id: int
+    ) -> HexOutline:
+        """
+        Function retrieves dissolved hexagons outline with its GeoJSON from cache or builds it
+        Args:
+            regional_scenario_id (int): Regional scenario ID
+        Returns:
+            HexOutline: Shared regional hexagons outline
+        """
+
+        outline = self.outlines_cache.get(regional_scenario_id)
+        if outline is None:
+            version = self.scenarios_versions.get(regional_scenario_id, 0)
+            store = await self.get_hex_store_by_scenario(regional_scenario_id)
+            outline = await asyncio.to_thread(HexOutline.from_store, store, self.outline_simplify_tolerance)
+            if self.scenarios_versions.get(regional_scenario_id, 0) == version:
+                self.outlines_cache.set(regional_scenario_id, outline)
+        return outline
+
+    def invalidate_scenario(self, regional_scenario_id: int) -> None:
+        """
+        Function drops cached data for regional scenario. Should be called after scenario data is written, data
+        requested before the call isn't cached
+        Args:
+            regional_scenario_id (int): Regional scenario ID
+        Returns:
+            None
+        """
+
+        self.scenarios_versions[regional_scenario_id] = self.scenarios_versions.get(regional_scenario_id, 0) + 1
+        outline = self.outlines_cache.pop(regional_scenario_id)
+        if self.hexes_cache.pop(regional_scenario_id) is not None or outline is not None:
+            logger.info(f"Dropped cached hexagons for regional scenario {regional_scenario_id}")
+
+    async def invalidate_territory(self, territory_id: int) -> None:
+        """
+        Function drops cached data for regional base scenario of territory
+        Args:
+            territory_id (int): Territory ID
+        Returns:
+            None
+        """
+
+        base_scenario_id = await self.get_regional_base_scenario(territory_id)
+        self.invalidate_scenario(base_scenario_id)
+
+    async def get_regional_base_scenario(self, territory_id: int) -> int:
         """
         Function retrieves regional base scenario by territory id
         Args:
@@ -154,14 +317,19 @@ class HexApiService:
             int: Base scenario
         """
 
-        response = await urban_api_handler.get(
+        base_scenario_id = self.base_scenarios_cache.get(territory_id)
+        if base_scenario_id is not None:
+            return base_scenario_id
+        response = await self.extractor.get(
             extra_url="/api/v1/scenarios",
             params={
                 "territory_id": territory_id,
                 "is_based": "true"
             }
         )
-        return response[0]["scenario_id"]
+        base_scenario_id = response[0]["scenario_id"]
+        self.base_scenarios_cache.set(territory_id, base_scenario_id)
+        return base_scenario_id
 
 
 hex_api_getter = HexApiService()
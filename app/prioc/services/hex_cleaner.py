@@ -1,7 +1,11 @@
+from typing import Hashable
+
 import geopandas as gpd
+import numpy as np
 import pandas as pd
 
-from app.prioc.services.constants.constants import OBJECT_INDICATORS_MIN_VAL
+from app.common.hex_store import HexStore
+from app.prioc.services.constants.constants import OBJECT_INDICATORS_MIN_VAL_VECTORS
 
 
 class HexCleaner:
@@ -10,128 +14,105 @@ class HexCleaner:
     """
 
     @staticmethod
-    async def negative_clean(
-            hexagons: gpd.GeoDataFrame,
+    def negative_clean_cells(
+            store: HexStore,
             negative_services: gpd.GeoDataFrame,
-    ) -> gpd.GeoDataFrame:
+            ring_size: int = 1,
+    ) -> np.ndarray:
         """
-        Function cleans data from neighbour hexes containing services
+        Function marks store hexes remaining after excluding hexes containing services and their neighbours
+        within ring size. Neighbours are found by H3 cells ids without geometries
 
         Args:
-            hexagons (gpd.GeoDataFrame): hexes
+            store (HexStore): hexes store
             negative_services (gpd.GeoDataFrame): services to exclude
+            ring_size (int): number of neighbour rings to exclude around service hexes. Defaults to 1
 
         Returns:
-            gpd.GeoDataFrame: cleaned hexes
+            np.ndarray: boolean mask of remaining hexes
         """
 
         if negative_services.empty:
-            return hexagons
-
-        negative_services["is_service"] = 1
-        service_hexes = hexagons.sjoin(negative_services)
-        service_hexes = service_hexes[service_hexes["is_service"] == 1].drop_duplicates("geometry")
-        drop_list = service_hexes.index.to_list()
-
-        for index, row in service_hexes.iterrows():
-            current_hex_geom = row['geometry']
-            neighbours = hexagons[current_hex_geom.touches(hexagons.geometry)]
-            drop_list = drop_list + neighbours.index.to_list()
-
-        drop_list = list(set(drop_list))
-        cleaned = hexagons[~hexagons.index.isin(drop_list)].copy()
-        return cleaned
+            return np.ones(len(store), dtype=bool)
+        service_positions = store.points_to_positions(negative_services.geometry)
+        return ~store.ring_mask(service_positions, ring_size)
 
     @staticmethod
-    async def positive_clean(
-            hexagons: gpd.GeoDataFrame,
+    def positive_clean_cells(
+            store: HexStore,
             positive_objects: gpd.GeoDataFrame,
-    ) -> gpd.GeoDataFrame:
+    ) -> np.ndarray:
         """
-        Function cleans data from neighbour hexes not containing objects
+        Function marks store hexes intersecting objects
 
         Args:
-            hexagons (gpd.GeoDataFrame): hexes
+            store (HexStore): hexes store
             positive_objects (gpd.GeoDataFrame): objects to include
 
         Returns:
-            gpd.GeoDataFrame: cleaned hexes
+            np.ndarray: boolean mask of remaining hexes
         """
 
-        positive_objects["service_id"] = True
         if positive_objects.empty:
-            return hexagons
-        cleaned_hexes = gpd.sjoin(positive_objects, hexagons, how='right')
-        cleaned_hexes.dropna(subset="service_id", inplace=True)
-
-        return cleaned_hexes
+            return np.ones(len(store), dtype=bool)
+        keep_mask = np.zeros(len(store), dtype=bool)
+        for geometry in positive_objects.to_crs(4326).geometry:
+            keep_mask[store.positions_intersecting(geometry)] = True
+        return keep_mask
 
     @staticmethod
-    async def clean_estimation_dict_by_territory(
-            territory: gpd.GeoDataFrame,
-            positive_services: gpd.GeoDataFrame | None,
-            negative_services: gpd.GeoDataFrame | None,
-    ) -> bool:
+    def find_services_in_territories(
+            territories: gpd.GeoDataFrame,
+            services_layers: dict[Hashable, gpd.GeoDataFrame],
+    ) -> set[tuple[int, Hashable]]:
         """
-        Function cleans estimations from inappropriate evaluations
+        Function finds services layers intersecting territories with one spatial index built for all layers
 
         Args:
-            territory (gpd.GeoDataFrame): territory hexes united in one polygon
-            positive_services (gpd.GeoDataFrame): services which must be included
-            negative_services (gpd.GeoDataFrame): services to exclude
+            territories (gpd.GeoDataFrame): territories geometries
+            services_layers (dict[Hashable, gpd.GeoDataFrame]): services layers by their keys
 
         Returns:
-            bool: Drop key or not
+            set[tuple[int, Hashable]]: pairs of territory position and key of layer with services within territory
         """
 
-        if isinstance(positive_services, gpd.GeoDataFrame):
-            if positive_services.empty:
-                return True
-            positive_services["is_service"] = 1
-            check = territory.sjoin(positive_services)
-            if "is_service" in list(check.columns):
-                return False
-        if isinstance(negative_services, gpd.GeoDataFrame):
-            if negative_services.empty:
-                return False
-            negative_services["is_service"] = 1
-            check = territory.sjoin(negative_services)
-            if "is_service" in list(check.columns):
-                return True
-        return False
+        layers = [
+            gpd.GeoDataFrame(
+                {"layer_key": [key] * len(layer)}, geometry=layer.geometry.values, crs=layer.crs
+            ).to_crs(territories.crs)
+            for key, layer in services_layers.items()
+            if isinstance(layer, gpd.GeoDataFrame) and not layer.empty
+        ]
+        if not layers:
+            return set()
+        services = pd.concat(layers, ignore_index=True)
+        territories_positions, services_positions = services.sindex.query(
+            territories.geometry.values, predicate="intersects"
+        )
+        return set(
+            zip(territories_positions.tolist(), services["layer_key"].iloc[services_positions])
+        )
 
     @staticmethod
-    def clean_by_min_object_val(
-            hexagons: gpd.GeoDataFrame,
+    def min_object_val_mask(
+            hexagons: pd.DataFrame,
             object_name: str
-    ) -> gpd.GeoDataFrame:
+    ) -> np.ndarray:
         """
-        Deletes hexagons with tiny indicators values
+        Function marks hexagons without tiny indicators values
 
         Args:
-            hexagons (gpd.GeoDataFrame): hexes
+            hexagons (pd.DataFrame): hexes indicators
             object_name (str): object name
 
         Returns:
-            gpd.GeoDataFrame: cleaned hexes
+            np.ndarray: boolean mask of remaining hexes
         """
 
-        def clean_row(
-                row: pd.Series,
-                min_map: dict[str, int],
-        ) -> bool:
-
-            for key in list(min_map.keys()):
-                if row[key] < min_map[key]:
-                    return False
-            return True
-
-        values = OBJECT_INDICATORS_MIN_VAL[object_name]
-        hexagons = hexagons.copy()
-        hexagons["mask"] = hexagons.apply(clean_row, min_map=values, axis=1)
-        hexagons = hexagons[hexagons["mask"] > 0]
-        hexagons.drop(columns="mask", inplace=True)
-        return hexagons
+        thresholds = OBJECT_INDICATORS_MIN_VAL_VECTORS[object_name]
+        # rows with missing values are kept as before, only values below min drop hexagon
+        below_min = (hexagons[thresholds.index] < thresholds).any(axis=1)
+        return ~below_min.to_numpy()
 
 
 hex_cleaner = HexCleaner()
@@ -1,72 +1,107 @@
-import asyncio
-
 import geopandas as gpd
 import numpy as np
-import hdbscan
-import networkx as nx
 import pandas as pd
+from h3.api import basic_int as h3_int
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
 
-from app.prioc.services.constants.constants import INDICATORS_WEIGHTS
+from app.common.compute import compute_executor, fit_predict_clusters
+from app.common.hex_store import cells_neighbour_pairs
+from app.prioc.services.constants.constants import INDICATORS_WEIGHTS_MATRIX
 
 
-class HexEstimator:
+def largest_neighbour_groups_mask(
+        clusters: np.ndarray,
+        left: np.ndarray,
+        right: np.ndarray,
+) -> np.ndarray:
     """
-    Class for calculating priority objects values in hexes
+    Function marks hexes of the biggest neighbour group in each cluster. Neighbour groups are connected components
+    of hexes adjacency restricted to hexes from the same cluster
+
+    Args:
+        clusters (np.ndarray): Hexes clusters labels
+        left (np.ndarray): Positions of left hexes of adjacent pairs
+        right (np.ndarray): Positions of right hexes of adjacent pairs
+
+    Returns:
+        np.ndarray: Boolean mask of hexes to keep
     """
 
-    def __init__(self):
-        """
-        Initialisation function for HexEstimator
-        """
+    same_cluster = clusters[left] == clusters[right]
+    left, right = left[same_cluster], right[same_cluster]
+    hexes_num = len(clusters)
+    adjacency = coo_matrix(
+        (np.ones(left.size, dtype=bool), (left, right)), shape=(hexes_num, hexes_num)
+    )
+    _, components = connected_components(adjacency, directed=False)
+    # hexes without neighbours in their cluster are not considered as a group
+    has_neighbours = np.zeros(hexes_num, dtype=bool)
+    has_neighbours[left] = True
+    components_sizes = (
+        pd.DataFrame({"cluster": clusters, "component": components})[has_neighbours]
+        .groupby(["cluster", "component"])
+        .size()
+        .reset_index(name="size")
+    )
+    largest_components = components_sizes.sort_values(
+        "size", ascending=False, kind="stable"
+    ).drop_duplicates("cluster")["component"]
+    return has_neighbours & np.isin(components, largest_components)
+
+
+def cells_largest_neighbour_groups_mask(cells: np.ndarray, clusters: np.ndarray) -> np.ndarray:
+    """
+    Function marks hexes of the biggest neighbour group in each cluster with adjacency from H3 cells ids
 
-        self.clusterer = hdbscan.HDBSCAN(
-            min_cluster_size=3,
-            min_samples=3,
-            max_cluster_size=15
-        )
+    Args:
+        cells (np.ndarray): H3 cells ids as uint64
+        clusters (np.ndarray): Hexes clusters labels
+
+    Returns:
+        np.ndarray: Boolean mask of hexes to keep
+    """
+
+    left, right = cells_neighbour_pairs(cells)
+    return largest_neighbour_groups_mask(clusters, left, right)
+
+
+class HexEstimator:
+    """
+    Class for calculating priority objects values in hexes
+    """
 
     @staticmethod
-    async def weight_hexes(
-            hexagons: gpd.GeoDataFrame,
-            service_name: str
-    ) -> gpd.GeoDataFrame:
+    def weight_hexes_by_objects(
+            hexagons: pd.DataFrame,
+            services_names: list[str],
+    ) -> pd.DataFrame:
         """
-        Function calculates hexagons weighted estimation for provided service
+        Function calculates hexagons weighted estimation for many services with one matrix product
 
         Args:
-            hexagons (gpd.GeoDataFrame): GeoDataFrame with acceptable hexagons
-            service_name (str): Name of service
+            hexagons (pd.DataFrame): Hexagons indicators
+            services_names (list[str]): Names of services
 
         Returns:
-            gpd.GeoDataFrame: GeoDataFrame with weighted hexagons
+            pd.DataFrame: Weighted estimations with column per service aligned with hexagons
         """
 
-        hexagons["weighted_sum"] = None
-        indicators_names = list(INDICATORS_WEIGHTS[service_name].keys())
-        ranks = INDICATORS_WEIGHTS[service_name]
-        n = len(ranks)
-        weights = {}
-        for indicator, rank in ranks.items():
-            denominator = sum([n - rank + 1 for rank in ranks.values()])
-            weights[indicator] = (n - rank + 1) / denominator
-        for index, row in hexagons.iterrows():
-            total_score = 0
-            for indicator_name in row.keys():
-                if indicator_name in indicators_names:
-                    weight = weights[indicator_name]
-                    score = row[indicator_name]
-                    total_score += score * weight
-                    hexagons.at[index, "weighted_sum"] = total_score
-
-        return hexagons
-
-    # ToDo rewrite and make faster
+        weights = INDICATORS_WEIGHTS_MATRIX.loc[services_names]
+        weights = weights.loc[:, weights.columns.isin(hexagons.columns)]
+        values = hexagons[weights.columns].to_numpy(dtype="float64", na_value=np.nan)
+        return pd.DataFrame(
+            values @ weights.to_numpy().T, index=hexagons.index, columns=services_names
+        )
+
     @staticmethod
     async def clarify_clusters(
             clustered_hexagons: gpd.GeoDataFrame
     ) -> gpd.GeoDataFrame:
         """
-        Function detects the biggest neighbour group in clusters and unites them in one geometry
+        Function detects the biggest neighbour group in clusters and unites them in one geometry.
+        Neighbour groups are connected components of hexes adjacency restricted to hexes from the same cluster.
+        Adjacency is taken from H3 cells ids if "h3_index" column exists, otherwise from spatial index self join
 
         Args:
             clustered_hexagons (gpd.GeoDataFrame): GeoDataFrame with clustered hexagons
@@ -76,22 +111,25 @@ class HexEstimator:
         """
         if len(clustered_hexagons["cluster"].unique()) == 1:
             return clustered_hexagons
-        grouped = gpd.GeoDataFrame()
-        for cluster in list(clustered_hexagons.cluster.unique()):
-            tmp_gdf = clustered_hexagons[clustered_hexagons.cluster == cluster]
-            G = nx.Graph()
-            for i, poly in enumerate(tmp_gdf["geometry"]):
-                for j, poly2 in enumerate(tmp_gdf["geometry"]):
-                    if i != j and poly.touches(poly2):
-                        G.add_edge(i, j)
-
-            components = list(nx.connected_components(G))
-            if components:
-                largest_component = max(components, key=len)
-                largest_geometries = tmp_gdf.iloc[list(largest_component)]
-                grouped = pd.concat([grouped, largest_geometries])
-
-        dissolved = grouped.dissolve(by=["cluster"], aggfunc="mean")
+        clusters = clustered_hexagons["cluster"].to_numpy()
+        if "h3_index" in clustered_hexagons.columns:
+            cells = np.fromiter(
+                (h3_int.str_to_int(cell) for cell in clustered_hexagons["h3_index"]),
+                dtype=np.uint64,
+                count=len(clustered_hexagons),
+            )
+            keep_mask = await compute_executor.run(
+                cells_largest_neighbour_groups_mask, cells, clusters, size=len(cells)
+            )
+            clustered_hexagons = clustered_hexagons.drop(columns="h3_index")
+        else:
+            left, right = await compute_executor.run_in_thread(
+                clustered_hexagons.sindex.query, clustered_hexagons.geometry.values, predicate="touches"
+            )
+            keep_mask = largest_neighbour_groups_mask(clusters, left, right)
+        grouped = clustered_hexagons[keep_mask]
+
+        dissolved = await compute_executor.run_in_thread(grouped.dissolve, by=["cluster"], aggfunc="mean")
         dissolved.drop(columns=["X", "Y"], inplace=True)
         dissolved["cluster"] = dissolved.index.copy()
         dissolved.reset_index(inplace=True, drop=True)
@@ -116,7 +154,7 @@ class HexEstimator:
         weighted_hexagons["X"] = weighted_hexagons.centroid.x
         weighted_hexagons["Y"] = weighted_hexagons.centroid.y
         X = np.hstack([weighted_hexagons[["X", "Y", "weighted_sum"]].values])
-        weighted_hexagons["cluster"] = await asyncio.to_thread(self.clusterer.fit_predict, X=X)
+        weighted_hexagons["cluster"] = await compute_executor.run(fit_predict_clusters, X, size=len(X))
         united_clusters = await self.clarify_clusters(weighted_hexagons)
         united_clusters.to_crs(4326, inplace=True)
         return united_clusters
@@ -1,11 +1,15 @@
-import math
 import asyncio
+import math
 
 import geopandas as gpd
-from shapely.geometry import shape
+import numpy as np
+import pandas as pd
+from shapely.geometry import mapping, shape
 
+from app.common import config
+from app.common.hex_store import HexOutline, HexStore, cells_to_polygons
 from app.prioc.dto.hexes_dto import HexesDTO
-from .hex_api_getter import  hex_api_getter
+from .hex_api_getter import hex_api_getter, indicators_names
 from .hex_cleaner import hex_cleaner
 from .hex_estimator import hex_estimator
 from .territory_estimator import territory_estimator
@@ -15,60 +19,107 @@ from app.prioc.services.constants.constants import POSITIVE_SERVICE_CLEANING, NE
 class PriocService:
     """Class for handling priority objects calculations"""
 
-    @staticmethod
+    def __init__(self):
+        """
+        Initialization function
+        """
+
+        self.negative_clean_ring_size = int(config.get("NEGATIVE_CLEAN_RING_SIZE", "1"))
+
+    async def estimate_hex_store(
+            self,
+            store: HexStore,
+            territory_id: int,
+            object_types: list[str],
+            regional_scenario_id: int | None = None,
+    ) -> pd.DataFrame:
+        """
+        Function cleans store hexes for objects use and calculates their estimation for all objects at once.
+        Services for all objects are fetched once and their cleaning masks are shared between objects. Negative
+        services exclude hexes within NEGATIVE_CLEAN_RING_SIZE rings around them
+
+        Args:
+            store (HexStore): Hexes store
+            territory_id (int): Region territory id
+            object_types (list[str]): Object types as str
+            regional_scenario_id (int): Regional scenario id of store to use cached outline. Default to None
+            (outline is built from store)
+
+        Returns:
+            pd.DataFrame: Weighted sums with column per object type in store positions order,
+            hexes cleaned for object are NaN
+        """
+
+        positive_objects = [key for key in object_types if POSITIVE_SERVICE_CLEANING.get(key)]
+        negative_services_ids = sorted(
+            {i for key in object_types for i in NEGATIVE_SERVICE_CLEANING.get(key) or []}
+        )
+        services_requests = [
+            hex_api_getter.get_negative_service_by_territory_id(territory_id, [i]) for i in negative_services_ids
+        ]
+        if positive_objects:
+            if regional_scenario_id is None:
+                store_outline = await asyncio.to_thread(HexOutline.from_store, store)
+            else:
+                store_outline = await hex_api_getter.get_hex_outline_by_scenario(regional_scenario_id)
+            # positive cleaning keeps hexes intersecting default water objects
+            services_requests.append(hex_api_getter.get_positive_service_by_territory_id(store_outline.geojson))
+        services_layers = await asyncio.gather(*services_requests)
+        negative_masks = {
+            i: hex_cleaner.negative_clean_cells(store, layer, self.negative_clean_ring_size)
+            for i, layer in zip(negative_services_ids, services_layers)
+            if not layer.empty
+        }
+        positive_mask = None
+        if positive_objects and not services_layers[-1].empty:
+            positive_mask = hex_cleaner.positive_clean_cells(store, services_layers[-1])
+
+        estimated_hexes = hex_estimator.weight_hexes_by_objects(store.indicators, object_types)
+        for object_type in object_types:
+            keep_mask = hex_cleaner.min_object_val_mask(store.indicators, object_type)
+            object_negative_masks = [
+                negative_masks[i] for i in NEGATIVE_SERVICE_CLEANING.get(object_type) or [] if i in negative_masks
+            ]
+            # negative cleaning starts from not cleaned hexes, so it replaces positive cleaning result
+            if object_negative_masks:
+                keep_mask &= np.logical_and.reduce(object_negative_masks)
+            elif positive_mask is not None and object_type in positive_objects:
+                keep_mask &= positive_mask
+            estimated_hexes.loc[~keep_mask, object_type] = np.nan
+
+        return estimated_hexes
+
     async def get_hexes_for_object(
-        hex_params: HexesDTO,
+            self,
+            hex_params: HexesDTO,
+            keep_cells: bool = False,
     ) -> gpd.GeoDataFrame:
         """
         Generate hexes with estimation for object use
 
         Args:
             hex_params (HexesDTO): Hexes query parameters
+            keep_cells (bool): Whether to keep "h3_index" column used for clustering. Default to False
 
         Returns:
-            gpd.GeoDataFrame: Layer with calculated hexes values
+            gpd.GeoDataFrame: Layer with calculated hexes values in 4326 crs
         """
 
         regional_base_scenario = await hex_api_getter.get_regional_base_scenario(hex_params.territory_id)
-        hexes = await hex_api_getter.get_hexes_with_indicators_by_territory(regional_base_scenario)
-        hexes_local_crs = hexes.estimate_utm_crs()
-        hexes.to_crs(hexes_local_crs, inplace=True)
-        positive_services_list = POSITIVE_SERVICE_CLEANING.get(hex_params.object_type)
-        cleaned_hexes = hexes.copy()
-        if positive_services_list:
-            positive_services = await hex_api_getter.get_positive_service_by_territory_id(
-                gpd.GeoDataFrame(geometry=[hexes.union_all()], crs=hexes_local_crs).to_crs(4326).to_geo_dict()["features"][0]["geometry"],
-            )
-            if not positive_services.empty:
-                positive_services.to_crs(hexes_local_crs, inplace=True)
-                cleaned_hexes = await hex_cleaner.positive_clean(
-                    cleaned_hexes,
-                    positive_services
-                )
-        negative_services_list = NEGATIVE_SERVICE_CLEANING.get(hex_params.object_type)
-        if negative_services_list:
-            negative_services = await hex_api_getter.get_negative_service_by_territory_id(
-                hex_params.territory_id,
-                negative_services_list
-            )
-            if not negative_services.empty:
-                negative_services.to_crs(hexes_local_crs, inplace=True)
-                cleaned_hexes = await hex_cleaner.negative_clean(
-                    hexes,
-                    negative_services
-                )
-        cleaned_hexes = await asyncio.to_thread(
-            hex_cleaner.clean_by_min_object_val,
-            hexagons=cleaned_hexes,
-            object_name=hex_params.object_type,
-        )
-
-        estimated_hexes = await hex_estimator.weight_hexes(
-            cleaned_hexes,
-            hex_params.object_type
+        store = await hex_api_getter.get_hex_store_by_scenario(regional_base_scenario)
+        estimated_hexes = await self.estimate_hex_store(
+            store,
+            hex_params.territory_id,
+            [hex_params.object_type],
+            regional_base_scenario,
         )
+        weighted_sum = estimated_hexes[hex_params.object_type]
+        result = store.take(np.flatnonzero(weighted_sum.notna())).to_gdf()
+        result["weighted_sum"] = weighted_sum.dropna().to_numpy()
+        if not keep_cells:
+            result.drop(columns="h3_index", inplace=True)
 
-        return estimated_hexes
+        return result
 
     async def get_hex_clusters_for_object(
             self,
@@ -85,7 +136,8 @@ class PriocService:
         """
 
         estimated_hexes = await self.get_hexes_for_object(
-            hex_params
+            hex_params,
+            keep_cells=True,
         )
         clustered_hexes = await hex_estimator.cluster_hexes(
             estimated_hexes
@@ -94,8 +146,8 @@ class PriocService:
         return clustered_hexes
 
     #ToDO update to saving methods normally
-    @staticmethod
     async def get_territory_estimation(
+            self,
             territory: dict | None = None,
             territory_id: int | None = None,
     ) -> dict[str, float]:
@@ -109,109 +161,127 @@ class PriocService:
             dict: Dictionary with calculated territory values
         """
 
-        if isinstance(territory, dict):
-            territory_gdf = gpd.GeoDataFrame(geometry=[shape(territory)], crs=4326)
-        else:
+        if not isinstance(territory, dict):
             territory = territory.__dict__
-            territory_gdf = gpd.GeoDataFrame(geometry=[shape(territory)], crs=4326)
-        territory_local_crs = territory_gdf.estimate_utm_crs()
-        territory_gdf.to_crs(territory_local_crs, inplace=True)
+        territories = gpd.GeoDataFrame(geometry=[shape(territory)], crs=4326)
+        territories_estimation = await self.get_territories_estimation(territories, territory_id)
+        return territories_estimation[0]
+
+    @staticmethod
+    async def get_territories_estimation(
+            territories: gpd.GeoDataFrame,
+            territory_id: int,
+    ) -> list[dict[str, dict]]:
+        """
+        Generates evaluation with available objects for many territories of one region. Regional hexes are
+        loaded once and assigned to territories with one spatial join
+
+        Args:
+            territories (gpd.GeoDataFrame): Territories geometries
+            territory_id (int): Regional territory id
+        Returns:
+            list[dict[str, dict]]: Dictionaries with calculated territory values in territories order
+        """
+
+        territories = territories.to_crs(4326).reset_index(drop=True)
         base_scenario_id = await hex_api_getter.get_regional_base_scenario(territory_id)
-        hexagons = await hex_api_getter.get_hexes_with_indicators_by_territory(base_scenario_id)
-        hexagons.to_crs(territory_local_crs, inplace=True)
-        hexagons = hexagons.clip(territory_gdf.geometry)
-        territory_estimation = await territory_estimator.estimate_territory(
-            hexagons
+        store = await hex_api_getter.get_hex_store_by_scenario(base_scenario_id)
+        territories_union = territories.union_all()
+        candidates = store.positions_intersecting(territories_union)
+        hexes_positions, territories_positions = territories.sindex.query(
+            cells_to_polygons(store.cells[candidates]), predicate="intersects"
         )
+        territories_indicators = (
+            store.indicators.iloc[candidates[hexes_positions]]
+            .groupby(territories_positions)
+            .mean()
+            .reindex(range(len(territories)))
+        )
+        territories_estimation = [
+            {key: value for key, value in territory_estimation.items() if not math.isnan(value["estimation"])}
+            for territory_estimation in territory_estimator.estimate_territories(territories_indicators)
+        ]
 
-        for key in list(territory_estimation.keys()):
-            if math.isnan(territory_estimation[key]["estimation"]):
-                territory_estimation.pop(key)
-                continue
-            positive_services_ids = POSITIVE_SERVICE_CLEANING.get(key)
-            negative_services_ids = NEGATIVE_SERVICE_CLEANING.get(key)
-            if positive_services_ids:
-                positive_services = await hex_api_getter.get_positive_service_by_territory_id(
-                    territory,
-                )
-                if not positive_services.empty:
-                    positive_services.to_crs(territory_local_crs, inplace=True)
-            else:
-                positive_services = None
-            if negative_services_ids:
-                negative_services = await hex_api_getter.get_negative_service_by_territory_id(
-                    territory_id,
-                    negative_services_ids
-                )
-                if not negative_services.empty:
-                    negative_services.to_crs(territory_local_crs, inplace=True)
-            else:
-                negative_services = None
-
-            check_result = await hex_cleaner.clean_estimation_dict_by_territory(
-                territory_gdf,
-                positive_services,
-                negative_services
+        estimated_keys = {key for territory_estimation in territories_estimation for key in territory_estimation}
+        positive_keys = [key for key in estimated_keys if POSITIVE_SERVICE_CLEANING.get(key)]
+        negative_services_ids = sorted(
+            {i for key in estimated_keys for i in NEGATIVE_SERVICE_CLEANING.get(key) or []}
+        )
+        services_requests = [
+            hex_api_getter.get_negative_service_by_territory_id(territory_id, [i]) for i in negative_services_ids
+        ]
+        if positive_keys:
+            # positive check looks for default water objects within territory
+            services_requests.append(hex_api_getter.get_positive_service_by_territory_id(mapping(territories_union)))
+        services_layers = await asyncio.gather(*services_requests)
+        # any negative service in region excludes object from all territories
+        region_negative_ids = {
+            i for i, layer in zip(negative_services_ids, services_layers) if not layer.empty
+        }
+        territories_with_positive = set()
+        if positive_keys:
+            territories_services = hex_cleaner.find_services_in_territories(
+                territories.to_crs(territories.estimate_utm_crs()),
+                {"positive": services_layers[-1]},
             )
-            if check_result:
-                del territory_estimation[key]
+            territories_with_positive = {position for position, _ in territories_services}
 
-        return territory_estimation
+        for position, territory_estimation in enumerate(territories_estimation):
+            for key in list(territory_estimation.keys()):
+                if POSITIVE_SERVICE_CLEANING.get(key):
+                    if position not in territories_with_positive:
+                        del territory_estimation[key]
+                elif any(i in region_negative_ids for i in NEGATIVE_SERVICE_CLEANING.get(key) or []):
+                    del territory_estimation[key]
 
+        return territories_estimation
 
-    @staticmethod
     async def get_hexes_for_object_from_gdf(
+            self,
             hexes: gpd.GeoDataFrame,
             territory_id: int,
             object_type: str
-    ) -> gpd.GeoDataFrame:
+    ) -> pd.DataFrame:
         """
         Generate hexes with estimation for object use
 
         Args:
-            hexes (gpd.GeoDataFrame): Hexes query parameters
+            hexes (gpd.GeoDataFrame): H3 hexes layer with indicators
             territory_id (int): Region territory id
             object_type (str): Object type as str
         Returns:
-            gpd.GeoDataFrame: Layer with calculated hexes values
+            pd.DataFrame: Table with "hexagon_id" and calculated "weighted_sum" of remaining hexes
         """
 
-        hexes_local_crs = hexes.estimate_utm_crs()
-        hexes.to_crs(hexes_local_crs, inplace=True)
-        positive_services_list = POSITIVE_SERVICE_CLEANING.get(object_type)
-        cleaned_hexes = hexes.copy()
-        if positive_services_list:
-            positive_services = await hex_api_getter.get_positive_service_by_territory_id(
-                gpd.GeoDataFrame(geometry=[hexes.union_all()], crs=hexes_local_crs).to_crs(4326).to_geo_dict()["features"][0]["geometry"],
-            )
-            if not positive_services.empty:
-                positive_services.to_crs(hexes_local_crs, inplace=True)
-                cleaned_hexes = await hex_cleaner.positive_clean(
-                    cleaned_hexes,
-                    positive_services
-                )
-        negative_services_list = NEGATIVE_SERVICE_CLEANING.get(object_type)
-        if negative_services_list:
-            negative_services = await hex_api_getter.get_negative_service_by_territory_id(
-                territory_id,
-                negative_services_list
-            )
-            if not negative_services.empty:
-                negative_services.to_crs(hexes_local_crs, inplace=True)
-                cleaned_hexes = await hex_cleaner.negative_clean(
-                    hexes,
-                    negative_services
-                )
-        cleaned_hexes = await asyncio.to_thread(
-            hex_cleaner.clean_by_min_object_val,
-            hexagons=cleaned_hexes,
-            object_name=object_type,
-        )
+        estimated_hexes = await self.get_hexes_for_objects_from_gdf(hexes, territory_id, [object_type])
+        return estimated_hexes.rename(columns={object_type: "weighted_sum"}).dropna(subset="weighted_sum")
 
-        estimated_hexes = await hex_estimator.weight_hexes(
-            cleaned_hexes,
-            object_type
-        )
+    async def get_hexes_for_objects_from_gdf(
+            self,
+            hexes: gpd.GeoDataFrame,
+            territory_id: int,
+            object_types: list[str],
+            columns_names: dict[str, str] | None = None,
+    ) -> pd.DataFrame:
+        """
+        Generate hexes estimation for many objects in one pass over hexes layer
+
+        Args:
+            hexes (gpd.GeoDataFrame): H3 hexes layer with indicators
+            territory_id (int): Region territory id
+            object_types (list[str]): Object types as str
+            columns_names (dict[str, str]): Result columns names by object types. Default to None (object types)
+        Returns:
+            pd.DataFrame: Table aligned with hexes index with "hexagon_id" and column with estimation per object,
+            hexes cleaned for object are NaN
+        """
+
+        store = await asyncio.to_thread(HexStore.from_gdf, hexes, indicators_names)
+        estimated_hexes = await self.estimate_hex_store(store, territory_id, object_types)
+        estimated_hexes.index = hexes.index
+        estimated_hexes.insert(0, "hexagon_id", store.hexagon_ids)
+        if columns_names:
+            estimated_hexes.rename(columns=columns_names, inplace=True)
 
         return estimated_hexes
 
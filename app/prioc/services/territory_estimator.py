@@ -1,6 +1,12 @@
 import geopandas as gpd
+import numpy as np
+import pandas as pd
 
-from app.prioc.services.constants.constants import INDICATORS_WEIGHTS, OBJECT_INDICATORS_MIN_VAL
+from app.prioc.services.constants.constants import (
+    INDICATORS_WEIGHTS,
+    INDICATORS_WEIGHTS_MATRIX,
+    OBJECT_INDICATORS_MIN_VAL_MATRIX,
+)
 
 
 class TerritoryEstimator:
@@ -8,57 +14,80 @@ class TerritoryEstimator:
     Class for evaluating possible priority objects allocation
     """
 
-    @staticmethod
+    def __init__(self):
+        """
+        Initialisation function for TerritoryEstimator. Compiles objects weights and min values into aligned
+        matrices and interpreted indicators (ranks 1 and 2) positions once
+        """
+
+        self.objects_names = list(INDICATORS_WEIGHTS_MATRIX.index)
+        self.indicators_names = list(INDICATORS_WEIGHTS_MATRIX.columns)
+        self.weights = INDICATORS_WEIGHTS_MATRIX.to_numpy(dtype="float64")
+        self.min_values = OBJECT_INDICATORS_MIN_VAL_MATRIX.to_numpy(dtype="float64")
+        self.interpreted_indicators = [
+            [
+                self.indicators_names.index(indicator)
+                for indicator, rank in INDICATORS_WEIGHTS[object_name].items()
+                if rank < 3
+            ]
+            for object_name in self.objects_names
+        ]
+
     async def estimate_territory(
-            territory_hexagons: gpd.GeoDataFrame,
+            self,
+            territory_hexagons: gpd.GeoDataFrame | pd.DataFrame,
     ):
         """
         Function estimates possible priority objects allocation for territory
 
         Args:
-            territory_hexagons (GeoDataFrame): hexagons with indicators within provided territory
+            territory_hexagons (GeoDataFrame | DataFrame): hexagons indicators within provided territory
 
         Returns:
             dict: dict with estimated values and interpretation
         """
 
-        async def interpret_value(
-                actual: int,
-                target: int,
-                indicator_name: str
-        ) -> str:
-            if actual < target:
-                return f"Слабый показатель: {indicator_name.lower()}"
-            else:
-                return f"Хороший показатель: {indicator_name.lower()}"
-
-        indicators = territory_hexagons.drop(columns=['geometry']).mean().to_dict()
-
-        result_dict = {}
-
-        for key in INDICATORS_WEIGHTS.keys():
-            result_dict[key] = {}
-            interpretations = []
-            current_object_indicators_min_val = OBJECT_INDICATORS_MIN_VAL[key]
-            ranks = INDICATORS_WEIGHTS[key]
-            n = len(ranks)
-            total_score = 0
-            for indicator, rank in ranks.items():
-                if ranks[indicator] < 3:
-                    current_interpretation = await interpret_value(
-                        actual=indicators[indicator],
-                        target=current_object_indicators_min_val[indicator],
-                        indicator_name=indicator,
-                    )
-                    interpretations.append(current_interpretation)
-                denominator = sum([n - rank + 1 for rank in ranks.values()])
-                weight = (n - rank + 1) / denominator
-                score = (indicators[indicator] - current_object_indicators_min_val[indicator]) * weight
-                total_score += score
-            result_dict[key]["estimation"] = round(total_score, 2)
-            result_dict[key]["interpretation"] = interpretations
-
-        return result_dict
+        indicators = territory_hexagons.select_dtypes("number").astype("float64").mean()
+        return self.estimate_territories(indicators.to_frame().T)[0]
+
+    def estimate_territories(
+            self,
+            territories_indicators: pd.DataFrame,
+    ) -> list[dict]:
+        """
+        Function estimates possible priority objects allocation for many territories with one broadcast expression
+
+        Args:
+            territories_indicators (pd.DataFrame): mean indicators values, one row per territory
+
+        Returns:
+            list[dict]: dicts with estimated values and interpretation in territories order
+        """
+
+        indicators = (
+            territories_indicators.reindex(columns=self.indicators_names).to_numpy(dtype="float64", na_value=np.nan)
+        )
+        # territories x objects x indicators, not ranked indicators are excluded to skip their missing values
+        deviations = indicators[:, None, :] - self.min_values[None, :, :]
+        scores = np.where(self.weights != 0, deviations * self.weights, 0.0).sum(axis=2)
+        # missing values are interpreted as good ones
+        weak = deviations < 0
+
+        result = []
+        for territory_position in range(len(indicators)):
+            result_dict = {}
+            for object_position, object_name in enumerate(self.objects_names):
+                result_dict[object_name] = {
+                    "estimation": round(float(scores[territory_position, object_position]), 2),
+                    "interpretation": [
+                        f"{'Слабый' if weak[territory_position, object_position, i] else 'Хороший'} показатель: "
+                        f"{self.indicators_names[i].lower()}"
+                        for i in self.interpreted_indicators[object_position]
+                    ],
+                }
+            result.append(result_dict)
+
+        return result
 
 
 territory_estimator = TerritoryEstimator()
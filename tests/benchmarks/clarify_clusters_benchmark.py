@@ -0,0 +1,79 @@
+"""
+Benchmark for HexEstimator.clarify_clusters on synthetic H3 grids.
+
+Run from project root: python -m tests.benchmarks.clarify_clusters_benchmark
+"""
+
+import asyncio
+import time
+
+import geopandas as gpd
+import h3
+import numpy as np
+import pandas as pd
+from shapely.geometry import shape
+
+from app.prioc.services.hex_estimator import hex_estimator
+
+try:
+    import networkx as nx
+except ImportError:
+    nx = None
+
+
+def generate_clustered_hexes(rings: int) -> gpd.GeoDataFrame:
+    """
+    Function generates hexes around one point with clusters by parent cells
+    """
+
+    cells = list(h3.grid_disk(h3.latlng_to_cell(59.93, 30.31, 8), rings))
+    parents = [h3.cell_to_parent(cell, 6) for cell in cells]
+    hexes = gpd.GeoDataFrame(
+        {
+            "cluster": pd.factorize(pd.Series(parents))[0],
+            "weighted_sum": np.random.default_rng(0).random(len(cells)),
+            "X": 0.0,
+            "Y": 0.0,
+        },
+        geometry=[shape(h3.cells_to_geo([cell])) for cell in cells],
+        crs=4326,
+    )
+    return hexes
+
+
+def legacy_clarify_clusters(clustered_hexagons: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
+    """
+    Previous networkx implementation with pairwise touches checks
+    """
+
+    grouped = gpd.GeoDataFrame()
+    for cluster in list(clustered_hexagons.cluster.unique()):
+        tmp_gdf = clustered_hexagons[clustered_hexagons.cluster == cluster]
+        G = nx.Graph()
+        for i, poly in enumerate(tmp_gdf["geometry"]):
+            for j, poly2 in enumerate(tmp_gdf["geometry"]):
+                if i != j and poly.touches(poly2):
+                    G.add_edge(i, j)
+        components = list(nx.connected_components(G))
+        if components:
+            largest_component = max(components, key=len)
+            grouped = pd.concat([grouped, tmp_gdf.iloc[list(largest_component)]])
+    return grouped.dissolve(by=["cluster"], aggfunc="mean")
+
+
+def main():
+    for rings in (10, 20, 40):
+        hexes = generate_clustered_hexes(rings)
+        start = time.perf_counter()
+        result = asyncio.run(hex_estimator.clarify_clusters(hexes.copy()))
+        current = time.perf_counter() - start
+        line = f"{len(hexes)} hexes, {len(result)} clusters: clarify_clusters {current:.3f}s"
+        if nx is not None:
+            start = time.perf_counter()
+            legacy_clarify_clusters(hexes.copy())
+            line += f", legacy networkx {time.perf_counter() - start:.3f}s"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
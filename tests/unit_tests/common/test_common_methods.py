@@ -0,0 +1,299 @@
+import asyncio
+import gzip
+import json
+import os
+import time
+
+import geopandas as gpd
+import h3
+import numpy as np
+import pytest
+import shapely
+from shapely.geometry import box, shape
+
+from app.common.api_handler.api_handler import AsyncApiHandler
+from app.common.cache import TTLLRUCache
+from app.common.compute import ComputeExecutor
+from app.common.geojson import (
+    GeoJSONResponse,
+    gdf_to_geojson_bytes,
+    iter_geojson_chunks,
+)
+from app.common.hex_store import (
+    HexOutline,
+    HexStore,
+    cells_to_parents,
+    cells_to_polygons,
+    cells_within,
+    exteriors_to_cells,
+)
+from app.common.jobs import JobRunner
+from app.common.storage import LocalStorage
+
+
+def make_hex_store(ring_size: int = 3) -> tuple[HexStore, list[str]]:
+    cells = h3.grid_disk(h3.latlng_to_cell(59.93, 30.31, 8), ring_size)
+    hexes = gpd.GeoDataFrame(
+        {"hexagon_id": range(len(cells)), "value": np.arange(len(cells)) / 10},
+        geometry=[shape(h3.cells_to_geo([cell])) for cell in cells],
+        crs=4326,
+    ).to_crs(32636)
+    return HexStore.from_gdf(hexes, ["value"]), cells
+
+
+def test_ttl_lru_cache_eviction():
+    cache = TTLLRUCache(name="test", ttl=60, max_size=2, max_memory=10, sizeof=len)
+    cache.set("a", "1234")
+    cache.set("b", "1234")
+    cache.get("a")
+    cache.set("c", "1234")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1234"
+    cache.set("d", "123456")
+    assert len(cache) == 2
+    assert cache.memory == 10
+    assert cache.get("c") is None
+    cache.set("e", "12345678901")
+    assert cache.get("e") is None
+
+
+def test_ttl_lru_cache_expiration():
+    cache = TTLLRUCache(name="test", ttl=0.01, max_size=2)
+    cache.set(1, "value")
+    assert cache.get(1) == "value"
+    time.sleep(0.02)
+    assert cache.get(1) is None
+    cache.set(2, "value")
+    assert cache.invalidate(lambda key: key == 2) == 1
+
+
+def test_hex_store_from_gdf():
+    store, cells = make_hex_store()
+    assert store.resolution == 8
+    assert [h3.int_to_str(int(cell)) for cell in store.cells] == cells
+    assert store.indicators["value"].dtype == "float64"
+    polygons = cells_to_polygons(store.cells)
+    assert all(polygon.equals(shape(h3.cells_to_geo([cell]))) for polygon, cell in zip(polygons, cells))
+    gdf = store.take(np.array([2, 0])).to_gdf()
+    assert gdf["hexagon_id"].to_list() == [2, 0]
+    assert gdf["h3_index"].to_list() == [cells[2], cells[0]]
+    assert gdf["value"].to_list() == [0.2, 0.0]
+
+
+def test_hex_store_neighbours():
+    store, cells = make_hex_store()
+    center = store.lookup(np.array([h3.str_to_int(cells[0]), 1], dtype=np.uint64))
+    assert center.tolist() == [0, -1]
+    ring_mask = store.ring_mask(center[:1], 2)
+    assert ring_mask.sum() == len(h3.grid_disk(cells[0], 2))
+    left, right = store.neighbour_pairs()
+    assert all(h3.are_neighbor_cells(cells[i], cells[j]) for i, j in zip(left, right))
+    assert len(left) == sum(
+        h3.are_neighbor_cells(first, second) for first in cells for second in cells
+    )
+
+
+def test_hex_store_positions_intersecting():
+    store, cells = make_hex_store()
+    territory = box(30.30, 59.925, 30.32, 59.935)
+    expected = [i for i, cell in enumerate(cells) if shape(h3.cells_to_geo([cell])).intersects(territory)]
+    assert sorted(store.positions_intersecting(territory).tolist()) == expected
+
+
+def test_hex_outline_from_store():
+    store, cells = make_hex_store()
+    outline = HexOutline.from_store(store)
+    assert outline.geometry.equals(shape(h3.cells_to_geo(cells)))
+    assert outline.geojson["type"] == "Polygon"
+    simplified = HexOutline.from_store(store, simplify_tolerance=200)
+    assert shapely.get_num_coordinates(simplified.geometry) < shapely.get_num_coordinates(outline.geometry)
+
+
+def test_api_handler_drops_session_of_stopped_loop():
+    handler = AsyncApiHandler("http://test")
+    old_loop, loop = asyncio.new_event_loop(), asyncio.new_event_loop()
+    try:
+        old_session = old_loop.run_until_complete(handler.get_session())
+        old_connector = old_session.connector
+        session = loop.run_until_complete(handler.get_session())
+        assert session is not old_session
+        assert old_connector.closed
+        loop.run_until_complete(handler.close())
+    finally:
+        old_loop.close()
+        loop.close()
+        AsyncApiHandler.handlers.remove(handler)
+
+
+@pytest.mark.asyncio
+async def test_api_handler_coalesces_identical_gets(monkeypatch):
+    handler = AsyncApiHandler("http://test")
+    calls = []
+
+    async def fake_get(extra_url, params=None, headers=None):
+        calls.append((extra_url, params))
+        await asyncio.sleep(0.01)
+        return {"url": extra_url}
+
+    monkeypatch.setattr(handler, "_get", fake_get)
+    results = await asyncio.gather(
+        handler.get("/a", params={"x": 1, "y": 2}),
+        handler.get("/a", params={"y": 2, "x": 1}),
+        handler.get("/b"),
+    )
+    assert results == [{"url": "/a"}, {"url": "/a"}, {"url": "/b"}]
+    assert len(calls) == 2
+    assert handler.get_pool_stats()["coalesced_total"] == 1
+    await handler.get("/a", params={"x": 1, "y": 2})
+    assert len(calls) == 3
+    AsyncApiHandler.handlers.remove(handler)
+
+
+@pytest.mark.asyncio
+async def test_api_handler_coalesced_results_are_copies(monkeypatch):
+    handler = AsyncApiHandler("http://test")
+    calls = []
+
+    async def fake_get(extra_url, params=None, headers=None):
+        calls.append((extra_url, params))
+        await asyncio.sleep(0.01)
+        return {"ids": list(params["ids"])}
+
+    monkeypatch.setattr(handler, "_get", fake_get)
+    first, second = await asyncio.gather(
+        handler.get("/a", params={"ids": [1, 2]}),
+        handler.get("/a", params={"ids": [1, 2]}),
+    )
+    assert len(calls) == 1
+    first["ids"].append(3)
+    assert second == {"ids": [1, 2]}
+    AsyncApiHandler.handlers.remove(handler)
+
+
+def test_exteriors_to_cells():
+    cells = h3.grid_disk(h3.latlng_to_cell(59.93, 30.31, 8), 2) + h3.grid_disk(h3.latlng_to_cell(65.0, 179.99, 7), 1)
+    exteriors = [h3.cells_to_geo([cell])["coordinates"][0] for cell in cells]
+    assert exteriors_to_cells(exteriors[:19], 8).tolist() == [h3.str_to_int(cell) for cell in cells[:19]]
+    assert exteriors_to_cells(exteriors[19:], 7).tolist() == [h3.str_to_int(cell) for cell in cells[19:]]
+
+
+def test_gdf_to_geojson_bytes_matches_to_json():
+    store, _ = make_hex_store()
+    hexes = store.to_gdf(crs=32636)
+    hexes.loc[0, "value"] = np.nan
+    assert json.loads(gdf_to_geojson_bytes(hexes)) == json.loads(hexes.to_json())
+    assert json.loads(gdf_to_geojson_bytes(hexes, to_wgs84=True)) == json.loads(hexes.to_json(to_wgs84=True))
+    rounded = json.loads(gdf_to_geojson_bytes(hexes, to_wgs84=True, precision=5))
+    coordinates = np.array(rounded["features"][0]["geometry"]["coordinates"][0])
+    assert np.allclose(coordinates, coordinates.round(5), rtol=0, atol=1e-12)
+
+
+def test_geojson_response_compression(monkeypatch):
+    store, _ = make_hex_store()
+    hexes = store.to_gdf()
+    monkeypatch.setenv("GEOJSON_COMPRESS_MIN_BYTES", "1")
+
+    class FakeRequest:
+        headers = {"accept-encoding": "gzip"}
+
+    response = GeoJSONResponse(hexes, FakeRequest())
+    assert response.headers["content-encoding"] == "gzip"
+    assert json.loads(gzip.decompress(response.body)) == json.loads(hexes.to_json())
+    assert "content-encoding" not in GeoJSONResponse(hexes).headers
+
+
+def test_iter_geojson_chunks():
+    store, _ = make_hex_store()
+    hexes = store.to_gdf(crs=32636)
+    expected = json.loads(hexes.to_json(to_wgs84=True))
+    chunks = list(iter_geojson_chunks(hexes, to_wgs84=True, chunk_size=10))
+    assert len(chunks) == 2 + (len(hexes) + 9) // 10
+    assert json.loads(b"".join(chunks)) == expected
+    lines = b"".join(iter_geojson_chunks(hexes, to_wgs84=True, chunk_size=10, ndjson=True)).splitlines()
+    assert [json.loads(line) for line in lines] == expected["features"]
+
+
+@pytest.mark.asyncio
+async def test_compute_executor_runs_small_tasks_in_threads():
+    executor = ComputeExecutor()
+    executor.processes = 2
+    executor.min_process_size = 10
+    result = await executor.run(np.cumsum, np.arange(5), size=5)
+    assert result.tolist() == [0, 1, 3, 6, 10]
+    with pytest.raises(ValueError):
+        await executor.run_in_thread(int, "not a number")
+    stats = executor.get_stats()
+    assert not stats["pool_started"]
+    assert stats["tasks_total"] == 2
+    assert stats["failed_total"] == 1
+    assert stats["threads_in_flight"] == 0
+
+
+def test_hex_store_to_parents():
+    store, cells = make_hex_store(ring_size=6)
+    parents = store.to_parents(6)
+    expected_parents = [h3.cell_to_parent(cell, 6) for cell in cells]
+    assert cells_to_parents(store.cells, 6).tolist() == [h3.str_to_int(cell) for cell in expected_parents]
+    assert sorted(h3.int_to_str(int(cell)) for cell in parents.cells) == sorted(set(expected_parents))
+    expected_means = store.to_frame().assign(parent=expected_parents).groupby("parent")["value"].mean()
+    result_means = parents.to_frame().set_index("h3_index")["value"]
+    assert np.allclose(result_means.loc[expected_means.index], expected_means, atol=1e-6)
+    assert (parents.hexagon_ids == -1).all()
+    with pytest.raises(ValueError):
+        store.to_parents(9)
+
+
+def test_cells_within():
+    store, _ = make_hex_store(ring_size=6)
+    hexes = store.to_gdf()
+    water = gpd.GeoDataFrame(
+        geometry=[box(30.28, 59.91, 30.33, 59.94).union(box(30.33, 59.93, 30.35, 59.95))], crs=4326
+    )
+    expected = hexes.sjoin(water, predicate="within")["h3_index"].map(h3.str_to_int)
+    result = cells_within(water.geometry.values, 8)
+    assert sorted(expected) == result.tolist()
+    assert cells_within(np.array([], dtype=object), 8).size == 0
+
+
+def test_local_storage(tmp_path):
+    storage = LocalStorage(tmp_path)
+    assert storage.load_array("masks/1") is None
+    storage.save_array("masks/1", np.array([1, 2, 3], dtype=np.uint64))
+    storage.save_json("jobs/1", {"done": [1, 2]})
+    assert storage.load_array("masks/1").tolist() == [1, 2, 3]
+    assert storage.load_array("masks/1", max_age=60).tolist() == [1, 2, 3]
+    stale_time = time.time() - 120
+    os.utime(tmp_path / "masks" / "1.npy", (stale_time, stale_time))
+    assert storage.load_array("masks/1", max_age=60) is None
+    assert storage.load_json("jobs/1") == {"done": [1, 2]}
+    assert [path.name for path in (tmp_path / "masks").iterdir()] == ["1.npy"]
+    storage.delete("jobs/1")
+    assert storage.load_json("jobs/1", default={}) == {}
+
+
+@pytest.mark.asyncio
+async def test_job_runner_lock_between_workers(tmp_path):
+    storage = LocalStorage(tmp_path)
+    release = asyncio.Event()
+
+    async def handler(state):
+        await release.wait()
+
+    worker, other_worker = JobRunner(storage), JobRunner(storage)
+    for runner in (worker, other_worker):
+        runner.register("test", handler)
+    task = worker.start("test", "job_1", total=1, params={})
+    assert other_worker.get_status("job_1")["status"] == "running"
+    await other_worker.resume_all()
+    assert not other_worker.is_running("job_1")
+    with pytest.raises(RuntimeError):
+        other_worker.start("test", "job_1", total=1, params={})
+
+    await worker.stop()
+    assert task.cancelled()
+    assert other_worker.get_status("job_1")["status"] == "interrupted"
+    await other_worker.resume_all()
+    assert other_worker.is_running("job_1")
+    release.set()
+    await other_worker.tasks["job_1"]
+    assert worker.get_status("job_1")["status"] == "finished"
@@ -0,0 +1,362 @@
+import json
+
+import geopandas as gpd
+import h3
+import numpy as np
+import pytest
+from fastapi import HTTPException
+from shapely.geometry import Point, box, shape
+
+from app.common import http_exception, params_validator
+from app.common.jobs import job_runner
+from app.common.storage import local_storage
+from app.grid_generator.services.constants import profiles_criteria, profiles_names
+from app.grid_generator.services.generator_api_service import (
+    generator_api_service,
+    json_default,
+)
+from app.grid_generator.services.grid_generator import grid_generator
+from app.grid_generator.services.grid_generator_service import grid_generator_service
+from app.grid_generator.services.potential_estimator import potential_estimator
+from app.prioc.services.hex_api_getter import hex_api_getter
+
+
+@pytest.mark.asyncio
+async def test_estimate_potentials():
+    rng = np.random.default_rng(0)
+    hexes = gpd.GeoDataFrame(
+        {
+            criterion: rng.integers(0, 6, 50).astype(float)
+            for criterion in profiles_criteria
+        },
+        geometry=[Point(i, i) for i in range(50)],
+        crs=4326,
+        index=range(100, 150),
+    )
+    expected = [
+        await potential_estimator.estimate_potentials_as_dict(row.to_dict())
+        for _, row in hexes[profiles_criteria].iterrows()
+    ]
+    result = await potential_estimator.estimate_potentials(hexes)
+    assert result[profiles_names].to_dict("records") == expected
+
+
+@pytest.mark.asyncio
+async def test_generate_hexagonal_grid():
+    territory = gpd.GeoDataFrame(geometry=[box(30.2, 59.9, 30.4, 60.0)], crs=4326)
+    expected = h3.geo_to_cells(territory.union_all(), res=8)
+    result = await grid_generator.generate_hexagonal_grid(territory, size=8)
+    assert sorted(result["h3_index"]) == sorted(expected)
+    assert result["h3_index"].map(h3.str_to_int).is_monotonic_increasing
+    assert all(
+        geometry.equals(shape(h3.cells_to_geo([cell])))
+        for cell, geometry in zip(result["h3_index"], result.geometry)
+    )
+
+
+@pytest.mark.asyncio
+async def test_generate_grid_with_indicators_aggregates_finer_grid(monkeypatch):
+    cells = h3.grid_disk(h3.latlng_to_cell(59.93, 30.31, 8), 6)
+    rng = np.random.default_rng(0)
+    fine_grid = gpd.GeoDataFrame(
+        {
+            "h3_index": cells,
+            **{criterion: rng.integers(0, 6, len(cells)).astype(float) for criterion in profiles_criteria},
+        },
+        geometry=[shape(h3.cells_to_geo([cell])) for cell in cells],
+        crs=4326,
+    )
+
+    async def get_regions():
+        return [1]
+
+    expected = fine_grid.assign(parent=[h3.cell_to_parent(cell, 7) for cell in cells]).groupby("parent")[
+        profiles_criteria
+    ].mean()
+    # grid at requested resolution defines parents set: one covered parent is missing, one has no children
+    empty_parent = h3.grid_ring(expected.index[0], 10)[0]
+    coarse_cells = sorted(expected.index[1:]) + [empty_parent]
+    coarse_grid = gpd.GeoDataFrame(
+        {"h3_index": coarse_cells},
+        geometry=[shape(h3.cells_to_geo([cell])) for cell in coarse_cells],
+        crs=4326,
+    )
+
+    async def generate_grid(territory_id, pure=False, resolution=None):
+        return fine_grid.copy() if resolution == 8 else coarse_grid.copy()
+
+    async def calculate_grid_indicators(grid, territory_id):
+        assert len(grid) == len(fine_grid)
+        return grid
+
+    monkeypatch.setattr(params_validator, "extract_current_regions", get_regions)
+    monkeypatch.setattr(grid_generator_service, "generate_grid", generate_grid)
+    monkeypatch.setattr(grid_generator_service, "calculate_grid_indicators", calculate_grid_indicators)
+    grid_generator_service.indicators_cache.clear()
+    await grid_generator_service.generate_grid_with_indicators(1, resolution=8)
+    result = await grid_generator_service.generate_grid_with_indicators(1, resolution=7)
+
+    assert result["h3_index"].tolist() == coarse_cells
+    result = result.set_index("h3_index")
+    assert np.allclose(result.loc[coarse_cells[:-1], profiles_criteria], expected.loc[coarse_cells[:-1]])
+    assert result.loc[empty_parent, profiles_criteria].isna().all()
+    assert result[profiles_names].notna().all().all()
+
+    grid_generator_service.invalidate_indicators(1)
+    assert grid_generator_service.get_finer_indicators_store(1, 7) is None
+
+
+@pytest.mark.asyncio
+async def test_save_new_hexagons_incremental(monkeypatch):
+    old_cells = h3.grid_disk(h3.latlng_to_cell(59.93, 30.31, 8), 2)
+    new_cells = h3.grid_disk(h3.grid_disk(h3.latlng_to_cell(59.93, 30.31, 8), 1)[1], 2)
+    existing = {
+        "features": [
+            {"type": "Feature", "geometry": h3.cells_to_geo([cell]), "properties": {"hexagon_id": i}}
+            for i, cell in enumerate(old_cells)
+        ]
+    }
+    new_grid = gpd.GeoDataFrame(
+        {"h3_index": new_cells}, geometry=[shape(h3.cells_to_geo([cell])) for cell in new_cells], crs=4326
+    )
+    calls = {}
+
+    async def get_hexes_from_db(territory_id):
+        return existing
+
+    async def delete_hexes_by_ids(hexagons_ids):
+        assert "posted" in calls, "New hexes should be posted before removed ones are deleted"
+        calls["deleted"] = hexagons_ids
+
+    async def post_hexes_to_db(territory_id, json_data):
+        calls["posted"] = [feature["properties"]["h3_index"] for feature in json_data]
+
+    async def delete_old_hexes_from_db(territory_id):
+        raise AssertionError("Whole grid shouldn't be deleted in incremental mode")
+
+    async def get_regional_base_scenario(territory_id):
+        return 7
+
+    def invalidate_scenario(scenario_id):
+        calls["invalidated"] = (scenario_id, "deleted" in calls and "posted" in calls)
+
+    monkeypatch.setattr(generator_api_service, "get_hexes_from_db", get_hexes_from_db)
+    monkeypatch.setattr(generator_api_service, "delete_hexes_by_ids", delete_hexes_by_ids)
+    monkeypatch.setattr(generator_api_service, "post_hexes_to_db", post_hexes_to_db)
+    monkeypatch.setattr(generator_api_service, "delete_old_hexes_from_db", delete_old_hexes_from_db)
+    monkeypatch.setattr(hex_api_getter, "invalidate_scenario", invalidate_scenario)
+    monkeypatch.setattr(hex_api_getter, "get_regional_base_scenario", get_regional_base_scenario)
+    result = await grid_generator_service.save_new_hexagons(
+        1, json.loads(new_grid.to_json()), incremental=True
+    )
+
+    assert sorted(calls["deleted"]) == [i for i, cell in enumerate(old_cells) if cell not in new_cells]
+    assert sorted(calls["posted"]) == sorted(set(new_cells) - set(old_cells))
+    assert result["kept"] == len(set(old_cells) & set(new_cells))
+    assert calls["invalidated"] == (7, True)
+
+
+@pytest.mark.asyncio
+async def test_save_new_hexagons_incremental_rewrites_grid_if_delete_fails(monkeypatch):
+    old_cells = h3.grid_disk(h3.latlng_to_cell(59.93, 30.31, 8), 2)
+    new_cells = h3.grid_disk(h3.grid_disk(h3.latlng_to_cell(59.93, 30.31, 8), 1)[1], 2)
+    existing = {
+        "features": [
+            {"type": "Feature", "geometry": h3.cells_to_geo([cell]), "properties": {"hexagon_id": i}}
+            for i, cell in enumerate(old_cells)
+        ]
+    }
+    new_grid = gpd.GeoDataFrame(
+        {"h3_index": new_cells}, geometry=[shape(h3.cells_to_geo([cell])) for cell in new_cells], crs=4326
+    )
+    calls = []
+
+    async def get_hexes_from_db(territory_id):
+        return existing
+
+    async def delete_hexes_by_ids(hexagons_ids):
+        calls.append(("delete_by_ids", len(hexagons_ids)))
+        raise http_exception(405, "Error during extracting query", _input={}, _detail="Method Not Allowed")
+
+    async def post_hexes_to_db(territory_id, json_data):
+        calls.append(("post", len(json_data)))
+
+    async def delete_old_hexes_from_db(territory_id):
+        calls.append(("delete_all", territory_id))
+
+    async def invalidate_territory(territory_id):
+        calls.append(("invalidate", territory_id))
+
+    monkeypatch.setattr(generator_api_service, "get_hexes_from_db", get_hexes_from_db)
+    monkeypatch.setattr(generator_api_service, "delete_hexes_by_ids", delete_hexes_by_ids)
+    monkeypatch.setattr(generator_api_service, "post_hexes_to_db", post_hexes_to_db)
+    monkeypatch.setattr(generator_api_service, "delete_old_hexes_from_db", delete_old_hexes_from_db)
+    monkeypatch.setattr(hex_api_getter, "invalidate_territory", invalidate_territory)
+    result = await grid_generator_service.save_new_hexagons(
+        1, json.loads(new_grid.to_json()), incremental=True
+    )
+
+    added = len(set(new_cells) - set(old_cells))
+    deleted = len(set(old_cells) - set(new_cells))
+    assert calls == [
+        ("post", added),
+        ("delete_by_ids", deleted),
+        ("delete_all", 1),
+        ("post", len(new_cells)),
+        ("invalidate", 1),
+    ]
+    assert "kept" not in result
+
+
+@pytest.mark.asyncio
+async def test_generate_pure_grid_with_stored_water_cells(monkeypatch, tmp_path):
+    territory = box(30.2, 59.9, 30.4, 60.0)
+    water = gpd.GeoDataFrame(
+        geometry=[box(30.25, 59.92, 30.3, 59.95), box(30.3, 59.9, 30.31, 59.91).boundary], crs=4326
+    )
+    fetches = []
+
+    async def get_regions():
+        return [1]
+
+    async def get_territory_data(territory_id):
+        return {"geometry": territory.__geo_interface__}
+
+    async def get_cleaning_gdf(territory_id, objects_ids):
+        fetches.append(objects_ids)
+        return water
+
+    monkeypatch.setattr(params_validator, "extract_current_regions", get_regions)
+    monkeypatch.setattr(generator_api_service, "get_territory_data", get_territory_data)
+    monkeypatch.setattr(grid_generator_service, "get_cleaning_gdf", get_cleaning_gdf)
+    monkeypatch.setattr(local_storage, "root", tmp_path)
+    full_grid = await grid_generator_service.generate_grid(1, resolution=8)
+    expected = full_grid.drop(full_grid.sjoin(water, predicate="within").index)
+    for _ in range(2):
+        result = await grid_generator_service.generate_grid(1, pure=True, resolution=8)
+        assert sorted(result["h3_index"]) == sorted(expected["h3_index"])
+    assert len(fetches) == 1
+
+
+@pytest.mark.asyncio
+async def test_indicators_upload_job_resumes_from_checkpoint(monkeypatch, tmp_path):
+    monkeypatch.setattr(local_storage, "root", tmp_path)
+    monkeypatch.setattr(grid_generator_service, "upload_chunk_size", 4)
+    values = np.array([[1.0, np.nan], [2.0, 3.0], [np.nan, 4.0], [5.0, 6.0], [7.0, 8.0]])
+    local_storage.save_array("jobs/hexagons_indicators_1/hexagon_ids", np.arange(10, 15))
+    local_storage.save_array("jobs/hexagons_indicators_1/indicators_ids", np.array([101, 102]))
+    local_storage.save_array("jobs/hexagons_indicators_1/values", values)
+    uploaded = []
+
+    async def put_hexagon_data(data_list, scenario_id):
+        if len(uploaded) == 4 and not getattr(put_hexagon_data, "failed", False):
+            put_hexagon_data.failed = True
+            raise RuntimeError("upstream is unavailable")
+        uploaded.extend((item["hexagon_id"], item["indicator_id"], item["value"]) for item in data_list)
+
+    async def start_indicators_upload_job(job_id, territory_id):
+        raise AssertionError("Failed job should be resumed without indicators recalculation")
+
+    monkeypatch.setattr(generator_api_service, "put_hexagon_data", put_hexagon_data)
+    task = job_runner.start(
+        "hexagons_indicators", "hexagons_indicators_1", total=8, params={"territory_id": 1, "scenario_id": 1}
+    )
+    with pytest.raises(RuntimeError):
+        await task
+    status = job_runner.get_status("hexagons_indicators_1")
+    assert (status["status"], status["done"], status["error"]) == ("failed", 4, "upstream is unavailable")
+
+    monkeypatch.setattr(grid_generator_service, "start_indicators_upload_job", start_indicators_upload_job)
+    result = await grid_generator_service.bound_hexagons_indicators(1)
+    assert result["job"]["status"] == "finished"
+    assert result["job"]["progress"] == 1.0
+    assert uploaded == [
+        (10, 101, 1.0), (11, 101, 2.0), (11, 102, 3.0), (12, 102, 4.0),
+        (13, 101, 5.0), (13, 102, 6.0), (14, 101, 7.0), (14, 102, 8.0),
+    ]
+    assert local_storage.load_array("jobs/hexagons_indicators_1/values") is None
+    assert local_storage.load_json("jobs/hexagons_indicators_1/state")["status"] == "finished"
+
+
+def mock_indicators_put(monkeypatch, reject_bulk):
+    bulk_batches, items = [], []
+
+    async def put(extra_url, data, params=None, headers=None):
+        if isinstance(data, bytes):
+            batch = json.loads(data)
+            status = reject_bulk(batch)
+            if status:
+                raise http_exception(status, "Rejected", _input=extra_url, _detail=None)
+            bulk_batches.append([item["value"] for item in batch])
+        else:
+            items.append(data["value"])
+
+    monkeypatch.setattr(generator_api_service.urban_extractor, "put", put)
+    monkeypatch.setattr(generator_api_service, "bulk_upload_enabled", True)
+    monkeypatch.setattr(generator_api_service, "bulk_batch_size", 8)
+    monkeypatch.setattr(generator_api_service, "upload_stats", dict.fromkeys(generator_api_service.upload_stats, 0))
+    return bulk_batches, items
+
+
+def indicators_values(number):
+    return [
+        {"hexagon_id": np.int64(i), "indicator_id": 1, "value": np.float64(i), "value_type": "real"}
+        for i in range(number)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_put_hexagon_data_halves_batch_on_413(monkeypatch):
+    bulk_batches, items = mock_indicators_put(monkeypatch, lambda batch: 413 if len(batch) > 3 else None)
+    invalidated = []
+    monkeypatch.setattr(hex_api_getter, "invalidate_scenario", lambda scenario_id: invalidated.append(bulk_batches[:]))
+    summary = await generator_api_service.put_hexagon_data(indicators_values(10), 1)
+    assert invalidated == [bulk_batches]
+    assert bulk_batches == [[0, 1], [2, 3], [4, 5], [6, 7], [8, 9]]
+    assert items == []
+    assert summary["batches"] == 5
+    assert generator_api_service.upload_stats["batches"] == 5
+    assert generator_api_service.upload_stats["bulk_items"] == 10
+    assert generator_api_service.upload_stats["fallback_items"] == 0
+    assert generator_api_service.upload_stats["bytes"] == summary["bytes"] > 0
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("status", [404, 405, 501])
+async def test_put_hexagon_data_disables_unsupported_bulk(monkeypatch, status):
+    bulk_batches, items = mock_indicators_put(monkeypatch, lambda batch: status)
+    await generator_api_service.put_hexagon_data(indicators_values(10), 1)
+    assert not generator_api_service.bulk_upload_enabled
+    await generator_api_service.put_hexagon_data(indicators_values(3), 2)
+    assert bulk_batches == []
+    assert sorted(items) == sorted([*range(10), *range(3)])
+    assert generator_api_service.upload_stats["batches"] == 0
+    assert generator_api_service.upload_stats["fallback_items"] == 13
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("status", [400, 415, 422])
+async def test_put_hexagon_data_puts_rejected_batch_per_item(monkeypatch, status):
+    bulk_batches, items = mock_indicators_put(
+        monkeypatch, lambda batch: status if any(item["value"] == 9 for item in batch) else None
+    )
+    await generator_api_service.put_hexagon_data(indicators_values(12), 1)
+    assert generator_api_service.bulk_upload_enabled
+    assert bulk_batches == [list(range(8))]
+    assert sorted(items) == [8, 9, 10, 11]
+    assert generator_api_service.upload_stats["bulk_items"] == 8
+    assert generator_api_service.upload_stats["fallback_items"] == 4
+
+
+@pytest.mark.asyncio
+async def test_put_hexagon_data_raises_other_errors(monkeypatch):
+    bulk_batches, items = mock_indicators_put(monkeypatch, lambda batch: 500)
+    with pytest.raises(HTTPException):
+        await generator_api_service.put_hexagon_data(indicators_values(3), 1)
+    assert (bulk_batches, items) == ([], [])
+
+
+def test_json_default():
+    assert json.dumps([np.int64(1), np.float32(0.5), np.bool_(True)], default=json_default) == "[1, 0.5, true]"
+    with pytest.raises(TypeError):
+        json.dumps([object()], default=json_default)
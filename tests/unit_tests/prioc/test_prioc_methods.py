@@ -1,14 +1,30 @@
+import asyncio
+import math
 import statistics
 
 import geopandas as gpd
+import h3
+import numpy as np
+import pandas as pd
 import pytest
 from fastapi import HTTPException
-from shapely.geometry import shape
+from shapely.geometry import Point, shape
 
 from app.common import config, urban_api_handler
 from app.common.geometries import example_territory
+from app.common.hex_store import HexStore
 from app.prioc.dto import HexesDTO, TerritoryDTO
-from app.prioc.services.hex_api_getter import hex_api_getter
+from app.prioc.services.constants import (
+    INDICATORS_WEIGHTS,
+    NEGATIVE_SERVICE_CLEANING,
+    OBJECT_INDICATORS_MIN_VAL,
+    POSITIVE_SERVICE_CLEANING,
+)
+from app.prioc.services.hex_api_getter import (
+    hex_api_getter,
+    hexes_features_to_store,
+    indicators_names,
+)
 from app.prioc.services.hex_cleaner import hex_cleaner
 from app.prioc.services.hex_estimator import hex_estimator
 from app.prioc.services.prioc_service import prioc_service
@@ -16,16 +32,16 @@ from app.prioc.services.territory_estimator import territory_estimator
 
 
 @pytest.mark.asyncio
-async def test_get_hexes_with_indicators_by_territory():
-    hexes = await hex_api_getter.get_hexes_with_indicators_by_territory(1)
-    assert isinstance(hexes, gpd.GeoDataFrame)
+async def test_get_hex_store_by_scenario():
+    hexes = await hex_api_getter.get_hex_store_by_scenario(1)
+    assert isinstance(hexes, HexStore)
     assert len(hexes) == 2148
 
 
 @pytest.mark.asyncio
-async def test_exception_get_hexes_with_indicators_by_territory():
+async def test_exception_get_hex_store_by_scenario():
     with pytest.raises(HTTPException) as http_e:
-        await hex_api_getter.get_hexes_with_indicators_by_territory(-1)
+        await hex_api_getter.get_hex_store_by_scenario(-1)
         assert http_e.value.status_code == 501
 
 
@@ -55,77 +71,56 @@ async def test_get_negative_service_by_territory_id():
 
 @pytest.mark.asyncio
 async def test_negative_clean():
-    hexes = await hex_api_getter.get_hexes_with_indicators_by_territory(1)
+    hexes = await hex_api_getter.get_hex_store_by_scenario(1)
     negative_services = await hex_api_getter.get_negative_service_by_territory_id(
         territory_id=1, service_type_ids=[112, 143]
     )
-    print(len(negative_services), hexes.crs, negative_services.crs)
-    cleaned = await hex_cleaner.negative_clean(hexes, negative_services)
-    assert len(cleaned) < len(hexes)
+    keep_mask = hex_cleaner.negative_clean_cells(hexes, negative_services)
+    assert keep_mask.sum() < len(hexes)
 
 
 @pytest.mark.asyncio
 async def test_negative_empty_clean():
-    hexes = await hex_api_getter.get_hexes_with_indicators_by_territory(1)
+    hexes = await hex_api_getter.get_hex_store_by_scenario(1)
     negative_services = gpd.GeoDataFrame()
-    cleaned = await hex_cleaner.negative_clean(hexes, negative_services)
-    assert len(cleaned) == len(hexes)
+    keep_mask = hex_cleaner.negative_clean_cells(hexes, negative_services)
+    assert keep_mask.sum() == len(hexes)
 
 
 @pytest.mark.asyncio
 async def test_positive_empty_clean():
-    hexes = await hex_api_getter.get_hexes_with_indicators_by_territory(1)
+    hexes = await hex_api_getter.get_hex_store_by_scenario(1)
     positive_services = await hex_api_getter.get_positive_service_by_territory_id(
         territory_id=1, service_type_ids=[6]
     )
-    cleaned = await hex_cleaner.positive_clean(hexes, positive_services)
-    assert len(cleaned) == len(hexes)
+    keep_mask = hex_cleaner.positive_clean_cells(hexes, positive_services)
+    assert keep_mask.sum() == len(hexes)
 
 
 @pytest.mark.asyncio
 async def test_positive_clean():
-    hexes = await hex_api_getter.get_hexes_with_indicators_by_territory(1)
+    hexes = await hex_api_getter.get_hex_store_by_scenario(1)
     positive_services = await hex_api_getter.get_positive_service_by_territory_id(
         territory_id=1, service_type_ids=[112, 143]
     )
-    print(positive_services.columns)
-    cleaned = await hex_cleaner.positive_clean(hexes, positive_services)
-    assert len(cleaned) < len(hexes)
-
-
-@pytest.mark.asyncio
-async def test_clean_estimation_dict_by_territory():
-    territory = gpd.GeoDataFrame(geometry=[shape(example_territory)], crs=4326)
-    positive_services = territory.copy()
-    negative_services = territory.copy()
-    positive = await hex_cleaner.clean_estimation_dict_by_territory(
-        territory=territory,
-        positive_services=positive_services,
-        negative_services=None,
-    )
-    negative = await hex_cleaner.clean_estimation_dict_by_territory(
-        territory=territory,
-        positive_services=None,
-        negative_services=negative_services,
-    )
-    print(positive)
-    print(negative)
-    assert positive == True
-    assert negative == True
+    keep_mask = hex_cleaner.positive_clean_cells(hexes, positive_services)
+    assert keep_mask.sum() < len(hexes)
 
 
 @pytest.mark.asyncio
 async def test_weight_hexes():
-    hexes = await hex_api_getter.get_hexes_with_indicators_by_territory(1)
-    weighted_hexes = await hex_estimator.weight_hexes(hexes, "Тур база")
-    check_result = round(weighted_hexes["weighted_sum"].mean(), 2)
+    hexes = await hex_api_getter.get_hex_store_by_scenario(1)
+    weighted_hexes = hex_estimator.weight_hexes_by_objects(
+        hexes.indicators, ["Тур база"]
+    )
+    check_result = round(weighted_hexes["Тур база"].mean(), 2)
     assert check_result == 2.21
 
 
 @pytest.mark.asyncio
 async def test_clarify_clusters():
-    hexes = await hex_api_getter.get_hexes_with_indicators_by_territory(1)
-    hexes = hexes[:100].copy()
+    hexes = await hex_api_getter.get_hex_store_by_scenario(1)
+    hexes = hexes.take(np.arange(100)).to_gdf()
     hexes["cluster"] = [1 for i in range(50)] + [2 for i in range(50)]
     hexes["X"] = None
     hexes["Y"] = None
@@ -135,17 +130,19 @@ async def test_clarify_clusters():
 
 @pytest.mark.asyncio
 async def test_cluster_hexes():
-    hexes = await hex_api_getter.get_hexes_with_indicators_by_territory(1)
-    hexes = hexes[:300].copy()
-    wighted_hexes = await hex_estimator.weight_hexes(hexes, "Тур база")
-    clustered_hexes = await hex_estimator.cluster_hexes(wighted_hexes)
+    hexes = await hex_api_getter.get_hex_store_by_scenario(1)
+    hexes = hexes.take(np.arange(300)).to_gdf()
+    hexes["weighted_sum"] = hex_estimator.weight_hexes_by_objects(hexes, ["Тур база"])[
+        "Тур база"
+    ]
+    clustered_hexes = await hex_estimator.cluster_hexes(hexes)
     clustered_num = len(clustered_hexes[clustered_hexes["cluster"] != -1])
     assert clustered_num > 0
 
 
 @pytest.mark.asyncio
 async def test_estimate_territory():
-    hexes = await hex_api_getter.get_hexes_with_indicators_by_territory(1)
+    hexes = (await hex_api_getter.get_hex_store_by_scenario(1)).to_gdf()
     territory = gpd.GeoDataFrame(geometry=[shape(example_territory)], crs=4326)
     territory_hexagons = hexes.clip(territory.geometry)
     result = await territory_estimator.estimate_territory(territory_hexagons)
@@ -192,3 +189,373 @@ async def test_get():
         url = "/api/v1/territory/geojson?territory_id=-1"
         await urban_api_handler.get(url, params={})
         assert http_e.value.status_code == 422
+
+
+def test_weight_hexes_matches_ranks():
+    ranks = INDICATORS_WEIGHTS["Тур база"]
+    hexes = pd.DataFrame({indicator: [1.0, 2.0, 5.0] for indicator in ranks})
+    denominator = sum(len(ranks) - rank + 1 for rank in ranks.values())
+    expected = [
+        sum(value * (len(ranks) - rank + 1) / denominator for rank in ranks.values())
+        for value in [1.0, 2.0, 5.0]
+    ]
+    weighted_hexes = hex_estimator.weight_hexes_by_objects(hexes, ["Тур база"])
+    assert weighted_hexes["Тур база"].dtype == "float64"
+    assert weighted_hexes["Тур база"].to_list() == pytest.approx(expected)
+
+
+def test_negative_clean_cells():
+    center = h3.latlng_to_cell(59.93, 30.31, 8)
+    hexes = gpd.GeoDataFrame(
+        {"hexagon_id": range(61)},
+        geometry=[shape(h3.cells_to_geo([cell])) for cell in h3.grid_disk(center, 4)],
+        crs=4326,
+    )
+    store = HexStore.from_gdf(hexes, [])
+    service = gpd.GeoDataFrame(
+        geometry=[Point(*reversed(h3.cell_to_latlng(center)))], crs=4326
+    ).to_crs(32636)
+    for ring_size in range(3):
+        keep_mask = hex_cleaner.negative_clean_cells(
+            store, service, ring_size=ring_size
+        )
+        assert set(store.cells[~keep_mask]) == {
+            h3.str_to_int(cell) for cell in h3.grid_disk(center, ring_size)
+        }
+
+
+@pytest.mark.asyncio
+async def test_clarify_clusters_keeps_largest_group():
+    big_group = list(h3.grid_disk(h3.latlng_to_cell(59.93, 30.31, 8), 1))
+    small_group = list(h3.grid_disk(h3.latlng_to_cell(59.99, 30.51, 8), 1))[:2]
+    other_cluster = list(h3.grid_disk(h3.latlng_to_cell(59.80, 30.10, 8), 1))
+    cells = big_group + small_group + other_cluster
+    hexes = gpd.GeoDataFrame(
+        {
+            "cluster": [1] * (len(big_group) + len(small_group))
+            + [2] * len(other_cluster),
+            "weighted_sum": 1.0,
+            "X": 0.0,
+            "Y": 0.0,
+        },
+        geometry=[shape(h3.cells_to_geo([cell])) for cell in cells],
+        crs=4326,
+    )
+    clusters = await hex_estimator.clarify_clusters(hexes)
+    assert sorted(clusters["cluster"].to_list()) == [1, 2]
+    big_geometry = clusters[clusters["cluster"] == 1].geometry.iloc[0]
+    assert big_geometry.equals(shape(h3.cells_to_geo(big_group)))
+    hexes["h3_index"] = cells
+    cells_clusters = await hex_estimator.clarify_clusters(hexes)
+    assert list(cells_clusters.columns) == list(clusters.columns)
+    assert cells_clusters.geometry.geom_equals(clusters.geometry).all()
+
+
+def test_min_object_val_mask():
+    min_values = OBJECT_INDICATORS_MIN_VAL["Тур база"]
+    passing = {indicator: value for indicator, value in min_values.items()}
+    failing = {indicator: value - 1 for indicator, value in min_values.items()}
+    missing = {indicator: None for indicator in min_values}
+    hexes = pd.DataFrame([passing, failing, missing], dtype="float64")
+    keep_mask = hex_cleaner.min_object_val_mask(hexes, "Тур база")
+    assert keep_mask.tolist() == [True, False, True]
+
+
+@pytest.mark.asyncio
+async def test_negative_services_fetched_concurrently_and_cached(monkeypatch):
+    requests = []
+    in_flight = {"current": 0, "max": 0}
+
+    async def fake_get(extra_url, params):
+        requests.append(params["service_type_id"])
+        in_flight["current"] += 1
+        in_flight["max"] = max(in_flight["max"], in_flight["current"])
+        await asyncio.sleep(0.01)
+        in_flight["current"] -= 1
+        return {
+            "type": "FeatureCollection",
+            "features": [
+                {
+                    "type": "Feature",
+                    "geometry": {"type": "Point", "coordinates": [30.0, 60.0]},
+                    "properties": {"service_type_id": params["service_type_id"]},
+                }
+            ],
+        }
+
+    monkeypatch.setattr(hex_api_getter.extractor, "get", fake_get)
+    monkeypatch.setattr(hex_api_getter, "services_semaphore", asyncio.Semaphore(2))
+    hex_api_getter.services_cache.clear()
+    services = await hex_api_getter.get_negative_service_by_territory_id(-10, [1, 2, 3])
+    assert in_flight["max"] == 2
+    assert services["service_type_id"].to_list() == [1, 2, 3]
+    assert services.crs == 4326
+    services = await hex_api_getter.get_negative_service_by_territory_id(-10, [3, 4])
+    assert services["service_type_id"].to_list() == [3, 4]
+    assert sorted(requests) == [1, 2, 3, 4]
+    hex_api_getter.services_cache.clear()
+
+
+def test_find_services_in_territories():
+    territories = gpd.GeoDataFrame(
+        geometry=[Point(30.31, 59.93).buffer(0.01), Point(30.5, 59.8).buffer(0.01)],
+        crs=4326,
+    ).to_crs(32636)
+    inside = gpd.GeoDataFrame(geometry=[Point(30.311, 59.931)], crs=4326)
+    outside = gpd.GeoDataFrame(geometry=[Point(30.5, 59.8)], crs=4326)
+    found = hex_cleaner.find_services_in_territories(
+        territories,
+        {
+            ("negative", 1): inside,
+            ("negative", 2): outside,
+            ("positive", 3): gpd.GeoDataFrame(),
+        },
+    )
+    assert found == {(0, ("negative", 1)), (1, ("negative", 2))}
+    territory = gpd.GeoDataFrame(geometry=[shape(example_territory)], crs=4326)
+    found = hex_cleaner.find_services_in_territories(
+        territory.to_crs(territory.estimate_utm_crs()),
+        {"positive": territory.copy(), "negative": territory.copy()},
+    )
+    assert found == {(0, "positive"), (0, "negative")}
+
+
+@pytest.mark.asyncio
+async def test_get_territories_estimation(monkeypatch):
+    center = h3.latlng_to_cell(59.93, 30.31, 8)
+    cells = h3.grid_disk(center, 6)
+    hexes = gpd.GeoDataFrame(
+        {
+            "hexagon_id": range(len(cells)),
+            **{
+                indicator: [3 + i % 3 for i in range(len(cells))]
+                for indicator in INDICATORS_WEIGHTS["Тур база"]
+            },
+        },
+        geometry=[shape(h3.cells_to_geo([cell])) for cell in cells],
+        crs=4326,
+    )
+    store = HexStore.from_gdf(hexes, list(INDICATORS_WEIGHTS["Тур база"]))
+
+    async def get_regional_base_scenario(territory_id):
+        return 1
+
+    async def get_hex_store_by_scenario(scenario_id):
+        return store
+
+    async def get_negative_service_by_territory_id(territory_id, service_type_ids):
+        if service_type_ids == [112]:
+            return gpd.GeoDataFrame(geometry=[Point(10, 10)], crs=4326)
+        return gpd.GeoDataFrame()
+
+    async def get_positive_service_by_territory_id(
+        territory_geometry, physical_object_ids=None
+    ):
+        assert physical_object_ids is None
+        return gpd.GeoDataFrame(geometry=[Point(30.28, 59.92).buffer(0.001)], crs=4326)
+
+    monkeypatch.setattr(
+        hex_api_getter, "get_regional_base_scenario", get_regional_base_scenario
+    )
+    monkeypatch.setattr(
+        hex_api_getter, "get_hex_store_by_scenario", get_hex_store_by_scenario
+    )
+    monkeypatch.setattr(
+        hex_api_getter,
+        "get_negative_service_by_territory_id",
+        get_negative_service_by_territory_id,
+    )
+    monkeypatch.setattr(
+        hex_api_getter,
+        "get_positive_service_by_territory_id",
+        get_positive_service_by_territory_id,
+    )
+    monkeypatch.setitem(POSITIVE_SERVICE_CLEANING, "Пром объект", [3])
+    territories = gpd.GeoDataFrame(
+        geometry=[
+            Point(30.31, 59.93).buffer(0.01),
+            Point(30.28, 59.92).buffer(0.005),
+            Point(10, 10).buffer(0.01),
+        ],
+        crs=4326,
+    )
+    result = await prioc_service.get_territories_estimation(territories, 1)
+    assert len(result) == 3
+    # negative service anywhere in region excludes object, positive objects are checked within territory
+    assert "Тур база" not in result[0] and "Тур база" not in result[1]
+    assert "Бизнес-кластер" in result[0] and "Бизнес-кластер" in result[1]
+    assert "Пром объект" not in result[0] and "Пром объект" in result[1]
+    assert result[2] == {}
+    for territory, estimation in zip(territories.geometry, result):
+        expected = await territory_estimator.estimate_territory(
+            hexes[hexes.intersects(territory)]
+        )
+        for key, value in estimation.items():
+            assert value == expected[key]
+
+
+def estimate_territory_by_ranks(indicators: dict[str, float]) -> dict[str, dict]:
+    result = {}
+    for key, ranks in INDICATORS_WEIGHTS.items():
+        min_values = OBJECT_INDICATORS_MIN_VAL[key]
+        denominator = sum(len(ranks) - rank + 1 for rank in ranks.values())
+        total_score = sum(
+            (indicators[indicator] - min_values[indicator])
+            * (len(ranks) - rank + 1)
+            / denominator
+            for indicator, rank in ranks.items()
+        )
+        result[key] = {
+            "estimation": round(total_score, 2),
+            "interpretation": [
+                f"{'Слабый' if indicators[indicator] < min_values[indicator] else 'Хороший'} показатель: "
+                f"{indicator.lower()}"
+                for indicator, rank in ranks.items()
+                if rank < 3
+            ],
+        }
+    return result
+
+
+def test_estimate_territories_matches_ranks_estimation():
+    indicators = list(INDICATORS_WEIGHTS["Тур база"])
+    territories_indicators = pd.DataFrame(
+        [
+            [1.0, 2.0, 3.0, 4.0, 5.0],
+            [5.0, 4.0, 3.0, 2.0, 1.0],
+            [3.0, None, 3.0, 3.0, 3.0],
+        ],
+        columns=indicators,
+    )
+    result = territory_estimator.estimate_territories(territories_indicators)
+    for position in range(2):
+        expected = estimate_territory_by_ranks(
+            territories_indicators.iloc[position].to_dict()
+        )
+        assert result[position] == expected
+    assert result[0]["Тур база"] == {
+        "estimation": 0.2,
+        "interpretation": [
+            "Слабый показатель: транспортное обеспечение",
+            "Слабый показатель: экологическая ситуация",
+        ],
+    }
+    assert all(math.isnan(value["estimation"]) for value in result[2].values())
+
+
+@pytest.mark.asyncio
+async def test_get_hexes_for_objects_from_gdf(monkeypatch):
+    center = h3.latlng_to_cell(59.93, 30.31, 8)
+    cells = h3.grid_disk(center, 4)
+    hexes = gpd.GeoDataFrame(
+        {
+            "hexagon_id": range(100, 100 + len(cells)),
+            **{
+                indicator: [1 + (i + shift) % 5 for i in range(len(cells))]
+                for shift, indicator in enumerate(INDICATORS_WEIGHTS["Тур база"])
+            },
+        },
+        geometry=[shape(h3.cells_to_geo([cell])) for cell in cells],
+        crs=4326,
+    )
+    service = gpd.GeoDataFrame(
+        geometry=[Point(*reversed(h3.cell_to_latlng(center)))], crs=4326
+    )
+    requested_ids = []
+
+    async def get_negative_service_by_territory_id(territory_id, service_type_ids):
+        requested_ids.extend(service_type_ids)
+        return service.copy()
+
+    monkeypatch.setattr(
+        hex_api_getter,
+        "get_negative_service_by_territory_id",
+        get_negative_service_by_territory_id,
+    )
+    monkeypatch.setattr(prioc_service, "negative_clean_ring_size", 2)
+    objects = list(INDICATORS_WEIGHTS)
+    result = await prioc_service.get_hexes_for_objects_from_gdf(
+        hexes, 1, objects, columns_names={"Тур база": "Туристическая база"}
+    )
+    assert sorted(requested_ids) == sorted(
+        {i for key in objects for i in NEGATIVE_SERVICE_CLEANING[key]}
+    )
+    assert list(result.columns) == ["hexagon_id"] + objects[:-1] + [
+        "Туристическая база"
+    ]
+    assert result["hexagon_id"].to_list() == hexes["hexagon_id"].to_list()
+    excluded = pd.Series(
+        [cell in h3.grid_disk(center, 2) for cell in cells], index=hexes.index
+    )
+    for object_type, column in zip(objects, result.columns[1:]):
+        ranks = INDICATORS_WEIGHTS[object_type]
+        weights_sum = sum(len(ranks) - rank + 1 for rank in ranks.values())
+        expected = sum(
+            hexes[indicator] * (len(ranks) - rank + 1) / weights_sum
+            for indicator, rank in ranks.items()
+        )
+        keep = pd.Series(True, index=hexes.index)
+        for indicator, min_value in OBJECT_INDICATORS_MIN_VAL[object_type].items():
+            keep &= hexes[indicator] >= min_value
+        if NEGATIVE_SERVICE_CLEANING[object_type]:
+            keep &= ~excluded
+        assert result[column].dropna().to_dict() == pytest.approx(
+            expected[keep].to_dict()
+        )
+
+
+def test_hexes_features_to_store():
+    cells = h3.grid_disk(h3.latlng_to_cell(59.93, 30.31, 8), 1)
+    features = [
+        {
+            "type": "Feature",
+            "geometry": h3.cells_to_geo([cell]),
+            "properties": {
+                "hexagon_id": i,
+                "indicators": [
+                    {"name_full": name, "value": i + 0.5} for name in indicators_names
+                ],
+            },
+        }
+        for i, cell in enumerate(cells)
+    ]
+    features[1]["properties"]["indicators"][0]["value"] = None
+    features[2]["geometry"] = None
+    store = hexes_features_to_store(features, indicators_names)
+    assert store.hexagon_ids.tolist() == [0, 3, 4, 5, 6]
+    assert [h3.int_to_str(int(cell)) for cell in store.cells] == [
+        cells[i] for i in [0, 3, 4, 5, 6]
+    ]
+    assert store.indicators[indicators_names[0]].to_list() == [0.5, 3.5, 4.5, 5.5, 6.5]
+    for feature, cell in zip(features, cells):
+        feature["properties"]["h3_index"] = cell
+    assert (
+        hexes_features_to_store(features, indicators_names).cells == store.cells
+    ).all()
+
+
+@pytest.mark.asyncio
+async def test_hex_store_fetched_before_invalidation_is_not_cached(monkeypatch):
+    cells = h3.grid_disk(h3.latlng_to_cell(59.93, 30.31, 8), 1)
+    features = [
+        {
+            "type": "Feature",
+            "geometry": h3.cells_to_geo([cell]),
+            "properties": {
+                "hexagon_id": i,
+                "indicators": [
+                    {"name_full": name, "value": 1.0} for name in indicators_names
+                ],
+            },
+        }
+        for i, cell in enumerate(cells)
+    ]
+
+    async def get(extra_url, params=None, headers=None):
+        hex_api_getter.invalidate_scenario(-1)
+        return {"type": "FeatureCollection", "features": features}
+
+    monkeypatch.setattr(hex_api_getter.extractor, "get", get)
+    store = await hex_api_getter.get_hex_store_by_scenario(-1)
+    assert len(store) == len(cells)
+    assert hex_api_getter.hexes_cache.get(-1) is None